@@ -1,223 +1,289 @@
-﻿import tkinter as tk
+﻿import time
+# Az indulási idő mérésének kezdőpontja (--measure-startup), ezért minden más import előtt
+STARTUP_T0 = time.perf_counter()
+import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import json
 import os
-import sqlite3
-from PIL import Image, ImageTk
-import google.generativeai as genai
+import sys
+import json
 import threading
-import csv
-import time
+import hashlib
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-
-# --- SettingsManager osztály ---
-class SettingsManager:
+from ddimagedb_core import (
+    SettingsManager, DatabaseManager, DatabaseSession, FolderScanner, FolderWatcher, KeywordJobRunner,
+    FileExporter, FileImporter, check_ai_settings, group_near_duplicates, hamming_distance,
+    diagnostics, configure_diagnostics, shared_database, QueryCache
+)
+
+# --- ThumbnailCache osztály ---
+class ThumbnailCache:
     """
-    Kezeli a beállítások mentését és betöltését JSON fájlból.
+    Előnézeti képek gyorsítótára két szinten:
+    - lemezen: a kulcs az útvonal + mtime + fájlméret, így a módosított kép új bélyegképet kap;
+      a könyvtár teljes mérete korlátos, a legrégebben használt bélyegképek törlődnek;
+    - memóriában: a legutóbb megjelenített PhotoImage-ek korlátos LRU listája.
+    A PhotoImage-ek csak a Tk szálon jönnek létre; a háttérszálak (előtöltés) csak a lemezre dolgoznak.
     """
-    def __init__(self, filename='config.json'):
-        self.filename = filename
-        self.default_settings = {
-            "folders": "",
-            "google_api_key": "",
-            # Új alapértelmezett beállítás a prompt számára
-            "ai_prompt": "Adjon meg egy 10 szóból álló kulcsszó listát, amely leírja a képen látható eseményt "
-                         "vagy cselekvést. A választ vesszővel elválasztott listaként adja meg, pl.: 'kulcsszó1, kulcsszó2, ...'",
-            "column_widths": {},
-            "filter_settings": {
-                "file_path_query": "",
-                "ai_keywords_query": "",
-                "used_date_from_query": "",
-                "used_date_to_query": "",
-                "date_filter_type": "Nincs",
-                "logical_operator": "ÉS",
-                "used_filter": "Mind",
-                "top_limit": "10"
-            }
-        }
+    def __init__(self, cache_dir='thumbnails', max_disk_bytes=200 * 1024 * 1024, max_memory_items=200, thumb_size=(250, 250)):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_items = max_memory_items
+        self.thumb_size = thumb_size
+        self._photos = OrderedDict()
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        # Előtöltés alatt álló képek: útvonal -> Future (RLock: a kész vagy törölt Future visszahívása azonnal, a zár alatt fut)
+        self._prefetch_futures = {}
+        self._prefetch_lock = threading.RLock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def cache_key(self, image_path):
+        st = os.stat(image_path)
+        key_source = f"{os.path.abspath(image_path)}|{st.st_mtime_ns}|{st.st_size}|{self.thumb_size}"
+        return hashlib.sha1(key_source.encode("utf-8")).hexdigest()
+
+    def get_photo(self, image_path):
+        """
+        PhotoImage a megadott képhez (csak a Tk szálról hívható). Hibás vagy hiányzó kép esetén kivételt dob.
+        """
+        key = self.cache_key(image_path)
+        photo = self.get_cached_photo(key)
+        if photo is not None:
+            return photo
+        return self.put_photo(key, self.load_thumbnail(image_path, key))
 
-    def load_settings(self):
+    def get_cached_photo(self, key):
+        """
+        A memóriában lévő PhotoImage, vagy None; sosem nyúl a lemezhez.
         """
-        Beolvassa a beállításokat a fájlól.
+        photo = self._photos.get(key)
+        if photo is not None:
+            self._photos.move_to_end(key)
+        return photo
+
+    def put_photo(self, key, thumbnail):
+        from PIL import ImageTk
+        photo = ImageTk.PhotoImage(thumbnail)
+        self._photos[key] = photo
+        self._photos.move_to_end(key)
+        while len(self._photos) > self.max_memory_items:
+            self._photos.popitem(last=False)
+        return photo
+
+    def has_photo(self, key):
+        return key in self._photos
+
+    def load_thumbnail(self, image_path, key=None):
         """
-        settings = {}
-        if os.path.exists(self.filename):
+        A bélyegkép PIL képként: a lemezes gyorsítótárból, vagy ha ott nincs, az eredeti képből
+        előállítva és eltárolva. Bármely szálról hívható.
+        """
+        from PIL import Image
+        key = key or self.cache_key(image_path)
+        for extension in (".jpg", ".png"):
+            cached_path = os.path.join(self.cache_dir, key + extension)
             try:
-                with open(self.filename, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError) as e:
-                print(f"Hiba a beállítások betöltésekor: {e}. Alapértelmezett értékek használata.")
-        
-        # Gondoskodik róla, hogy az összes kulcs létezzen
-        for key, value in self.default_settings.items():
-            if key not in settings:
-                settings[key] = value
-                
-        # Gondoskodik róla, hogy az alkulcsok létezzenek
-        if "filter_settings" not in settings:
-            settings["filter_settings"] = self.default_settings["filter_settings"]
-        else:
-            for key, value in self.default_settings["filter_settings"].items():
-                if key not in settings["filter_settings"]:
-                    settings["filter_settings"][key] = value
-                        
-        return settings
+                thumbnail = Image.open(cached_path)
+                thumbnail.load()
+                # Az mtime a "legutóbb használt" időbélyeg a kiürítéshez
+                os.utime(cached_path)
+                return thumbnail
+            except (FileNotFoundError, OSError):
+                continue
+
+        thumbnail = self.create_thumbnail(image_path)
+        self.store_thumbnail(key, thumbnail)
+        return thumbnail
+
+    @diagnostics.timed("thumbnail.decode")
+    def create_thumbnail(self, image_path):
+        from PIL import Image
+        with Image.open(image_path) as image:
+            if image.format == "JPEG":
+                # Csökkentett felbontású JPEG dekódolás (1/2, 1/4, 1/8 lépték): a teljes képet nem bontjuk ki.
+                # A kért méret a bélyegkép kétszerese, hogy a LANCZOS kicsinyítésnek legyen elég részlete.
+                image.draft("RGB", (self.thumb_size[0] * 2, self.thumb_size[1] * 2))
+            image.thumbnail(self.thumb_size, Image.Resampling.LANCZOS)
+            if image.mode not in ("RGB", "RGBA", "L"):
+                image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+            else:
+                image = image.copy()
+        return image
+
+    def store_thumbnail(self, key, thumbnail):
+        # Átlátszó képek PNG-be, a többi kisebb JPEG-be kerül
+        extension = ".png" if thumbnail.mode == "RGBA" else ".jpg"
+        final_path = os.path.join(self.cache_dir, key + extension)
+        temp_path = f"{final_path}.{threading.get_ident()}.tmp"
+        try:
+            if extension == ".png":
+                thumbnail.save(temp_path, "PNG")
+            else:
+                thumbnail.save(temp_path, "JPEG", quality=85)
+            # Atomikus csere: egy másik szál sosem lát félig kiírt fájlt
+            os.replace(temp_path, final_path)
+            written = os.path.getsize(final_path)
+        except OSError as e:
+            print(f"Hiba a bélyegkép mentésekor: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
 
-    def save_settings(self, settings):
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self.disk_usage()
+            else:
+                self._disk_bytes += written
+            if self._disk_bytes > self.max_disk_bytes:
+                self.evict()
+
+    def disk_usage(self):
+        total = 0
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+        return total
+
+    def evict(self):
         """
-        Elmenti a beállításokat a fájlba.
+        A legrégebben használt bélyegképeket törli, amíg a gyorsítótár a korlát 80%-a alá nem kerül.
         """
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.8
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._disk_bytes = total
+
+    def prefetch(self, image_paths, ready_callback=None):
+        """
+        A megadott képek bélyegképeit a háttérben előállítja. A ready_callback(image_path, key, thumbnail)
+        a háttérszálon hívódik; a PhotoImage létrehozását a hívónak kell a Tk szálra ütemeznie.
+        Csak a legutóbbi kérés számít: a korábbi kérések még el nem kezdett, most már nem kért képei
+        kimaradnak, így gyors lépkedésnél nem gyűlik fel sor a ténylegesen nézett képek előtt. A memóriában
+        már meglévő, illetve épp előtöltés alatt álló képeket nem kéri újra.
+        """
+        wanted = set(image_paths)
+        with self._prefetch_lock:
+            for image_path, future in list(self._prefetch_futures.items()):
+                if image_path not in wanted:
+                    # A még el nem kezdett feladat törlődik (a listából a _prefetch_done veszi ki)
+                    future.cancel()
+            for image_path in image_paths:
+                if image_path in self._prefetch_futures:
+                    continue
+                try:
+                    if self.has_photo(self.cache_key(image_path)):
+                        continue
+                except OSError:
+                    continue
+                future = self._executor.submit(self._prefetch_one, image_path, ready_callback)
+                self._prefetch_futures[image_path] = future
+                future.add_done_callback(lambda done, path=image_path: self._prefetch_done(path, done))
+
+    def _prefetch_done(self, image_path, future):
+        with self._prefetch_lock:
+            if self._prefetch_futures.get(image_path) is future:
+                del self._prefetch_futures[image_path]
+
+    def _prefetch_one(self, image_path, ready_callback):
         try:
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, indent=4)
-            return True
-        except Exception as e:
-            messagebox.showerror("Hiba", f"Nem sikerült a beállításokat elmenteni: {e}")
-            return False
+            key = self.cache_key(image_path)
+            if self.has_photo(key):
+                return
+            thumbnail = self.load_thumbnail(image_path, key)
+        except Exception:
+            # Az előtöltés csak gyorsítás; a hibát a tényleges megjelenítés jelzi
+            return
+        if ready_callback:
+            ready_callback(image_path, key, thumbnail)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
 # ---
 
-# --- DatabaseManager osztály ---
-class DatabaseManager:
+# --- PreviewLoader osztály ---
+class PreviewLoader:
     """
-    Kezeli a SQLite adatbázissal való interakciót.
+    Az előnézeti képeket egy háttérszálon állítja elő, hogy a dekódolás ne akassza meg a Tk eseménykezelőt.
+    Mindig csak a legutolsó kérés számít: gyors lépkedésnél a közben elavult kéréseket
+    el sem kezdi, a már elkészült, de elavult eredményt pedig eldobja.
     """
-    def __init__(self, db_name='app_database.db'):
-        self.db_name = db_name
-        self.conn = None
-        self.cursor = None
-        self.connect()
-        self.create_table()
-
-    def connect(self):
-        try:
-            self.conn = sqlite3.connect(self.db_name)
-            self.cursor = self.conn.cursor()
-        except sqlite3.Error as e:
-            messagebox.showerror("Adatbázis hiba", f"Nem sikerült kapcsolódni az adatbázishoz: {e}")
-
-    def create_table(self):
-        if self.cursor:
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS files (
-                    file_path TEXT PRIMARY KEY NOT NULL,
-                    ai_keywords TEXT,
-                    used_date TEXT,
-                    used INTEGER DEFAULT 0
-                )
-            ''')
-            self.conn.commit()
-
-    def insert_new_file(self, file_path):
-        if self.cursor:
+    def __init__(self, thumbnail_cache, schedule):
+        self.thumbnail_cache = thumbnail_cache
+        # schedule(fn): az fn-t a Tk szálon futtatja (pl. app.call_soon)
+        self.schedule = schedule
+        self._condition = threading.Condition()
+        self._pending = None
+        self._generation = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def request(self, image_path, callback):
+        """
+        callback(image_path, key, thumbnail, error) a Tk szálon hívódik, és csak akkor,
+        ha közben nem érkezett újabb kérés.
+        """
+        with self._condition:
+            self._generation += 1
+            self._pending = (self._generation, image_path, callback)
+            self._condition.notify()
+
+    def cancel(self):
+        with self._condition:
+            self._generation += 1
+            self._pending = None
+
+    def shutdown(self):
+        with self._condition:
+            self._stopped = True
+            self._pending = None
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                generation, image_path, callback = self._pending
+                self._pending = None
+
+            key = thumbnail = error = None
             try:
-                self.cursor.execute("INSERT INTO files (file_path, used_date, used) VALUES (?, ?, ?)", (file_path, None, 0))
-                self.conn.commit()
-                return True
-            except sqlite3.IntegrityError:
-                return False
-            except sqlite3.Error as e:
-                print(f"Hiba a fájl beszúrásakor ({file_path}): {e}")
-                return False
-
-    def fetch_all_files(self):
-        try:
-            self.cursor.execute("SELECT file_path, ai_keywords, used_date, used FROM files")
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            messagebox.showerror("Adatbázis hiba", f"Nem sikerült az adatok lekérdezése: {e}")
-            return []
-            
-    def delete_records(self, file_paths):
-        if not file_paths:
-            return 0
-            
-        placeholders = ','.join('?' for _ in file_paths)
-        sql = f"DELETE FROM files WHERE file_path IN ({placeholders})"
-        
-        try:
-            self.cursor.execute(sql, file_paths)
-            self.conn.commit()
-            return self.cursor.rowcount
-        except sqlite3.Error as e:
-            messagebox.showerror("Adatbázis hiba", f"Nem sikerült a rekordok törlése: {e}")
-            return 0
+                key = self.thumbnail_cache.cache_key(image_path)
+                thumbnail = self.thumbnail_cache.load_thumbnail(image_path, key)
+            except Exception as e:
+                error = e
 
-    def fetch_files(self, limit=10, filter_queries=None, date_filter=None, logical_operator="AND", order_by="file_path", order_direction="ASC"):
-        query = "SELECT file_path, ai_keywords, used_date, used FROM files"
-        params = []
-        where_clauses = []
-        
-        if filter_queries:
-            for column, search_query in filter_queries.items():
-                if search_query is not None:
-                    if column == "used":
-                        where_clauses.append(f"{column} = ?")
-                        params.append(search_query)
-                    else:
-                        where_clauses.append(f"{column} LIKE ?")
-                        params.append(f"%{search_query}%")
-        
-        if date_filter and date_filter["type"] != "Nincs":
-            date_col = "used_date"
-            filter_type = date_filter["type"]
-            date_from = date_filter["from"]
-            date_to = date_filter["to"]
-            
-            if date_from or date_to:
-                date_where_clauses = []
-                date_clause_base = f"({date_col} IS NOT NULL AND {date_col} != ''"
-                
-                if filter_type == "Korábbi, mint" and date_from:
-                    date_where_clauses.append(f"{date_clause_base} AND {date_col} < ?)")
-                    params.append(date_from)
-                elif filter_type == "Későbbi, mint" and date_from:
-                    date_where_clauses.append(f"{date_clause_base} AND {date_col} > ?)")
-                    params.append(date_from)
-                elif filter_type == "Közte":
-                    if date_from and date_to:
-                        date_where_clauses.append(f"{date_clause_base} AND {date_col} BETWEEN ? AND ?)")
-                        params.append(date_from)
-                        params.append(date_to)
-                    elif date_from:
-                        date_where_clauses.append(f"{date_clause_base} AND {date_col} >= ?)")
-                        params.append(date_from)
-                    elif date_to:
-                        date_where_clauses.append(f"{date_clause_base} AND {date_col} <= ?)")
-                        params.append(date_to)
-            
-                if date_where_clauses:
-                    where_clauses.append(" AND ".join(date_where_clauses))
+            self.schedule(lambda: self._deliver(generation, image_path, key, thumbnail, error, callback))
 
-        
-        if where_clauses:
-            operator = " AND " if logical_operator == "AND" else " OR "
-            query += " WHERE " + operator.join(where_clauses)
-        
-        order_clause = f" ORDER BY {order_by} {order_direction}"
-        
-        query += order_clause + f" LIMIT ?"
-        params.append(limit)
-        
-        try:
-            self.cursor.execute(query, tuple(params))
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            messagebox.showerror("Adatbázis hiba", f"Nem sikerült a lekérdezés: {e} \nLekérdezés: {query} \nParaméterek: {params}")
-            return []
-
-    def update_record(self, file_path, column, new_value):
-        try:
-            # Megjegyzés: A new_value lehet None, ami NULL értéket fog beállítani
-            self.cursor.execute(f"UPDATE files SET {column} = ? WHERE file_path = ?", (new_value, file_path))
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            messagebox.showerror("Adatbázis hiba", f"Hiba az adat frissítésekor: {e}")
-            return False
-
-    def close(self):
-        if self.conn:
-            self.conn.close()
+    def _deliver(self, generation, image_path, key, thumbnail, error, callback):
+        if generation != self._generation:
+            return
+        callback(image_path, key, thumbnail, error)
 # ---
 
 # --- MainApp osztály ---
@@ -225,8 +291,10 @@ class MainApp(tk.Tk):
     """
     Fő alkalmazásosztály, ami felépíti a Tkinter GUI-t és kezeli a funkciókat.
     """
-    def __init__(self):
+    def __init__(self, measure_startup=False):
         super().__init__()
+        # Indulási idők (másodperc a modul betöltésétől), ha a mérés be van kapcsolva
+        self.startup_times = {"init": time.perf_counter() - STARTUP_T0} if measure_startup else None
         self.title("Képfájl-kezelő alkalmazás")
         self.state('zoomed')
         
@@ -235,8 +303,24 @@ class MainApp(tk.Tk):
         except tk.TclError:
             pass # Nincs icon.ico
 
-        self.settings_manager = SettingsManager()
-        self.db_manager = DatabaseManager()
+        self.settings_manager = SettingsManager(error_handler=messagebox.showerror)
+        configure_diagnostics(self.settings_manager.load_settings())
+        # A Tk szál saját kapcsolata (a séma frissítésének hibái így ablakban jelennek meg); az írások
+        # a közös író szálon futnak, így a mentés nem akasztja meg a felületet
+        self.db_manager = DatabaseManager(error_handler=messagebox.showerror)
+        self.database = shared_database(self.db_manager.db_name)
+        # A háttérszálak nem hívják közvetlenül a Tk-t (after() sem): a Tk szálon futtatandó függvényeket
+        # ebbe a sorba teszik, a Tk szál pedig rendszeresen kiüríti (lásd call_soon). Így egy háttérszál akkor
+        # sem akad el, ha a Tk szál épp rá vár (pl. bezáráskor a még sorban álló írások véglegesítésére).
+        self.ui_calls = queue.Queue()
+        self.ui_poll_ms = 50
+        self.ui_poll_job = self.after(self.ui_poll_ms, self.process_ui_calls)
+        self.thumbnail_cache = ThumbnailCache(
+            max_disk_bytes=int(self.settings_manager.load_settings().get("thumbnail_cache_max_mb", 200)) * 1024 * 1024
+        )
+        # A kijelölt sor előtt és után ennyi sor előnézetét töltjük elő
+        self.prefetch_neighbors = 5
+        self.preview_loader = PreviewLoader(self.thumbnail_cache, self.call_soon)
         
         self.file_path_query = tk.StringVar(value="")
         self.ai_keywords_query = tk.StringVar(value="")
@@ -246,19 +330,58 @@ class MainApp(tk.Tk):
         
         self.logical_operator = tk.StringVar(value="ÉS")
         self.used_filter_var = tk.StringVar(value="Mind")
-        self.top_limit = tk.StringVar(value="10")
+        self.top_limit = tk.StringVar(value="0")
+        # Kulcsszópanel: a kijelölt kulcsszavak szűkítenek (include), illetve kizárnak (exclude)
+        self.keywords_include = []
+        self.keywords_exclude = []
+        self.keyword_filter_var = tk.StringVar(value="")
+        self.facet_limit = 100
         
         self.sort_column = "file_path"
         self.sort_direction = "ASC"
         self.dirty_records = {}
         self.date_format = "%Y.%m.%d"
+        self.scanner = None
+        self.exporter = None
+        self.importer = None
+        self.keyword_runner = None
+        self.ai_thread = None
+        self.full_rescan_var = tk.BooleanVar(value=False)
+        self.watcher = None
+        self.watch_var = tk.BooleanVar(value=False)
+        self.diagnostics_var = tk.BooleanVar(value=False)
+        # Az eltűnt fájlok kezelése beolvasáskor (missing_files_policy), a beállítások fülön választható
+        self.missing_policy_labels = {
+            "mark": "Megjelölés (a táblázatban rejtve, a kulcsszavak megmaradnak)",
+            "purge": "Törlés az adatbázisból"
+        }
+        self.missing_policy_var = tk.StringVar(value=self.missing_policy_labels["mark"])
+        self.include_missing_var = tk.BooleanVar(value=False)
+
+        # Virtuális görgetés: a táblázatban egyszerre legfeljebb max_loaded_rows sor van,
+        # a többit görgetéskor, oldalanként (keyset lapozással) töltjük be
+        self.page_size = 200
+        self.max_loaded_rows = 3 * self.page_size
+        # A rendezés és a szűrők váltogatásakor a már lekérdezett találatok innen jönnek; íráskor kiürül
+        self.query_cache = QueryCache()
+        self.current_query = None
+        self.row_keys = {}
+        self.window_start = 0
+        self.window_end = 0
+        self.result_count = 0
+        self.page_loading = False
+        self.result_info_var = tk.StringVar(value="")
         
         self.create_widgets()
         
         self.load_settings_into_gui()
-        self.load_data_to_table()
         
         self.notebook.select(self.data_frame)
+        # Az ablak a kezdeti lekérdezés előtt megjelenik, a lekérdezés háttérszálon fut
+        if self.startup_times is not None:
+            self.bind("<Map>", self.on_first_map, add="+")
+        self.after_idle(self.load_data_to_table)
+        self.after(500, self.resume_ai_jobs)
 
 
     def create_widgets(self):
@@ -289,6 +412,15 @@ class MainApp(tk.Tk):
         self.prompt_text_area = tk.Text(self.settings_frame, height=5, wrap="word")
         self.prompt_text_area.pack(fill="x", padx=10, pady=5)
 
+        ttk.Checkbutton(self.settings_frame, text="Diagnosztika: időmérés és a lassú lekérdezések naplózása (Diagnosztika fül)",
+                        variable=self.diagnostics_var).pack(anchor="w", padx=10, pady=5)
+
+        missing_policy_frame = ttk.Frame(self.settings_frame)
+        missing_policy_frame.pack(anchor="w", padx=10, pady=5)
+        ttk.Label(missing_policy_frame, text="Eltűnt fájlok beolvasáskor:").pack(side="left")
+        ttk.Combobox(missing_policy_frame, textvariable=self.missing_policy_var, values=list(self.missing_policy_labels.values()),
+                     state="readonly", width=55).pack(side="left", padx=5)
+
         # Gombok
         button_frame = ttk.Frame(self.settings_frame)
         button_frame.pack(fill="x", pady=10)
@@ -308,11 +440,21 @@ class MainApp(tk.Tk):
         left_controls_frame = ttk.Frame(top_section_frame)
         left_controls_frame.pack(side="left", fill="both", expand=True, padx=(0, 10))
 
-        scan_button = ttk.Button(left_controls_frame, text="Mappák beolvasása", command=self.scan_folders)
-        scan_button.pack(pady=10)
-
-        export_button = ttk.Button(left_controls_frame, text="Teljes DB exportálása CSV-be", command=self.export_to_csv)
-        export_button.pack(pady=10)
+        self.scan_button = ttk.Button(left_controls_frame, text="Mappák beolvasása", command=self.scan_folders)
+        self.scan_button.pack(pady=(10, 0))
+        ttk.Checkbutton(left_controls_frame, text="Teljes újraolvasás (a változatlan mappákat is)", variable=self.full_rescan_var).pack(pady=(0, 10))
+        ttk.Checkbutton(left_controls_frame, text="Mappák folyamatos figyelése", variable=self.watch_var, command=self.toggle_watch).pack()
+
+        transfer_frame = ttk.Frame(left_controls_frame)
+        transfer_frame.pack(pady=10)
+        self.export_button = ttk.Button(transfer_frame, text="Exportálás (CSV / JSONL / Parquet)", command=self.export_data)
+        self.export_button.pack(side="left", padx=5)
+        self.import_button = ttk.Button(transfer_frame, text="Importálás (CSV / JSONL)", command=self.import_data)
+        self.import_button.pack(side="left", padx=5)
+        duplicates_frame = ttk.Frame(left_controls_frame)
+        duplicates_frame.pack(pady=(0, 10))
+        ttk.Button(duplicates_frame, text="Pontos másolatok", command=self.open_exact_duplicates_window).pack(side="left", padx=5)
+        ttk.Button(duplicates_frame, text="Közeli másolatok keresése", command=self.open_near_duplicates_window).pack(side="left", padx=5)
         
         self.status_text = tk.Text(left_controls_frame, height=10, wrap="word")
         self.status_text.pack(fill="both", expand=True, pady=5)
@@ -355,8 +497,10 @@ class MainApp(tk.Tk):
         used_options = ttk.Combobox(data_controls_frame, textvariable=self.used_filter_var, values=["Mind", "Igen", "Nem"], state="readonly", width=7)
         used_options.pack(side="left")
         used_options.bind("<<ComboboxSelected>>", lambda event: self.load_data_to_table())
+        ttk.Checkbutton(data_controls_frame, text="Eltűnt fájlok is", variable=self.include_missing_var,
+                        command=self.load_data_to_table).pack(side="left", padx=(10, 0))
         
-        ttk.Label(data_controls_frame, text="Elemek száma:").pack(side="left", padx=(10, 5))
+        ttk.Label(data_controls_frame, text="Elemek száma (0 = mind):").pack(side="left", padx=(10, 5))
         limit_entry = ttk.Entry(data_controls_frame, textvariable=self.top_limit, width=5)
         limit_entry.pack(side="left", padx=5)
 
@@ -387,10 +531,36 @@ class MainApp(tk.Tk):
         self.save_changes_button = ttk.Button(bulk_update_and_save_frame, text="Változtatások mentése", command=self.save_changes, state="disabled")
         self.save_changes_button.pack(side="right", padx=(10, 0))
 
+        ttk.Label(self.data_frame, textvariable=self.result_info_var).pack(anchor="w", padx=10)
+
         # Táblázat (Treeview)
         columns = ("file_path", "ai_keywords", "used_date", "used")
-        self.tree = ttk.Treeview(self.data_frame, columns=columns, show="headings", selectmode='extended')
-        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
+        tree_frame = ttk.Frame(self.data_frame)
+        tree_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        # Kulcsszópanel: a leggyakoribb kulcsszavak az aktuális szűrés találatai között
+        facet_frame = ttk.LabelFrame(tree_frame, text="Kulcsszavak")
+        facet_frame.pack(side="right", fill="y", padx=(10, 0))
+        ttk.Label(facet_frame, textvariable=self.keyword_filter_var, wraplength=220, justify="left").pack(anchor="w", padx=5, pady=(5, 0))
+        facet_buttons = ttk.Frame(facet_frame)
+        facet_buttons.pack(fill="x", padx=5, pady=5)
+        ttk.Button(facet_buttons, text="+ Szűkítés", command=lambda: self.toggle_keyword_filter("include")).pack(side="left")
+        ttk.Button(facet_buttons, text="− Kizárás", command=lambda: self.toggle_keyword_filter("exclude")).pack(side="left", padx=5)
+        ttk.Button(facet_buttons, text="Törlés", command=self.clear_keyword_filters).pack(side="left")
+        self.facet_tree = ttk.Treeview(facet_frame, columns=("keyword", "count"), show="headings", selectmode="browse")
+        self.facet_tree.heading("keyword", text="Kulcsszó")
+        self.facet_tree.heading("count", text="Képek")
+        self.facet_tree.column("keyword", width=150)
+        self.facet_tree.column("count", width=60, anchor=tk.E)
+        self.facet_tree.tag_configure("included", foreground="#1a7f37")
+        self.facet_tree.pack(fill="both", expand=True, padx=5, pady=(0, 5))
+        self.facet_tree.bind("<Double-1>", lambda event: self.toggle_keyword_filter("include"))
+
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show="headings", selectmode='extended')
+        self.tree_scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
+        self.tree_scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
         
         self.tree.heading("file_path", text="Fájl útvonal", command=lambda: self.handle_sort_column("file_path"))
         self.tree.heading("ai_keywords", text="AI kulcsszavak", command=lambda: self.handle_sort_column("ai_keywords"))
@@ -404,9 +574,108 @@ class MainApp(tk.Tk):
 
         self.tree.bind("<Double-1>", self.on_double_click)
         self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+
+        self.create_diagnostics_tab()
         
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
+    def create_diagnostics_tab(self):
+        """
+        A Diagnosztika fül: műveletenkénti időstatisztika (gördülő percentilisek), a kijelölt művelet
+        késleltetési hisztogramja, valamint a lassú lekérdezések SQL-je és végrehajtási terve.
+        """
+        self.diagnostics_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.diagnostics_frame, text="Diagnosztika")
+
+        controls = ttk.Frame(self.diagnostics_frame)
+        controls.pack(fill="x", padx=10, pady=5)
+        ttk.Button(controls, text="Frissítés", command=self.refresh_diagnostics).pack(side="left")
+        ttk.Button(controls, text="Nullázás", command=self.reset_diagnostics).pack(side="left", padx=5)
+        self.diagnostics_info_var = tk.StringVar(value="")
+        ttk.Label(controls, textvariable=self.diagnostics_info_var).pack(side="left", padx=10)
+
+        columns = ("name", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "total_s", "rows")
+        headings = ("Művelet", "Darab", "Átlag (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)", "Összesen (s)", "Sorok")
+        stats_frame = ttk.Frame(self.diagnostics_frame)
+        stats_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.diagnostics_tree = ttk.Treeview(stats_frame, columns=columns, show="headings", height=12)
+        for column, heading in zip(columns, headings):
+            self.diagnostics_tree.heading(column, text=heading)
+            self.diagnostics_tree.column(column, width=300 if column == "name" else 90, anchor=tk.W if column == "name" else tk.E)
+        stats_scrollbar = ttk.Scrollbar(stats_frame, orient="vertical", command=self.diagnostics_tree.yview)
+        self.diagnostics_tree.configure(yscrollcommand=stats_scrollbar.set)
+        stats_scrollbar.pack(side="right", fill="y")
+        self.diagnostics_tree.pack(side="left", fill="both", expand=True)
+        self.diagnostics_tree.bind("<<TreeviewSelect>>", lambda event: self.show_diagnostics_histogram())
+
+        details_frame = ttk.Frame(self.diagnostics_frame)
+        details_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        histogram_frame = ttk.LabelFrame(details_frame, text="Késleltetés eloszlása (a legutóbbi 1000 futás)")
+        histogram_frame.pack(side="left", fill="both", padx=(0, 5))
+        self.histogram_text = tk.Text(histogram_frame, width=50, height=15, wrap="none")
+        self.histogram_text.pack(fill="both", expand=True)
+        slow_frame = ttk.LabelFrame(details_frame, text="Lassú lekérdezések (végrehajtási tervvel)")
+        slow_frame.pack(side="left", fill="both", expand=True)
+        self.slow_queries_text = tk.Text(slow_frame, height=15, wrap="word")
+        self.slow_queries_text.pack(fill="both", expand=True)
+
+        self.diagnostics_summaries = {}
+        self.diagnostics_refresh_job = None
+        self.notebook.bind("<<NotebookTabChanged>>", lambda event: self.refresh_diagnostics(auto=True), add="+")
+
+    def refresh_diagnostics(self, auto=False):
+        """
+        Frissíti a Diagnosztika fület; auto=True esetén, amíg a fül látszik, kétmásodpercenként újra.
+        """
+        if auto and self.diagnostics_refresh_job is not None:
+            self.after_cancel(self.diagnostics_refresh_job)
+            self.diagnostics_refresh_job = None
+        if self.notebook.select() != str(self.diagnostics_frame):
+            return
+        if not diagnostics.enabled:
+            self.diagnostics_info_var.set("A diagnosztika ki van kapcsolva (Beállítások fül).")
+        else:
+            self.diagnostics_info_var.set(f"Lassú lekérdezés: {diagnostics.slow_seconds * 1000:.0f} ms felett"
+                                          + (f", napló: {diagnostics.log_path}" if diagnostics.log_path else ""))
+        selected = self.diagnostics_tree.selection()
+        self.diagnostics_summaries = diagnostics.snapshot()
+        self.diagnostics_tree.delete(*self.diagnostics_tree.get_children())
+        for name, summary in self.diagnostics_summaries.items():
+            self.diagnostics_tree.insert("", tk.END, iid=name, values=(
+                name, summary["count"], summary["mean_ms"], summary["p50_ms"], summary["p95_ms"], summary["p99_ms"],
+                summary["max_ms"], summary["total_s"], summary["rows"]
+            ))
+        selected = [item for item in selected if self.diagnostics_tree.exists(item)]
+        if selected:
+            self.diagnostics_tree.selection_set(selected)
+        self.show_diagnostics_histogram()
+
+        self.slow_queries_text.delete("1.0", tk.END)
+        for entry in reversed(diagnostics.slow_queries()):
+            self.slow_queries_text.insert(tk.END, f"{entry['time']}  {entry['seconds'] * 1000:.1f} ms, {entry['rows']} sor ({entry['thread']})\n"
+                                                  f"{entry['sql']}\nParaméterek: {entry['parameters']}\n")
+            for step in entry["plan"]:
+                self.slow_queries_text.insert(tk.END, f"  {step}\n")
+            self.slow_queries_text.insert(tk.END, "\n")
+        if auto:
+            self.diagnostics_refresh_job = self.after(2000, lambda: self.refresh_diagnostics(auto=True))
+
+    def reset_diagnostics(self):
+        diagnostics.reset()
+        self.refresh_diagnostics()
+
+    def show_diagnostics_histogram(self):
+        self.histogram_text.delete("1.0", tk.END)
+        selected = self.diagnostics_tree.selection()
+        summary = self.diagnostics_summaries.get(selected[0]) if selected else None
+        if summary is None:
+            self.histogram_text.insert(tk.END, "Jelölj ki egy műveletet a fenti táblázatban.")
+            return
+        largest = max(summary["histogram"].values()) or 1
+        self.histogram_text.insert(tk.END, f"{selected[0]}\n\n")
+        for label, count in summary["histogram"].items():
+            self.histogram_text.insert(tk.END, f"{label:>12} {'█' * round(30 * count / largest):<30} {count}\n")
+
     def load_settings_into_gui(self):
         settings = self.settings_manager.load_settings()
         
@@ -434,15 +703,30 @@ class MainApp(tk.Tk):
         self.date_filter_type.set(filter_settings.get("date_filter_type", "Nincs"))
         self.logical_operator.set(filter_settings.get("logical_operator", "ÉS"))
         self.used_filter_var.set(filter_settings.get("used_filter", "Mind"))
-        self.top_limit.set(filter_settings.get("top_limit", "10"))
+        self.include_missing_var.set(filter_settings.get("include_missing", False))
+        self.top_limit.set(filter_settings.get("top_limit", "0"))
+        self.keywords_include = list(filter_settings.get("keywords_include", []))
+        self.keywords_exclude = list(filter_settings.get("keywords_exclude", []))
+
+        self.watch_var.set(settings.get("watch_enabled", False))
+        self.toggle_watch()
+        self.diagnostics_var.set(settings.get("diagnostics_enabled", False))
+        missing_policy = settings.get("missing_files_policy", "mark")
+        self.missing_policy_var.set(self.missing_policy_labels.get(missing_policy, self.missing_policy_labels["mark"]))
         
         print("Beállítások betöltve.")
 
     def save_settings_from_gui(self):
-        settings = {
+        # A GUI-n nem szerkeszthető beállítások (pl. az AI korlátok) megmaradnak
+        settings = self.settings_manager.load_settings()
+        label_policies = {label: policy for policy, label in self.missing_policy_labels.items()}
+        settings.update({
             "folders": self.folders_text.get("1.0", tk.END).strip(),
             "google_api_key": self.api_entry.get().strip(),
             "ai_prompt": self.prompt_text_area.get("1.0", tk.END).strip(), # ÚJ: Prompt mentése
+            "watch_enabled": self.watch_var.get(),
+            "diagnostics_enabled": self.diagnostics_var.get(),
+            "missing_files_policy": label_policies.get(self.missing_policy_var.get(), "mark"),
             "column_widths": {
                 "file_path": self.tree.column("file_path", "width"),
                 "ai_keywords": self.tree.column("ai_keywords", "width"),
@@ -458,73 +742,282 @@ class MainApp(tk.Tk):
                 
                 "logical_operator": self.logical_operator.get(),
                 "used_filter": self.used_filter_var.get(),
-                "top_limit": self.top_limit.get()
+                "include_missing": self.include_missing_var.get(),
+                "top_limit": self.top_limit.get(),
+                "keywords_include": list(self.keywords_include),
+                "keywords_exclude": list(self.keywords_exclude)
             }
-        }
+        })
+        configure_diagnostics(settings)
         if self.settings_manager.save_settings(settings):
+            # A futó mappafigyelő az új beállításokkal (pl. az eltűnt fájlok kezelésével) indul újra
+            if self.watcher is not None:
+                self.toggle_watch()
             messagebox.showinfo("Siker", "A beállítások sikeresen elmentve!")
             print("Beállítások elmentve.")
 
-    def export_to_csv(self):
+    def export_data(self):
+        # Futó exportálás közben a gomb megszakítja az exportálást
+        if self.exporter is not None:
+            self.exporter.cancel()
+            return
+
         file_path = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV fájlok", "*.csv"), ("Minden fájl", "*.*")],
-            title="Adatbázis exportálása CSV-be"
+            filetypes=[("CSV fájlok", "*.csv"), ("JSON Lines fájlok", "*.jsonl"), ("Parquet fájlok", "*.parquet"), ("Minden fájl", "*.*")],
+            title="Adatbázis exportálása"
         )
         if not file_path:
             return
 
-        all_data = self.db_manager.fetch_all_files()
-        
-        if not all_data:
-            messagebox.showinfo("Nincs adat", "Az adatbázis üres, nincs mit exportálni.")
+        query = None
+        if self.current_query is not None and (self.current_query["filter_queries"] or self.current_query["date_filter"]["type"] != "Nincs"):
+            answer = messagebox.askyesnocancel("Exportálás", "Csak az aktuális szűrés találatait exportáljuk?\n(Nem: a teljes adatbázis)")
+            if answer is None:
+                return
+            if answer:
+                query = dict(self.current_query)
+
+        try:
+            self.exporter = FileExporter(
+                self.db_manager.db_name,
+                file_path,
+                query=query,
+                progress_callback=lambda stats: self.call_soon(lambda: self.update_export_progress(stats))
+            )
+        except ValueError as e:
+            messagebox.showerror("Hiba", str(e))
             return
 
+        self.export_button.config(text="Exportálás megszakítása")
+        self.status_text.insert(tk.END, f"Exportálás elindult: {file_path}\n")
+        self.status_text.mark_set("export_progress", tk.END)
+        self.status_text.mark_gravity("export_progress", tk.LEFT)
+        export_thread = threading.Thread(target=self.run_export, args=(self.exporter,))
+        export_thread.daemon = True
+        export_thread.start()
+
+    def run_export(self, exporter):
         try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                
-                headers = ["file_path", "ai_keywords", "used_date", "used"]
-                writer.writerow(headers)
-                
-                writer.writerows(all_data)
+            stats = exporter.run()
+            error = None
+        except Exception as e:
+            stats = None
+            error = e
+        self.call_soon(lambda: self.finish_export(stats, error))
+
+    def update_export_progress(self, stats):
+        self.status_text.delete("export_progress", tk.END)
+        self.status_text.insert(tk.END, f"Exportált sorok: {stats['rows']} / {stats['total']}\n")
+        self.status_text.see(tk.END)
+
+    def finish_export(self, stats, error):
+        self.exporter = None
+        self.export_button.config(text="Exportálás (CSV / JSONL / Parquet)")
+        if error is not None:
+            messagebox.showerror("Hiba", f"Nem sikerült az exportálás: {error}")
+        elif stats["cancelled"]:
+            self.status_text.insert(tk.END, "Az exportálás megszakítva.\n")
+        elif not stats["rows"]:
+            messagebox.showinfo("Nincs adat", "Nincs exportálható sor, a fájl csak a fejlécet tartalmazza.")
+        else:
+            messagebox.showinfo("Siker", f"{stats['rows']} sor sikeresen exportálva ide: {stats['output']}")
+        self.status_text.see(tk.END)
+
+    def import_data(self):
+        # Futó importálás közben a gomb megszakítja az importálást
+        if self.importer is not None:
+            self.importer.cancel()
+            return
 
-            messagebox.showinfo("Siker", f"Az adatok sikeresen exportálva ide: {file_path}")
+        file_path = filedialog.askopenfilename(
+            filetypes=[("CSV fájlok", "*.csv"), ("JSON Lines fájlok", "*.jsonl"), ("Minden fájl", "*.*")],
+            title="Importálás az adatbázisba"
+        )
+        if not file_path:
+            return
+        merge_rules = self.ask_import_merge_rules()
+        if merge_rules is None:
+            return
+
+        try:
+            self.importer = FileImporter(
+                self.db_manager.db_name,
+                file_path,
+                merge_rules=merge_rules,
+                progress_callback=lambda stats: self.call_soon(lambda: self.update_import_progress(stats))
+            )
+        except ValueError as e:
+            messagebox.showerror("Hiba", str(e))
+            return
+
+        self.import_button.config(text="Importálás megszakítása")
+        self.status_text.insert(tk.END, f"Importálás elindult: {file_path}\n")
+        self.status_text.mark_set("import_progress", tk.END)
+        self.status_text.mark_gravity("import_progress", tk.LEFT)
+        import_thread = threading.Thread(target=self.run_import, args=(self.importer,))
+        import_thread.daemon = True
+        import_thread.start()
+
+    def ask_import_merge_rules(self):
+        """
+        Párbeszédablak az oszloponkénti egyesítési szabályokhoz. Visszaadja a szabályokat, vagy None-t, ha
+        a felhasználó megszakította.
+        """
+        rule_labels = {
+            "update": "Frissítés (a nem üres érték felülír)",
+            "overwrite": "Felülírás (az üres érték is)",
+            "fill": "Csak az üres mezők kitöltése",
+            "keep": "Meglévő érték megtartása",
+            "merge": "Kulcsszavak egyesítése"
+        }
+        column_labels = {"ai_keywords": "AI kulcsszavak", "used_date": "Felhasználás dátuma", "used": "Felhasználva"}
+        dialog = tk.Toplevel(self)
+        dialog.title("Importálás: meglévő sorok kezelése")
+        dialog.transient(self)
+        ttk.Label(dialog, text="Ha egy fájl már szerepel az adatbázisban:").grid(row=0, column=0, columnspan=2, sticky="w", padx=10, pady=(10, 5))
+        rule_vars = {}
+        for row, column in enumerate(column_labels, start=1):
+            options = [label for rule, label in rule_labels.items() if rule != "merge" or column == "ai_keywords"]
+            rule_vars[column] = tk.StringVar(value=rule_labels["update"])
+            ttk.Label(dialog, text=column_labels[column] + ":").grid(row=row, column=0, sticky="w", padx=10, pady=2)
+            ttk.Combobox(dialog, textvariable=rule_vars[column], values=options, state="readonly", width=36).grid(row=row, column=1, padx=10, pady=2)
+
+        result = {}
+
+        def accept():
+            label_rules = {label: rule for rule, label in rule_labels.items()}
+            result.update({column: label_rules[var.get()] for column, var in rule_vars.items()})
+            dialog.destroy()
+
+        buttons = ttk.Frame(dialog)
+        buttons.grid(row=len(column_labels) + 1, column=0, columnspan=2, pady=10)
+        ttk.Button(buttons, text="Importálás", command=accept).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Mégse", command=dialog.destroy).pack(side="left", padx=5)
+        dialog.grab_set()
+        self.wait_window(dialog)
+        return result or None
+
+    def run_import(self, importer):
+        try:
+            stats = importer.run()
+            error = None
         except Exception as e:
-            messagebox.showerror("Hiba", f"Nem sikerült az exportálás: {e}")
+            stats = None
+            error = e
+        self.call_soon(lambda: self.finish_import(stats, error))
+
+    def update_import_progress(self, stats):
+        self.status_text.delete("import_progress", tk.END)
+        self.status_text.insert(tk.END, f"Importált sorok: {stats['rows']} (új: {stats['inserted']}, frissített: {stats['updated']}, "
+                                        f"hibás: {stats['skipped']})\n")
+        self.status_text.see(tk.END)
+
+    def finish_import(self, stats, error):
+        self.importer = None
+        self.import_button.config(text="Importálás (CSV / JSONL)")
+        if error is not None:
+            messagebox.showerror("Hiba", f"Nem sikerült az importálás: {error}")
+            return
+        for message in stats["errors"][:20]:
+            self.status_text.insert(tk.END, f"Importálási hiba: {message}\n")
+        if stats["cancelled"]:
+            self.status_text.insert(tk.END, "Az importálás megszakítva.\n")
+        else:
+            messagebox.showinfo("Importálás kész", f"{stats['rows']} sor feldolgozva: {stats['inserted']} új, {stats['updated']} frissített, "
+                                                   f"{stats['unchanged']} változatlan, {stats['skipped']} hibás sor.")
+        self.status_text.see(tk.END)
+        # Mentetlen szerkesztések mellett nem töltjük újra a táblázatot, hogy ne vesszenek el
+        if not self.dirty_records:
+            self.load_data_to_table()
 
     def scan_folders(self):
+        if self.scanner is not None:
+            messagebox.showinfo("Beolvasás folyamatban", "A mappák beolvasása már fut.")
+            return
+
         self.status_text.delete("1.0", tk.END)
         self.status_text.insert(tk.END, "Mappák beolvasása elindult...\n")
-        
+        self.status_text.mark_set("scan_progress", tk.END)
+        self.status_text.mark_gravity("scan_progress", tk.LEFT)
+
         settings = self.settings_manager.load_settings()
         folders_str = settings.get("folders", "")
         folders = [f.strip() for f in folders_str.split('\n') if f.strip()]
-        
-        image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
-        
-        total_new_files = 0
-        
-        for folder_path in folders:
-            if not os.path.isdir(folder_path):
-                self.status_text.insert(tk.END, f"Hiba: A mappa nem létezik: {folder_path}\n")
-                continue
-            
-            self.status_text.insert(tk.END, f"Mappa beolvasása: {folder_path}\n")
-            
-            try:
-                for file_name in os.listdir(folder_path):
-                    if file_name.lower().endswith(image_extensions):
-                        full_path = os.path.join(folder_path, file_name)
-                        if self.db_manager.insert_new_file(full_path):
-                            self.status_text.insert(tk.END, f"  Új fájl hozzáadva: {file_name}\n")
-                            total_new_files += 1
-            except Exception as e:
-                self.status_text.insert(tk.END, f"Hiba a mappa beolvasásakor ({folder_path}): {e}\n")
-        
-        self.status_text.insert(tk.END, f"\nBeolvasás befejezve. Újonnan hozzáadott fájlok száma: {total_new_files}\n")
+
+        self.scan_button.config(state="disabled")
+        self.scanner = FolderScanner(
+            self.db_manager.db_name,
+            progress_callback=lambda stats: self.call_soon(lambda: self.update_scan_progress(stats)),
+            incremental=not self.full_rescan_var.get(),
+            missing_policy=settings.get("missing_files_policy", "mark")
+        )
+        scan_thread = threading.Thread(target=self.run_scan, args=(self.scanner, folders))
+        scan_thread.daemon = True
+        scan_thread.start()
+
+    def run_scan(self, scanner, folders):
+        try:
+            stats = scanner.scan(folders)
+        except Exception as e:
+            stats = {"dirs": 0, "files": 0, "new": 0, "modified": 0, "missing": 0, "errors": [f"Hiba a beolvasás során: {e}"]}
+        self.call_soon(lambda: self.finish_scan(stats))
+
+    def update_scan_progress(self, stats):
+        # Csak az utolsó állapotsort cseréljük, így a szövegdoboz nem nő fájlonként
+        self.status_text.delete("scan_progress", tk.END)
+        self.status_text.insert(tk.END, f"Bejárt mappák: {stats['dirs']} (változatlan: {stats['skipped_dirs']}), talált képek: {stats['files']}, "
+                                        f"új: {stats['new']}, módosult: {stats['modified']}, eltűnt: {stats['missing']}, "
+                                        f"áthelyezett: {stats.get('moved', 0)}, hash-elt: {stats.get('hashed', 0)}, hibák: {stats['errors']}\n")
+        self.status_text.see(tk.END)
+
+    def finish_scan(self, stats):
+        self.scanner = None
+        self.scan_button.config(state="normal")
+
+        max_listed_errors = 20
+        for error in stats["errors"][:max_listed_errors]:
+            self.status_text.insert(tk.END, f"{error}\n")
+        if len(stats["errors"]) > max_listed_errors:
+            self.status_text.insert(tk.END, f"... és további {len(stats['errors']) - max_listed_errors} hiba.\n")
+
+        self.status_text.insert(tk.END, f"\nBeolvasás befejezve. Újonnan hozzáadott fájlok száma: {stats['new']}, "
+                                        f"módosult: {stats.get('modified', 0)}, eltűnt: {stats.get('missing', 0)}, "
+                                        f"áthelyezett: {stats.get('moved', 0)}\n")
+        self.status_text.see(tk.END)
         self.load_data_to_table()
 
+    def toggle_watch(self):
+        # Újraindításkor a figyelő a friss mappalistát kapja
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+        if not self.watch_var.get():
+            return
+
+        settings = self.settings_manager.load_settings()
+        folders = [f.strip() for f in settings.get("folders", "").split('\n') if f.strip()]
+        if not folders:
+            return
+
+        self.watcher = FolderWatcher(
+            self.db_manager.db_name,
+            folders,
+            change_callback=lambda stats: self.call_soon(lambda: self.on_watch_changes(stats)),
+            missing_policy=settings.get("missing_files_policy", "mark")
+        )
+        self.watcher.start()
+        self.status_text.insert(tk.END, "Mappák figyelése bekapcsolva.\n")
+
+    def on_watch_changes(self, stats):
+        self.status_text.insert(tk.END, f"Mappafigyelés: új: {stats['new']}, módosult: {stats['modified']}, eltűnt: {stats['missing']}, "
+                                        f"áthelyezett: {stats.get('moved', 0)}\n")
+        self.status_text.see(tk.END)
+        # Mentetlen szerkesztések mellett nem töltjük újra a táblázatot, hogy ne vesszenek el
+        if not self.dirty_records:
+            self.load_data_to_table()
+
     def delete_selected_records(self):
         selected_items = self.tree.selection()
         if not selected_items:
@@ -534,23 +1027,56 @@ class MainApp(tk.Tk):
         response = messagebox.askyesno("Törlés megerősítése", f"Biztosan törölni szeretnél {len(selected_items)} rekordot az adatbázisból?")
         if response:
             file_paths_to_delete = [self.tree.item(item, 'values')[0] for item in selected_items]
-            
-            deleted_count = self.db_manager.delete_records(file_paths_to_delete)
-            
-            if deleted_count > 0:
-                self.status_text.insert(tk.END, f"{deleted_count} rekord sikeresen törölve.\n")
-                self.load_data_to_table()
-            else:
-                self.status_text.insert(tk.END, "Hiba a rekordok törlése során.\n")
+            self.submit_write(self.finish_delete_records, "delete_records", file_paths_to_delete)
+
+    def finish_delete_records(self, deleted_count, error):
+        if deleted_count:
+            self.status_text.insert(tk.END, f"{deleted_count} rekord sikeresen törölve.\n")
+            self.load_data_to_table()
+        else:
+            self.status_text.insert(tk.END, f"Hiba a rekordok törlése során.{f' ({error})' if error else ''}\n")
+
+    def call_soon(self, function):
+        """
+        A function futtatása a Tk szálon, a következő sorkiürítéskor. Bármelyik szálból hívható.
+        """
+        self.ui_calls.put(function)
+
+    def process_ui_calls(self):
+        while True:
+            try:
+                function = self.ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                function()
+            except Exception:
+                self.report_callback_exception(*sys.exc_info())
+        self.ui_poll_job = self.after(self.ui_poll_ms, self.process_ui_calls)
+
+    def submit_write(self, callback, function, *args):
+        """
+        Írási művelet a közös író szálon (lásd DatabaseWriter.submit). A callback(eredmény, hiba) a Tk szálon
+        fut a tranzakció véglegesítése után; hiba esetén az eredmény None.
+        """
+        def done(future):
+            error = future.exception()
+            result = None if error else future.result()
+            self.call_soon(lambda: callback(result, error))
+
+        self.database.write(function, *args).add_done_callback(done)
 
 
     def load_data_to_table(self):
-        self.clear_table()
-        
-        # Limit ellenőrzése
+        """
+        Betölti a szűrőknek megfelelő sorok első oldalát. A számlálás és az első oldal lekérdezése háttérszálon
+        fut (a current_query azonosítja, hogy az eredmény még aktuális-e); ha mindkettő a gyorsítótárban van
+        (pl. a rendezés oda-vissza váltásakor), lekérdezés nélkül, azonnal jelenik meg.
+        """
+        # Limit ellenőrzése (0 vagy üres: nincs felső korlát, a görgetés lapozza végig a találatokat)
         try:
             limit_str = self.top_limit.get().strip()
-            limit = int(limit_str) if limit_str else 10
+            limit = int(limit_str) if limit_str else 0
         except ValueError:
             messagebox.showerror("Hiba", "Az 'Elemek száma' mezőbe egész számot kell írni.")
             return
@@ -590,6 +1116,12 @@ class MainApp(tk.Tk):
             
         if used_filter_value is not None:
              filter_queries["used"] = used_filter_value
+        if self.keywords_include:
+            filter_queries["keywords_include"] = list(self.keywords_include)
+        if self.keywords_exclude:
+            filter_queries["keywords_exclude"] = list(self.keywords_exclude)
+        if self.include_missing_var.get():
+            filter_queries["include_missing"] = True
              
         # Dátumszűrő összeállítása
         date_filter_settings = {
@@ -598,23 +1130,274 @@ class MainApp(tk.Tk):
             "to": date_to_str
         }
 
-        files = self.db_manager.fetch_files(
-            limit=limit,
-            filter_queries=filter_queries,
-            date_filter=date_filter_settings,
-            logical_operator=logical_operator_str,
-            order_by=self.sort_column,
-            order_direction=self.sort_direction
-        )
-        
-        for item in files:
-            used_status = "Igen" if item[3] == 1 else "Nem"
-            self.tree.insert("", "end", values=(item[0], item[1], item[2] if item[2] is not None else "", used_status))
-
+        # Kulcsszavas keresésnél az "AI kulcsszavak" oszlop szerinti rendezés relevancia szerinti sorrendet ad
+        order_by = self.sort_column
+        if order_by == "ai_keywords" and "ai_keywords" in filter_queries:
+            order_by = "relevance"
+
+        self.current_query = {
+            "filter_queries": filter_queries,
+            "date_filter": date_filter_settings,
+            "logical_operator": logical_operator_str,
+            "order_by": order_by,
+            "order_direction": self.sort_direction
+        }
+        self.update_keyword_filter_label()
+        self.refresh_keyword_facets()
         self.dirty_records = {}
         self.save_changes_button.config(state="disabled")
-        print(f"Adatok betöltve a táblázatba. Összesen {len(files)} elem.")
+        self.clear_table()
         self.display_image(None)
+        cached = self.first_page(self.db_manager, self.current_query, limit, cached_only=True)
+        if cached is not None:
+            self.finish_background_query(self.current_query, *cached)
+            return
+        self.result_count = 0
+        self.result_info_var.set("Betöltés...")
+        threading.Thread(target=self.run_background_query, args=(self.current_query, limit), daemon=True).start()
+
+    def toggle_keyword_filter(self, kind):
+        """
+        A kulcsszópanelen kijelölt kulcsszó felvétele a szűkítő ("include") vagy a kizáró ("exclude")
+        szűrők közé; ha már ott van, kikerül onnan.
+        """
+        selected = self.facet_tree.selection()
+        if not selected:
+            return
+        keyword = str(self.facet_tree.item(selected[0], "values")[0])
+        target, other = ((self.keywords_include, self.keywords_exclude) if kind == "include"
+                         else (self.keywords_exclude, self.keywords_include))
+        if keyword in target:
+            target.remove(keyword)
+        else:
+            target.append(keyword)
+            if keyword in other:
+                other.remove(keyword)
+        self.load_data_to_table()
+
+    def clear_keyword_filters(self):
+        if not self.keywords_include and not self.keywords_exclude:
+            return
+        self.keywords_include.clear()
+        self.keywords_exclude.clear()
+        self.load_data_to_table()
+
+    def update_keyword_filter_label(self):
+        parts = [f"+{keyword}" for keyword in self.keywords_include] + [f"−{keyword}" for keyword in self.keywords_exclude]
+        self.keyword_filter_var.set("Szűrés: " + ", ".join(parts) if parts else "Nincs kulcsszó-szűrés")
+
+    def refresh_keyword_facets(self):
+        """
+        A kulcsszópanel darabszámainak frissítése az aktuális szűrés szerint (háttérszálon).
+        """
+        if self.current_query is not None:
+            threading.Thread(target=self.run_keyword_facet_query, args=(self.current_query,), daemon=True).start()
+
+    def run_keyword_facet_query(self, query):
+        # Háttérszálon fut, ezért saját (olvasó) adatbázis-kapcsolatot nyit
+        db = DatabaseSession(self.db_manager.db_name)
+        try:
+            facets = db.fetch_keyword_facets(query["filter_queries"], query["date_filter"], query["logical_operator"],
+                                             limit=self.facet_limit)
+        finally:
+            db.close()
+        self.call_soon(lambda: self.show_keyword_facets(query, facets))
+
+    def show_keyword_facets(self, query, facets):
+        # Ha közben új lekérdezés indult, ez az eredmény már elavult
+        if self.current_query is not query:
+            return
+        self.facet_tree.delete(*self.facet_tree.get_children())
+        for keyword, count in facets:
+            tags = ("included",) if keyword in self.keywords_include else ()
+            self.facet_tree.insert("", tk.END, values=(keyword, count), tags=tags)
+
+    def row_to_values(self, row):
+        """
+        Adatbázis sor -> táblázat sor. A mentetlen módosítások felülírják az adatbázis értékeit,
+        így a görgetés közben újratöltött sorok is a szerkesztett állapotot mutatják.
+        """
+        file_path, ai_keywords, used_date, used = row
+        changes = self.dirty_records.get(file_path)
+        if changes:
+            ai_keywords = changes.get("ai_keywords", ai_keywords)
+            used_date = changes.get("used_date", used_date)
+            used = changes.get("used", used)
+        used_status = "Igen" if used == 1 else "Nem"
+        return (file_path, ai_keywords, used_date if used_date is not None else "", used_status)
+
+    def first_page(self, db, query, limit, cached_only=False):
+        """
+        A találatok száma és az első oldal (a QueryCache-en át). cached_only=True esetén None, ha valamelyik
+        nincs a gyorsítótárban.
+        """
+        result_count = self.query_cache.count_files(db, query["filter_queries"], query["date_filter"], query["logical_operator"],
+                                                    cached_only=cached_only)
+        if result_count is None:
+            return None
+        if limit > 0:
+            result_count = min(result_count, limit)
+        if not result_count:
+            return result_count, []
+        rows = self.query_cache.fetch_files(db, min(self.page_size, result_count), cached_only=cached_only, **query)
+        return None if rows is None else (result_count, rows)
+
+    def run_background_query(self, query, limit):
+        # Háttérszálon fut, ezért saját (olvasó) adatbázis-kapcsolatot nyit
+        db = DatabaseSession(self.db_manager.db_name)
+        try:
+            result_count, rows = self.first_page(db, query, limit)
+        finally:
+            db.close()
+        self.call_soon(lambda: self.finish_background_query(query, result_count, rows))
+
+    def finish_background_query(self, query, result_count, rows):
+        # Ha közben új lekérdezés indult, ez az eredmény már elavult
+        if self.current_query is not query:
+            return
+        self.result_count = result_count
+        self.load_next_page(rows)
+        self.tree.yview_moveto(0)
+        self.update_result_info()
+        print(f"Adatok betöltve a táblázatba. Összesen {self.result_count} találat.")
+        if self.startup_times is not None and "data_ready" not in self.startup_times:
+            self.update_idletasks()
+            self.startup_times["data_ready"] = time.perf_counter() - STARTUP_T0
+            self.report_startup_times()
+
+    def on_first_map(self, event):
+        if event.widget is self and "first_paint" not in self.startup_times:
+            # Az első rajzolás a megjelenítés utáni első üresjáratban történik
+            self.after_idle(lambda: self.startup_times.setdefault("first_paint", time.perf_counter() - STARTUP_T0))
+
+    def report_startup_times(self):
+        """
+        Mérési módban kiírja az indulási időket egy JSON sorban, majd bezárja az alkalmazást.
+        A beállításokat nem menti (se párbeszédablak, se a config.json felülírása), így a mérés felügyelet
+        nélkül, ismételhetően futtatható.
+        """
+        print(json.dumps({"startup_seconds": {name: round(value, 4) for name, value in self.startup_times.items()}}))
+        sys.stdout.flush()
+        self.after(0, lambda: self.on_close(save_settings=False))
+
+    def fetch_page(self, limit, seek_after, offset, reverse=False):
+        query = self.current_query
+        order_direction = query["order_direction"]
+        if reverse:
+            order_direction = "DESC" if order_direction == "ASC" else "ASC"
+        rows = self.query_cache.fetch_files(
+            self.db_manager,
+            limit=limit,
+            filter_queries=query["filter_queries"],
+            date_filter=query["date_filter"],
+            logical_operator=query["logical_operator"],
+            order_by=query["order_by"],
+            order_direction=order_direction,
+            seek_after=seek_after,
+            offset=offset
+        )
+        return rows[::-1] if reverse else rows
+
+    def load_next_page(self, rows=None):
+        """
+        A következő oldal betöltése; rows megadásakor (a háttérben már lekérdezett első oldal) nem kérdez le.
+        """
+        self.page_loading = False
+        remaining = self.result_count - self.window_end
+        if self.current_query is None or remaining <= 0:
+            return
+
+        children = self.tree.get_children()
+        page_limit = min(self.page_size, remaining)
+        if rows is None:
+            if self.current_query["order_by"] == "relevance":
+                # A bm25 pontszám nem lapozási kulcs, itt OFFSET-tel lapozunk
+                rows = self.fetch_page(page_limit, None, self.window_end)
+            else:
+                rows = self.fetch_page(page_limit, self.row_keys[children[-1]] if children else None, 0)
+
+        top_index = self.visible_top_index(children)
+        for row in rows:
+            item = self.tree.insert("", "end", values=self.row_to_values(row))
+            self.row_keys[item] = self.db_manager.seek_key(row, self.current_query["order_by"])
+        self.window_end += len(rows)
+        if len(rows) < page_limit:
+            # Közben törölt sorok: a találatok vége korábban van, mint a számlálás mutatta
+            self.result_count = self.window_end
+
+        children = self.tree.get_children()
+        excess = len(children) - self.max_loaded_rows
+        if excess > 0:
+            self.remove_rows(children[:excess])
+            self.window_start += excess
+            top_index -= excess
+        self.restore_view(top_index)
+        self.update_result_info()
+
+    def load_previous_page(self):
+        self.page_loading = False
+        if self.current_query is None or self.window_start <= 0:
+            return
+
+        children = self.tree.get_children()
+        if not children:
+            return
+        page_limit = min(self.page_size, self.window_start)
+        if self.current_query["order_by"] == "relevance":
+            rows = self.fetch_page(page_limit, None, self.window_start - page_limit)
+        else:
+            rows = self.fetch_page(page_limit, self.row_keys[children[0]], 0, reverse=True)
+
+        top_index = self.visible_top_index(children)
+        for index, row in enumerate(rows):
+            item = self.tree.insert("", index, values=self.row_to_values(row))
+            self.row_keys[item] = self.db_manager.seek_key(row, self.current_query["order_by"])
+        self.window_start -= len(rows)
+        if len(rows) < page_limit:
+            self.window_start = 0
+        top_index += len(rows)
+
+        children = self.tree.get_children()
+        excess = len(children) - self.max_loaded_rows
+        if excess > 0:
+            self.remove_rows(children[-excess:])
+            self.window_end -= excess
+        self.restore_view(top_index)
+        self.update_result_info()
+
+    def visible_top_index(self, children):
+        if not children:
+            return 0
+        return int(round(self.tree.yview()[0] * len(children)))
+
+    def restore_view(self, top_index):
+        # Sorok be- és kivétele után a korábban látott sor marad felül, így a görgetés nem ugrik
+        children = self.tree.get_children()
+        if children:
+            self.tree.yview_moveto(max(0, top_index) / len(children))
+
+    def remove_rows(self, items):
+        for item in items:
+            self.row_keys.pop(item, None)
+        self.tree.delete(*items)
+
+    def on_tree_scroll(self, first, last):
+        self.tree_scrollbar.set(first, last)
+        if self.page_loading:
+            return
+        # A betöltött ablak széléhez közeledve a következő/előző oldalt töltjük be, a Tk eseménykezelőn kívül
+        if float(last) >= 0.9 and self.window_end < self.result_count:
+            self.page_loading = True
+            self.after_idle(self.load_next_page)
+        elif float(first) <= 0.1 and self.window_start > 0:
+            self.page_loading = True
+            self.after_idle(self.load_previous_page)
+
+    def update_result_info(self):
+        if self.window_end > self.window_start:
+            self.result_info_var.set(f"Találatok: {self.result_count} (betöltve: {self.window_start + 1}–{self.window_end})")
+        else:
+            self.result_info_var.set(f"Találatok: {self.result_count}")
 
     def handle_sort_column(self, column_name):
         if self.sort_column == column_name:
@@ -626,8 +1409,10 @@ class MainApp(tk.Tk):
         self.load_data_to_table()
 
     def clear_table(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self.tree.delete(*self.tree.get_children())
+        self.row_keys = {}
+        self.window_start = 0
+        self.window_end = 0
 
     def on_double_click(self, event):
         item = self.tree.identify_row(event.y)
@@ -751,27 +1536,199 @@ class MainApp(tk.Tk):
             item = selected_items[0]
             file_path = self.tree.item(item, 'values')[0]
             self.display_image(file_path)
+            self.prefetch_neighbor_thumbnails(item)
         else:
             self.display_image(None)
 
+    def prefetch_neighbor_thumbnails(self, item):
+        children = self.tree.get_children()
+        try:
+            index = children.index(item)
+        except ValueError:
+            return
+        # Először a közvetlen szomszédok, hogy nyilakkal lépkedve azok legyenek készen elsőként
+        neighbors = []
+        for distance in range(1, self.prefetch_neighbors + 1):
+            for neighbor_index in (index + distance, index - distance):
+                if 0 <= neighbor_index < len(children):
+                    neighbors.append(self.tree.item(children[neighbor_index], 'values')[0])
+        self.thumbnail_cache.prefetch(
+            neighbors,
+            lambda path, key, thumbnail: self.call_soon(lambda: self.cache_prefetched_thumbnail(key, thumbnail))
+        )
+
+    def cache_prefetched_thumbnail(self, key, thumbnail):
+        if not self.thumbnail_cache.has_photo(key):
+            self.thumbnail_cache.put_photo(key, thumbnail)
+
     def display_image(self, image_path):
         if image_path and os.path.exists(image_path):
+            # Ha a kép már a memóriában van, azonnal megjelenik; különben a háttérszál állítja elő
             try:
-                original_image = Image.open(image_path)
-                max_size = (250, 250)
-                original_image.thumbnail(max_size, Image.Resampling.LANCZOS)
-                
-                self.current_image = ImageTk.PhotoImage(original_image)
-                self.image_label.config(image=self.current_image)
-                self.image_label.image = self.current_image
-            except Exception as e:
-                self.image_label.config(image="", text="Hiba a kép betöltésekor")
-                self.current_image = None
-                print(f"Hiba a kép betöltésekor ({image_path}): {e}")
+                photo = self.thumbnail_cache.get_cached_photo(self.thumbnail_cache.cache_key(image_path))
+            except OSError:
+                photo = None
+            if photo is not None:
+                self.preview_loader.cancel()
+                self.show_preview(photo)
+                return
+            self.image_label.config(image="", text="Betöltés...")
+            self.preview_loader.request(image_path, self.on_preview_ready)
         else:
+            self.preview_loader.cancel()
             self.image_label.config(image="", text="Nincs kép kiválasztva / nem található")
             self.current_image = None
 
+    def on_preview_ready(self, image_path, key, thumbnail, error):
+        if error is not None:
+            self.image_label.config(image="", text="Hiba a kép betöltésekor")
+            self.current_image = None
+            print(f"Hiba a kép betöltésekor ({image_path}): {error}")
+            return
+        try:
+            self.show_preview(self.thumbnail_cache.put_photo(key, thumbnail))
+        except Exception as e:
+            self.image_label.config(image="", text="Hiba a kép betöltésekor")
+            self.current_image = None
+            print(f"Hiba a kép megjelenítésekor ({image_path}): {e}")
+
+    def show_preview(self, photo):
+        self.current_image = photo
+        self.image_label.config(image=self.current_image, text="")
+        self.image_label.image = self.current_image
+
+    def open_near_duplicates_window(self):
+        """
+        Külön ablak a közeli másolatok (hasonló perceptuális hash-ű képek) csoportjaival.
+        """
+        window = tk.Toplevel(self)
+        window.title("Közeli másolatok")
+        window.geometry("900x600")
+
+        controls = ttk.Frame(window)
+        controls.pack(fill="x", padx=10, pady=5)
+        ttk.Label(controls, text="Legnagyobb eltérés (bit, 0-64):").pack(side="left")
+        distance_var = tk.StringVar(value=str(self.settings_manager.load_settings().get("near_duplicate_distance", 6)))
+        ttk.Spinbox(controls, from_=0, to=64, textvariable=distance_var, width=5).pack(side="left", padx=5)
+        info_var = tk.StringVar(value="")
+        search_button = ttk.Button(controls, text="Keresés")
+        search_button.pack(side="left", padx=5)
+        ttk.Label(controls, textvariable=info_var).pack(side="left", padx=10)
+
+        groups_tree = self.create_duplicate_groups_tree(window)
+
+        def search():
+            try:
+                max_distance = int(distance_var.get())
+            except ValueError:
+                messagebox.showerror("Hibás érték", "Az eltérés egy 0 és 64 közötti egész szám legyen.", parent=window)
+                return
+            search_button.config(state="disabled")
+            info_var.set("Keresés...")
+            threading.Thread(target=self.find_near_duplicates, args=(max_distance, groups_tree, search_button, info_var), daemon=True).start()
+
+        search_button.config(command=search)
+        search()
+
+    def open_exact_duplicates_window(self):
+        """
+        Külön ablak a bájtra azonos (azonos tartalmi hash-ű) fájlok csoportjaival.
+        """
+        window = tk.Toplevel(self)
+        window.title("Pontos másolatok")
+        window.geometry("900x600")
+        info_var = tk.StringVar(value="Keresés...")
+        ttk.Label(window, textvariable=info_var).pack(anchor="w", padx=10, pady=5)
+        groups_tree = self.create_duplicate_groups_tree(window)
+        threading.Thread(target=self.find_exact_duplicates, args=(groups_tree, info_var), daemon=True).start()
+
+    def find_exact_duplicates(self, groups_tree, info_var):
+        # Háttérszálon fut, ezért saját (olvasó) adatbázis-kapcsolatot nyit
+        db = DatabaseSession(self.db_manager.db_name)
+        try:
+            rows = db.fetch_exact_duplicates()
+        finally:
+            db.close()
+
+        groups = []
+        wasted_bytes = 0
+        previous_hash = None
+        for content_hash, file_path, size in rows:
+            if content_hash != previous_hash:
+                groups.append([])
+                previous_hash = content_hash
+            else:
+                # Csoportonként egy példányon felül minden másolat felesleges hely
+                wasted_bytes += size or 0
+            groups[-1].append((file_path, f"{(size or 0) / (1024 * 1024):.2f} MB, {content_hash[:12]}"))
+
+        def show():
+            if not groups_tree.winfo_exists():
+                return
+            self.show_duplicate_groups(groups_tree, groups)
+            info_var.set(f"{len(groups)} csoport, {len(rows)} fájl, a másolatok összesen {wasted_bytes / (1024 * 1024):.1f} MB helyet foglalnak")
+
+        self.call_soon(show)
+
+    def create_duplicate_groups_tree(self, window):
+        """
+        Csoportosított lista: a felső szintű sorok a csoportok, alattuk a fájlok. Egy fájlt
+        kijelölve a főablak előnézete mutatja a képet.
+        """
+        tree_frame = ttk.Frame(window)
+        tree_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        groups_tree = ttk.Treeview(tree_frame, columns=("file_path", "detail"), show="tree headings", selectmode="browse")
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=groups_tree.yview)
+        groups_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        groups_tree.pack(side="left", fill="both", expand=True)
+        groups_tree.heading("#0", text="Csoport")
+        groups_tree.heading("file_path", text="Fájl útvonal")
+        groups_tree.heading("detail", text="Részletek")
+        groups_tree.column("#0", width=120)
+        groups_tree.column("file_path", width=550)
+        groups_tree.column("detail", width=200)
+
+        def on_select(event):
+            selected = groups_tree.selection()
+            if selected and groups_tree.parent(selected[0]):
+                self.display_image(groups_tree.item(selected[0], "values")[0])
+
+        groups_tree.bind("<<TreeviewSelect>>", on_select)
+        return groups_tree
+
+    def find_near_duplicates(self, max_distance, groups_tree, search_button, info_var):
+        # Háttérszálon fut, ezért saját (olvasó) adatbázis-kapcsolatot nyit
+        db = DatabaseSession(self.db_manager.db_name)
+        try:
+            hash_rows = db.fetch_perceptual_hashes()
+        finally:
+            db.close()
+        groups = group_near_duplicates(hash_rows, max_distance)
+
+        def show():
+            if not groups_tree.winfo_exists():
+                return
+            rows = []
+            for group in groups:
+                reference = group[0][1]
+                rows.append([(file_path, f"eltérés: {hamming_distance(reference, phash)} bit") for file_path, phash in group])
+            self.show_duplicate_groups(groups_tree, rows)
+            info_var.set(f"{len(groups)} csoport, {sum(len(group) for group in groups)} kép ({len(hash_rows)} hash-elt képből)")
+            search_button.config(state="normal")
+
+        self.call_soon(show)
+
+    def show_duplicate_groups(self, groups_tree, groups):
+        """
+        groups: csoportonként [(file_path, részletek szövege)] lista.
+        """
+        groups_tree.delete(*groups_tree.get_children())
+        for index, group in enumerate(groups, start=1):
+            group_item = groups_tree.insert("", "end", text=f"{index}. ({len(group)} kép)", open=True)
+            for file_path, detail in group:
+                groups_tree.insert(group_item, "end", values=(file_path, detail))
+
     def start_ai_keyword_generation(self):
         selected_items = self.tree.selection()
         if not selected_items:
@@ -779,100 +1736,159 @@ class MainApp(tk.Tk):
             return
 
         settings = self.settings_manager.load_settings()
-        api_key = settings.get("google_api_key")
-
-        if not api_key:
-            messagebox.showerror("Hiba", "Kérlek, állítsd be a **Google AI kulcsot** a 'Beállítások' lapon.")
+        if not self.check_ai_settings(settings, show_errors=True):
             return
-        
-        if not settings.get("ai_prompt").strip():
-             messagebox.showerror("Hiba", "Kérlek, állítsd be az **AI Prompt Sablont** a 'Beállítások' lapon.")
-             return
 
-        self.ai_keyword_button.config(state="disabled")
-        self.status_text.delete("1.0", tk.END)
-        self.status_text.insert(tk.END, "AI kulcsszavak generálása elindult...\n")
-        
-        # Az AI prompt átadása a szálnak
-        ai_prompt = settings.get("ai_prompt")
-        
-        ai_thread = threading.Thread(target=self.generate_and_save_ai_keywords, args=(selected_items, api_key, ai_prompt))
-        ai_thread.daemon = True
-        ai_thread.start()
+        # A Treeview csak a Tk szálról olvasható, ezért az útvonalakat itt gyűjtjük ki
+        file_paths = [self.tree.item(item, 'values')[0] for item in selected_items]
 
-    def generate_and_save_ai_keywords(self, selected_items, api_key, ai_prompt):
-        try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.0-flash')
-        except Exception as e:
-            self.after(0, lambda: self.status_text.insert(tk.END, f"Hiba az AI inicializálása során: {e}\n"))
-            self.after(0, lambda: self.ai_keyword_button.config(state="normal"))
-            return
+        def enqueued(success, error):
+            if not success:
+                messagebox.showerror("Adatbázis hiba", f"Nem sikerült az AI feladatok felvétele.{f' {error}' if error else ''}")
+                return
+            self.status_text.delete("1.0", tk.END)
+            self.status_text.insert(tk.END, f"AI kulcsszavak generálása elindult ({len(file_paths)} kép)...\n")
+            self.start_ai_worker(settings)
 
-        for item in selected_items:
-            old_values = self.tree.item(item, 'values')
-            file_path = old_values[0]
+        self.submit_write(enqueued, "enqueue_ai_jobs", file_paths)
 
-            if not os.path.exists(file_path):
-                self.after(0, lambda p=file_path: self.status_text.insert(tk.END, f"Fájl nem található: {p}. Átugrás.\n"))
-                continue
+    def check_ai_settings(self, settings, show_errors=False):
+        error = check_ai_settings(settings)
+        if error and show_errors:
+            messagebox.showerror("Hiba", error)
+        return error is None
 
-            try:
-                # Kép betöltése bájtokba
-                image = Image.open(file_path)
-                
-                # A Gemini API a PIL Image objektumot is fogadja, ami sokkal megbízhatóbb, mint a bájtok manuális kezelése
-                response = model.generate_content([ai_prompt, image])
-                
-                ai_keywords = response.text.strip()
-                self.after(0, lambda f=os.path.basename(file_path): self.status_text.insert(tk.END, f"Kulcsszavak generálva ehhez: {f}\n"))
-                
-                if file_path not in self.dirty_records:
-                    self.dirty_records[file_path] = {}
-                self.dirty_records[file_path]["ai_keywords"] = ai_keywords
-                
-                self.after(0, lambda p=file_path, k=ai_keywords: self.update_treeview_ai_keywords(p, k))
+    def start_ai_worker(self, settings):
+        """
+        Elindítja az AI feladatsor feldolgozását egy háttérszálon (ha még nem fut).
+        """
+        if self.ai_thread is not None and self.ai_thread.is_alive():
+            return
+        self.ai_keyword_button.config(state="disabled")
+        self.ai_thread = threading.Thread(target=self.generate_and_save_ai_keywords, args=(settings,))
+        self.ai_thread.daemon = True
+        self.ai_thread.start()
 
-            except Exception as e:
-                self.after(0, lambda p=file_path, err=e: self.status_text.insert(tk.END, f"Hiba az AI kulcsszavak generálása során ehhez a fájlhoz: {os.path.basename(p)}: {err}\n"))
-                
-            time.sleep(1.1) # Megjegyzés: A rate-limit elkerülése érdekében
+    def resume_ai_jobs(self):
+        """
+        Indításkor folytatja az előző futásból befejezetlenül maradt AI feladatokat. Csak a lejárt bérletűeket
+        veszi át, így egy közben futó parancssori feldolgozás feladatait nem küldi el még egyszer.
+        A várakozó feladatok számlálása is az író szálon fut, így a Tk szál nem kérdez le.
+        """
+        def reset_and_count(db):
+            db.reset_interrupted_ai_jobs()
+            return db.count_ai_jobs().get("pending", 0)
 
-        self.after(0, lambda: self.status_text.insert(tk.END, "AI kulcsszavak generálása befejeződött.\n"))
-        self.after(0, lambda: self.ai_keyword_button.config(state="normal"))
+        self.submit_write(lambda pending_count, error: self.resume_pending_ai_jobs(pending_count or 0), reset_and_count)
 
-    def update_treeview_ai_keywords(self, file_path, keywords):
+    def resume_pending_ai_jobs(self, pending_count):
+        if not pending_count:
+            return
+        settings = self.settings_manager.load_settings()
+        if not self.check_ai_settings(settings):
+            self.status_text.insert(tk.END, f"{pending_count} befejezetlen AI feladat vár, de az AI beállítások hiányosak.\n")
+            return
+        self.status_text.insert(tk.END, f"Befejezetlen AI feladatok folytatása ({pending_count} kép)...\n")
+        self.start_ai_worker(settings)
+
+    def generate_and_save_ai_keywords(self, settings):
+        self.keyword_runner = KeywordJobRunner(
+            self.db_manager.db_name,
+            settings,
+            results_callback=lambda saved, errors: self.call_soon(lambda: self.apply_ai_results(saved, errors))
+        )
+        stats = self.keyword_runner.run()
+        self.keyword_runner = None
+
+        if stats["error"]:
+            self.call_soon(lambda: self.status_text.insert(tk.END, f"{stats['error']}\n"))
+        else:
+            self.call_soon(lambda: self.status_text.insert(tk.END, f"AI kulcsszavak generálása befejeződött. Sikeres: {stats['done'] - stats['cached']}, "
+                                                                  f"sikertelen: {stats['failed']}, gyorsítótárból: {stats['cached']}\n"))
+        self.call_soon(lambda: self.ai_keyword_button.config(state="normal"))
+
+    def apply_ai_results(self, saved, errors):
+        """
+        Az adatbázisba már elmentett AI eredmények megjelenítése (a Tk szálon).
+        """
+        for file_path, error in errors:
+            self.status_text.insert(tk.END, f"Hiba az AI kulcsszavak generálása során ehhez a fájlhoz: {os.path.basename(file_path)}: {error}\n")
+        for file_path in saved:
+            self.status_text.insert(tk.END, f"Kulcsszavak elmentve ehhez: {os.path.basename(file_path)}\n")
+        self.status_text.see(tk.END)
+        self.update_treeview_ai_keywords(saved)
+        self.refresh_keyword_facets()
+
+    def update_treeview_ai_keywords(self, keywords_by_path):
         for item in self.tree.get_children():
-            if self.tree.item(item, 'values')[0] == file_path:
-                old_values = self.tree.item(item, 'values')
-                new_values = list(old_values)
-                new_values[1] = keywords
+            values = self.tree.item(item, 'values')
+            file_path = values[0]
+            # A mentetlen kézi szerkesztés elsőbbséget élvez a megjelenítésben
+            if file_path in keywords_by_path and "ai_keywords" not in self.dirty_records.get(file_path, {}):
+                new_values = list(values)
+                new_values[1] = keywords_by_path[file_path]
                 self.tree.item(item, values=tuple(new_values))
-                self.save_changes_button.config(state="normal")
-                break
 
     def save_changes(self):
         if not self.dirty_records:
             messagebox.showinfo("Nincs módosítás", "Nincs elmenthető változtatás.")
             return
 
-        # Változtatások mentése az adatbázisba
-        success_count = 0
-        for file_path, changes in self.dirty_records.items():
-            for db_column, new_value in changes.items():
-                if self.db_manager.update_record(file_path, db_column, new_value):
-                    success_count += 1
-        
-        messagebox.showinfo("Siker", f"{len(self.dirty_records)} rekord sikeresen elmentve!")
-        self.dirty_records = {}
+        # Változtatások mentése az adatbázisba, egyetlen tranzakcióban, az író szálon. A mentés alatt
+        # folytatott szerkesztések is megmaradnak: csak a változatlanul elmentett sorok kerülnek ki a listából.
+        saved_records = {file_path: dict(changes) for file_path, changes in self.dirty_records.items()}
         self.save_changes_button.config(state="disabled")
+        self.submit_write(lambda result, error: self.finish_save_changes(saved_records, result, error),
+                          "update_records", saved_records)
+
+    def finish_save_changes(self, saved_records, result, error):
+        if error is not None:
+            result = (0, [(file_path, str(error)) for file_path in saved_records])
+        success_count, failures = result
+        failed_paths = {file_path for file_path, _ in failures}
+        for file_path, changes in saved_records.items():
+            if file_path not in failed_paths and self.dirty_records.get(file_path) == changes:
+                del self.dirty_records[file_path]
+        if self.dirty_records:
+            self.save_changes_button.config(state="normal")
+        self.refresh_keyword_facets()
+
+        if failures:
+            # A sikertelen sorok a memóriában maradnak, így javítás után újra menthetők
+            for file_path, message in failures[:20]:
+                self.status_text.insert(tk.END, f"Mentési hiba ({file_path}): {message}\n")
+            messagebox.showwarning("Részleges mentés", f"{success_count} rekord elmentve, {len(failures)} rekordot nem sikerült menteni. "
+                                                        "A részleteket a bal oldali szövegdobozban találod.")
+        else:
+            messagebox.showinfo("Siker", f"{success_count} rekord sikeresen elmentve!")
     
-    def on_close(self):
+    def on_close(self, save_settings=True):
+        if self.scanner is not None:
+            self.scanner.cancel()
+        if self.exporter is not None:
+            self.exporter.cancel()
+        if self.importer is not None:
+            self.importer.cancel()
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.keyword_runner is not None:
+            self.keyword_runner.cancel()
+        if self.ai_thread is not None:
+            # A már megérkezett eredmények utolsó kötegét még hagyjuk elmenteni
+            self.ai_thread.join(timeout=3.0)
+        self.preview_loader.shutdown()
+        self.thumbnail_cache.shutdown()
         # A beállítások mentése az alkalmazás bezárásakor
-        self.save_settings_from_gui()
+        if save_settings:
+            self.save_settings_from_gui()
+        # A még sorban álló írások (pl. egy folyamatban lévő mentés) véglegesülnek; a visszajelzéseik
+        # a ui_calls sorba kerülnek, így az író szál nem vár a (most itt blokkoló) Tk szálra
+        self.database.close()
         self.db_manager.close()
+        self.after_cancel(self.ui_poll_job)
         self.destroy()
 
 if __name__ == "__main__":
-    app = MainApp()
+    # --measure-startup: az indulási idők (modul betöltése, első megjelenés, első adatok) kiírása, majd kilépés
+    app = MainApp(measure_startup="--measure-startup" in sys.argv[1:])
     app.mainloop()
\ No newline at end of file
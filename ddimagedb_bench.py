@@ -0,0 +1,461 @@
+"""
+A ddImageDB teljesítménymérője: szintetikus képkönyvtárat és adatbázist generál, majd grafikus felület
+nélkül megméri a fő műveletek idejét (beolvasás, lekérdezés, mentés, exportálás, importálás, előnézet).
+
+Használat: python ddimagedb_bench.py --rows 100000 --images 1000 --output eredmeny.json [--compare elozo.json]
+
+Az eredmény JSON (a futtatási környezet adataival), így két futás (pl. egy módosítás előtt és után)
+összevethető; a --compare egy korábbi eredményhez viszonyított arányokat is kiírja.
+Nagy adatbázisnál (több millió sor) érdemes a --work-dir kapcsolót használni: a már legenerált,
+azonos méretű adatbázist a következő futás újra felhasználja.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from ddimagedb_core import DatabaseManager, FolderScanner, FileExporter, FileImporter, QueryCache
+
+OPERATIONS = ("generate", "query", "save", "export", "import", "scan", "preview")
+
+# A szintetikus kulcsszavak szókészlete; a gyakoriságuk Zipf-eloszlású, mint a valódi címkéké
+KEYWORDS = [
+    "tenger", "strand", "hegy", "erdő", "fa", "virág", "kutya", "macska", "ló", "madár", "ember", "gyerek",
+    "család", "város", "utca", "ház", "templom", "híd", "folyó", "tó", "hó", "tél", "nyár", "ősz", "tavasz",
+    "naplemente", "napkelte", "éjszaka", "felhő", "eső", "autó", "vonat", "hajó", "repülő", "étel", "kávé",
+    "sütemény", "gyümölcs", "alma", "szőlő", "bor", "sör", "koncert", "zene", "sport", "futball", "kerékpár",
+    "túra", "kemping", "sátor", "tűz", "könyv", "iroda", "számítógép", "telefon", "portré", "mosoly",
+    "esküvő", "születésnap", "torta", "ajándék", "karácsony", "húsvét", "piac", "bolt", "múzeum", "szobor",
+    "festmény", "graffiti", "park", "pad", "játszótér", "kert", "mező", "búza", "traktor", "tehén", "birka",
+    "kecske", "nyúl", "róka", "őz", "szarvas", "medve", "kígyó", "béka", "hal", "horgászat", "vitorlás",
+    "sziget", "vízesés", "barlang", "szikla", "sivatag", "pálmafa", "jég", "síelés", "korcsolya", "fesztivál"
+]
+
+# A tipikus GUI-szűrések; a lekérdezésmérés mindegyiket lefuttatja
+# A synthetic_rows() adatformátumának verziója; változásakor a --work-dir korábbi adatbázisai nem használhatók újra
+SYNTHETIC_DATA_VERSION = 2
+
+QUERY_SCENARIOS = {
+    "all": {},
+    "keyword_common": {"filter_queries": {"ai_keywords": "tenger"}},
+    "keyword_rare": {"filter_queries": {"ai_keywords": "vízesés"}},
+    "keyword_relevance": {"filter_queries": {"ai_keywords": "kutya macska"}, "order_by": "relevance"},
+    "path": {"filter_queries": {"file_path": "album_07"}},
+    "used_date_range": {
+        "filter_queries": {"used": 1},
+        "date_filter": {"type": "Közte", "from": "2023.01.01", "to": "2023.12.31"},
+        "order_by": "used_date",
+        "order_direction": "DESC"
+    },
+    "sort_keywords_desc": {"order_by": "ai_keywords", "order_direction": "DESC"},
+    "keyword_by_used_date": {"filter_queries": {"ai_keywords": "tenger"}, "order_by": "used_date", "order_direction": "DESC"},
+    "tags_include_two": {"filter_queries": {"keywords_include": ["tenger", "strand"]}},
+    "tags_include_exclude": {"filter_queries": {"keywords_include": ["tenger"], "keywords_exclude": ["strand", "kutya"]}}
+}
+
+
+def log(message):
+    sys.stderr.write(message + "\n")
+    sys.stderr.flush()
+
+
+def measure(results, name, function, repeat=1, **extra):
+    """
+    Lefuttatja a függvényt repeat-szer, és az időket (másodperc) a results[name] alá jegyzi.
+    A függvény visszatérési értéke (dict) a kiegészítő adatok közé kerül (pl. sorok száma).
+    """
+    times = []
+    info = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        info = function() or {}
+        times.append(time.perf_counter() - start)
+    results[name] = dict(extra, **info, seconds=[round(t, 6) for t in times], median=round(statistics.median(times), 6),
+                         min=round(min(times), 6))
+    log(f"{name}: {results[name]['median']:.4f} s")
+    return results[name]
+
+
+def random_keywords(rng, weights):
+    keywords = rng.choices(KEYWORDS, weights=weights, k=rng.randint(3, 8))
+    return ", ".join(dict.fromkeys(keywords))
+
+
+def synthetic_path(i):
+    return f"/bench/album_{i % 97:02d}/{i // 1000:05d}/IMG_{i:08d}.jpg"
+
+
+def synthetic_rows(rows, seed):
+    """
+    Szintetikus files sorok: mappákba rendezett útvonalak, kulcsszavak, a sorok ~20%-a felhasználva.
+    A felhasznált sorok kis része hibás dátumot kap (nem nullákkal kiegészített, illetve üres), mint a kézzel
+    szerkesztett adatbázisokban; ezeknek nincs used_day értéke.
+    """
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(len(KEYWORDS))]
+    first_day = date(2020, 1, 1)
+    for i in range(rows):
+        file_path = synthetic_path(i)
+        ai_keywords = random_keywords(rng, weights) if rng.random() < 0.9 else ""
+        if rng.random() < 0.2:
+            day = first_day + timedelta(days=rng.randrange(6 * 365))
+            used_date = day.strftime("%Y.%m.%d")
+            if i % 50 == 0:
+                used_date = f"{day.year}.{day.month}.{day.day}"
+            elif i % 50 == 1:
+                used_date = ""
+            used = 1
+        else:
+            used_date = ""
+            used = 0
+        yield file_path, ai_keywords, used_date, used
+
+
+def generate_database(work_dir, rows, seed, results):
+    """
+    Az érintetlen mérési adatbázis. Az azonos sorszámmal, maggal és adatformátummal korábban generáltat
+    újra felhasználja (az import_new_rows ilyenkor kihagyottként szerepel az eredményben), egyébként
+    CSV-be generálja a sorokat, és a tömeges importtal tölti be (ez egyben az import mérése is).
+    A mérések nem ezt, hanem a working_copy() másolatát használják, így ez sosem módosul.
+    """
+    db_name = os.path.join(work_dir, f"bench_r{rows}_s{seed}_v{SYNTHETIC_DATA_VERSION}.db")
+    if os.path.exists(db_name):
+        log(f"A meglévő adatbázis újrafelhasználva ({rows} sor, mag: {seed}): {db_name}")
+        results["import_new_rows"] = {"skipped": "reused_database", "database": os.path.basename(db_name)}
+        return db_name
+
+    # Félbeszakadt generálás után ne maradjon újrafelhasználható, de hiányos adatbázis
+    partial_name = db_name + ".part"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(partial_name + suffix):
+            os.remove(partial_name + suffix)
+    csv_path = os.path.join(work_dir, "generated.csv")
+    log(f"{rows} szintetikus sor generálása...")
+    start = time.perf_counter()
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file_path", "ai_keywords", "used_date", "used"])
+        writer.writerows(synthetic_rows(rows, seed))
+    generate_seconds = time.perf_counter() - start
+    DatabaseManager(partial_name).close()
+    measure(results, "import_new_rows", lambda: summarize_import(FileImporter(partial_name, csv_path).run()),
+            generate_csv_seconds=round(generate_seconds, 3))
+    os.remove(csv_path)
+    os.replace(partial_name, db_name)
+    return db_name
+
+
+def working_copy(db_name, work_dir):
+    """
+    Az érintetlen adatbázis friss másolata ehhez a futáshoz. A mentés és az importálás ezt módosítja,
+    így minden futás ugyanabból az állapotból indul, és az eredmények összevethetők.
+    """
+    copy_name = os.path.join(work_dir, "run.db")
+    remove_database(copy_name)
+    source = sqlite3.connect(db_name)
+    target = sqlite3.connect(copy_name)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return copy_name
+
+
+def remove_database(db_name):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_name + suffix):
+            os.remove(db_name + suffix)
+
+
+def summarize_import(stats):
+    return {key: stats[key] for key in ("rows", "inserted", "updated", "unchanged", "skipped")}
+
+
+def toggle_views(db, cache, query):
+    """
+    Fejlécre kattintás a GUI-ban: minden rendezhető oszlop mindkét irányban, találatszám és első oldal.
+    """
+    count_query = {key: value for key, value in query.items() if key in ("filter_queries", "date_filter")}
+    rows = 0
+    for order_by in QueryCache.MEMORY_SORT_COLUMNS:
+        for order_direction in ("ASC", "DESC"):
+            cache.count_files(db, **count_query)
+            rows += len(cache.fetch_files(db, 200, **dict(query, order_by=order_by, order_direction=order_direction)))
+    return {"rows": rows}
+
+
+def check_keyset_paging(db, results, page_size=50):
+    """
+    Helyességi ellenőrzés: a keyset lapozás (iter_files kis oldalakkal, mint a táblázat görgetése) ugyanazokat
+    a sorokat adja ugyanabban a sorrendben, mint egyetlen lekérdezés. Eltérésnél a mérés hibával leáll.
+    """
+    mismatches = []
+    checked = 0
+    for scenario, query in QUERY_SCENARIOS.items():
+        for order_direction in ("ASC", "DESC"):
+            paged_query = dict(query, order_direction=order_direction)
+            expected = db.fetch_files(None, **paged_query)
+            paged = list(db.iter_files(page_size=page_size, **paged_query))
+            checked += 1
+            if paged != expected:
+                mismatches.append({"scenario": scenario, "order_direction": order_direction,
+                                   "expected_rows": len(expected), "paged_rows": len(paged)})
+    results["keyset_paging_check"] = {"queries": checked, "mismatches": mismatches}
+    if mismatches:
+        raise RuntimeError(f"A keyset lapozás eltér a teljes lekérdezéstől: {mismatches}")
+    log(f"keyset_paging_check: {checked} lekérdezés rendben")
+
+
+def bench_queries(db_name, repeat, results):
+    """
+    A GUI táblázatbetöltésének lépései szűrésenként: találatszám, első oldal, görgetés 20 oldalon át,
+    a kulcsszópanel gyakorisági listája, valamint a rendezés váltogatása üres és feltöltött QueryCache-sel.
+    """
+    db = DatabaseManager(db_name, error_handler=lambda title, message: log(f"{title}: {message}"))
+    try:
+        check_keyset_paging(db, results)
+        for scenario, query in QUERY_SCENARIOS.items():
+            count_query = {key: value for key, value in query.items() if key in ("filter_queries", "date_filter")}
+            measure(results, f"query_count[{scenario}]", lambda: {"count": db.count_files(**count_query)}, repeat)
+            measure(results, f"query_first_page[{scenario}]", lambda: {"rows": len(db.fetch_files(200, **query))}, repeat)
+            measure(results, f"query_scroll_20_pages[{scenario}]",
+                    lambda: {"rows": sum(1 for _ in db.iter_files(limit=4000, page_size=200, **query))}, repeat)
+            measure(results, f"keyword_facets[{scenario}]", lambda: {"keywords": len(db.fetch_keyword_facets(**count_query))}, repeat)
+            measure(results, f"view_toggles_cold[{scenario}]", lambda: toggle_views(db, QueryCache(), query), repeat)
+            warm_cache = QueryCache()
+            toggle_views(db, warm_cache, query)
+            measure(results, f"view_toggles_cached[{scenario}]", lambda: toggle_views(db, warm_cache, query), repeat)
+    finally:
+        db.close()
+
+
+def bench_save(db_name, rows, seed, results, changes=1000):
+    """
+    A "Változtatások mentése": véletlenszerű sorok kulcsszavainak és felhasználási adatainak módosítása.
+    """
+    rng = random.Random(seed + 1)
+    today = datetime.now().strftime("%Y.%m.%d")
+    sample_paths = [synthetic_path(i) for i in rng.sample(range(rows), min(changes, rows))]
+    dirty_records = {
+        path: {"ai_keywords": f"módosított, {KEYWORDS[i % len(KEYWORDS)]}", "used": 1, "used_date": today}
+        for i, path in enumerate(sample_paths)
+    }
+    db = DatabaseManager(db_name)
+    try:
+        def save():
+            success_count, failures = db.update_records(dirty_records)
+            return {"records": success_count, "failures": len(failures)}
+        measure(results, "save_changes", save, records_requested=len(dirty_records))
+    finally:
+        db.close()
+
+
+def bench_export(db_name, work_dir, results):
+    output_paths = {}
+    for export_format in ("csv", "jsonl"):
+        output_path = os.path.join(work_dir, f"export.{export_format}")
+        stats = measure(results, f"export_{export_format}", lambda: {"rows": FileExporter(db_name, output_path).run()["rows"]})
+        stats["bytes"] = os.path.getsize(output_path)
+        output_paths[export_format] = output_path
+    return output_paths
+
+
+def bench_import(db_name, export_paths, results):
+    """
+    A saját export visszatöltése: változatlan sorok (a gyakori mentés-visszaállítás eset) és kulcsszó-egyesítés.
+    """
+    measure(results, "import_unchanged_csv", lambda: summarize_import(FileImporter(db_name, export_paths["csv"]).run()))
+    measure(results, "import_merge_keywords_jsonl",
+            lambda: summarize_import(FileImporter(db_name, export_paths["jsonl"], merge_rules={"ai_keywords": "merge"}).run()))
+    for export_path in export_paths.values():
+        os.remove(export_path)
+
+
+def generate_image_tree(root, images, seed, files_per_dir=200):
+    """
+    Szintetikus képkönyvtár: változatos méretű és tartalmú JPEG és PNG képek mappákba rendezve,
+    néhány bájtra azonos másolattal (a pontos másolatok kereséséhez).
+    """
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    created = []
+    for i in range(images):
+        dir_path = os.path.join(root, f"album_{i // files_per_dir:03d}")
+        if i % files_per_dir == 0:
+            os.makedirs(dir_path, exist_ok=True)
+        if created and rng.random() < 0.03:
+            source = rng.choice(created)
+            target = os.path.join(dir_path, f"copy_{i:06d}" + os.path.splitext(source)[1])
+            shutil.copyfile(source, target)
+            continue
+        width, height = rng.choice([(640, 480), (1024, 768), (1600, 1200), (480, 640)])
+        image = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x0, y0 = rng.randrange(width), rng.randrange(height)
+            draw.ellipse([x0, y0, x0 + rng.randrange(20, width // 2), y0 + rng.randrange(20, height // 2)],
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        extension = ".png" if i % 10 == 0 else ".jpg"
+        path = os.path.join(dir_path, f"IMG_{i:06d}{extension}")
+        if extension == ".jpg":
+            image.save(path, quality=85)
+        else:
+            image.save(path)
+        created.append(path)
+    return created
+
+
+def bench_scan(work_dir, images, seed, results):
+    """
+    Mappák beolvasása a szintetikus képkönyvtáron (külön adatbázisba): első, teljes beolvasás hash-ekkel,
+    majd változatlan könyvtár növekményes újraolvasása.
+    """
+    tree_root = os.path.join(work_dir, "images")
+    if not os.path.isdir(tree_root):
+        log(f"{images} szintetikus kép generálása...")
+        start = time.perf_counter()
+        generate_image_tree(tree_root, images, seed)
+        results["generate_images"] = {"images": images, "seconds": [round(time.perf_counter() - start, 3)]}
+    scan_db = os.path.join(work_dir, "scan.db")
+    if os.path.exists(scan_db):
+        os.remove(scan_db)
+
+    def scan(incremental):
+        stats = FolderScanner(scan_db, incremental=incremental).scan([tree_root])
+        return {key: stats[key] for key in ("new", "modified", "missing", "hashed") if key in stats}
+
+    measure(results, "scan_full", lambda: scan(False))
+    measure(results, "scan_incremental_unchanged", lambda: scan(True))
+    os.remove(scan_db)
+    return tree_root
+
+
+def bench_preview(tree_root, work_dir, repeat, results, samples=50):
+    """
+    Az előnézet (display_image) képfeldolgozó része: bélyegkép készítése az eredeti képből (hideg),
+    illetve betöltése a lemezes gyorsítótárból (meleg). A Tk PhotoImage létrehozása nem része a mérésnek.
+    """
+    try:
+        from ddImageDB import ThumbnailCache
+    except ImportError as e:
+        results["preview"] = {"skipped": f"A ddImageDB modul nem tölthető be: {e}"}
+        log(results["preview"]["skipped"])
+        return
+    image_paths = sorted(os.path.join(dir_path, name) for dir_path, _, names in os.walk(tree_root) for name in names)
+    image_paths = random.Random(0).sample(image_paths, min(samples, len(image_paths)))
+    cache_dir = os.path.join(work_dir, "thumbnails")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    cache = ThumbnailCache(cache_dir=cache_dir)
+    try:
+        def load_all():
+            for image_path in image_paths:
+                cache.load_thumbnail(image_path)
+            return {"images": len(image_paths)}
+        cold = measure(results, "preview_cold", load_all)
+        warm = measure(results, "preview_warm", load_all, repeat)
+        cold["per_image_ms"] = round(cold["median"] * 1000 / max(len(image_paths), 1), 3)
+        warm["per_image_ms"] = round(warm["median"] * 1000 / max(len(image_paths), 1), 3)
+    finally:
+        cache.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def environment_info():
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def compare_results(current, previous_path):
+    """
+    Műveletenként a medián idők aránya egy korábbi eredményfájlhoz képest (1.0 alatt gyorsabb lett).
+    """
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    comparison = {}
+    for name, old in previous.get("results", {}).items():
+        if not old.get("median"):
+            continue
+        result = current["results"].get(name)
+        if not result or "median" not in result:
+            # A kimaradt mérés is látsszon az összevetésben (pl. újrafelhasznált adatbázisnál az import_new_rows)
+            reason = (result or {}).get("skipped", "not_run")
+            comparison[name] = {"previous": old["median"], "current": None, "skipped": reason}
+            log(f"{name}: {old['median']:.4f} s -> nincs mérés ({reason})")
+            continue
+        comparison[name] = {"previous": old["median"], "current": result["median"], "ratio": round(result["median"] / old["median"], 3)}
+        log(f"{name}: {old['median']:.4f} s -> {result['median']:.4f} s ({comparison[name]['ratio']}x)")
+    return comparison
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ddimagedb_bench", description="A ddImageDB fő műveleteinek teljesítménymérése.")
+    parser.add_argument("--rows", type=int, default=10000, help="A szintetikus adatbázis sorainak száma (alapból 10000)")
+    parser.add_argument("--images", type=int, default=500, help="A szintetikus képkönyvtár képeinek száma (alapból 500)")
+    parser.add_argument("--only", nargs="+", choices=OPERATIONS, help="Csak ezek a mérések (alapból mind)")
+    parser.add_argument("--repeat", type=int, default=3, help="Az olvasó műveletek ismétlésszáma (a medián számít)")
+    parser.add_argument("--seed", type=int, default=1, help="A véletlen generátor magja (azonos maggal azonos adatok)")
+    parser.add_argument("--work-dir", help="Munkakönyvtár az adatbázisnak és a képeknek (megmarad, és újrafelhasználható)")
+    parser.add_argument("--output", help="Az eredmény JSON fájl (alapból a standard kimenet)")
+    parser.add_argument("--compare", metavar="JSON", help="Egy korábbi eredményfájl az összevetéshez")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    operations = set(args.only or OPERATIONS)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ddimagedb_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    report = {"environment": environment_info(), "parameters": {"rows": args.rows, "images": args.images, "repeat": args.repeat,
+                                                                "seed": args.seed}, "results": {}}
+    results = report["results"]
+    try:
+        if operations & {"generate", "query", "save", "export", "import"}:
+            db_name = working_copy(generate_database(work_dir, args.rows, args.seed, results), work_dir)
+            if "query" in operations:
+                bench_queries(db_name, args.repeat, results)
+            if "export" in operations or "import" in operations:
+                export_paths = bench_export(db_name, work_dir, results)
+                if "import" in operations:
+                    bench_import(db_name, export_paths, results)
+            # A mentés módosítja az adatokat, ezért a végére kerül
+            if "save" in operations:
+                bench_save(db_name, args.rows, args.seed, results)
+        if operations & {"scan", "preview"}:
+            tree_root = bench_scan(work_dir, args.images, args.seed, results) if "scan" in operations else os.path.join(work_dir, "images")
+            if "preview" in operations:
+                if not os.path.isdir(tree_root):
+                    generate_image_tree(tree_root, args.images, args.seed)
+                bench_preview(tree_root, work_dir, args.repeat, results)
+    finally:
+        if args.work_dir:
+            remove_database(os.path.join(work_dir, "run.db"))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.compare:
+        report["comparison"] = compare_results(report, args.compare)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
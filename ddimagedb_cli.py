@@ -0,0 +1,312 @@
+"""
+A ddImageDB parancssori felülete grafikus felület nélküli futtatáshoz (pl. cron, szerver).
+
+Használat: python ddimagedb_cli.py [--db app_database.db] [--config config.json] <parancs> ...
+
+A folyamat állapota JSON sorokként a standard hibakimenetre kerül ({"event": "progress", ...}),
+a parancs eredménye a standard kimenetre ({"event": "done", ...}); a query parancs a találatokat
+JSON sorokként (vagy CSV-ként) írja ki.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+from ddimagedb_core import (
+    SettingsManager, DatabaseManager, FolderScanner, KeywordJobRunner, EXPORT_COLUMNS,
+    FileExporter, EXPORT_FORMATS, FileImporter, IMPORT_MERGE_RULES, check_ai_settings, mark_used, group_near_duplicates,
+    diagnostics, configure_diagnostics
+)
+
+
+def emit(event, stream=sys.stdout, **data):
+    stream.write(json.dumps(dict(data, event=event), ensure_ascii=False) + "\n")
+    stream.flush()
+
+
+def progress_emitter(args, command):
+    if args.progress == "none":
+        return None
+    return lambda stats: emit("progress", sys.stderr, command=command, **stats)
+
+
+def load_folders(args, settings):
+    if args.folders:
+        # Az adatbázis abszolút útvonalakat tárol, ahogy a GUI-ban megadott mappák is
+        return [os.path.abspath(folder) for folder in args.folders]
+    return [f.strip() for f in settings.get("folders", "").split('\n') if f.strip()]
+
+
+def cmd_scan(args, settings):
+    folders = load_folders(args, settings)
+    if not folders:
+        emit("error", sys.stderr, message="Nincs beolvasandó mappa (--folders vagy a beállítások 'folders' értéke).")
+        return 2
+    scanner = FolderScanner(
+        args.db,
+        progress_callback=progress_emitter(args, "scan"),
+        incremental=not args.full,
+        missing_policy=settings.get("missing_files_policy", "mark"),
+        compute_hashes=not args.no_hashes
+    )
+    stats = scanner.scan(folders)
+    emit("done", command="scan", **dict(stats, errors=stats["errors"]))
+    return 1 if stats["errors"] else 0
+
+
+def cmd_tag(args, settings):
+    error = check_ai_settings(settings)
+    if error:
+        emit("error", sys.stderr, message=error)
+        return 2
+    db = DatabaseManager(args.db)
+    try:
+        # Csak a lejárt bérletű (megszakadt) feladatok folytathatók; a más folyamatban futókat nem érinti
+        db.reset_interrupted_ai_jobs()
+        if args.paths and not db.enqueue_ai_jobs([os.path.abspath(path) for path in args.paths]):
+            return 1
+    finally:
+        db.close()
+
+    counts = {"done": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def on_results(saved, errors):
+        with lock:
+            counts["done"] += len(saved)
+            counts["failed"] += len(errors)
+            if args.progress != "none":
+                for file_path, error in errors:
+                    emit("file_error", sys.stderr, command="tag", file_path=file_path, message=error)
+                emit("progress", sys.stderr, command="tag", **counts)
+
+    stats = KeywordJobRunner(args.db, settings, results_callback=on_results).run()
+    emit("done", command="tag", **stats)
+    return 1 if stats["error"] or stats["failed"] else 0
+
+
+def build_query(args):
+    filter_queries = {}
+    if args.path:
+        filter_queries["file_path"] = args.path
+    if args.keywords:
+        filter_queries["ai_keywords"] = args.keywords
+    if args.used is not None:
+        filter_queries["used"] = 1 if args.used == "yes" else 0
+    if args.tag:
+        filter_queries["keywords_include"] = args.tag
+    if args.exclude_tag:
+        filter_queries["keywords_exclude"] = args.exclude_tag
+    if args.include_missing:
+        filter_queries["include_missing"] = True
+
+    # A GUI dátumszűrő típusai
+    if args.used_after and args.used_before:
+        date_filter = {"type": "Közte", "from": args.used_after, "to": args.used_before}
+    elif args.used_after:
+        date_filter = {"type": "Későbbi, mint", "from": args.used_after, "to": ""}
+    elif args.used_before:
+        date_filter = {"type": "Korábbi, mint", "from": args.used_before, "to": ""}
+    else:
+        date_filter = {"type": "Nincs", "from": "", "to": ""}
+
+    order_by = args.order_by
+    if order_by == "relevance" and "ai_keywords" not in filter_queries:
+        order_by = "file_path"
+    return {
+        "filter_queries": filter_queries,
+        "date_filter": date_filter,
+        "logical_operator": "OR" if args.any else "AND",
+        "order_by": order_by,
+        "order_direction": "DESC" if args.desc else "ASC"
+    }
+
+
+def cmd_query(args, settings):
+    db = DatabaseManager(args.db)
+    try:
+        query = build_query(args)
+        if args.count:
+            emit("done", command="query", count=db.count_files(query["filter_queries"], query["date_filter"], query["logical_operator"]))
+            return 0
+        writer = None
+        if args.format == "csv":
+            writer = csv.writer(sys.stdout)
+            writer.writerow(EXPORT_COLUMNS)
+        for row in db.iter_files(limit=args.limit, **query):
+            if writer is not None:
+                writer.writerow(row)
+            elif args.format == "paths":
+                sys.stdout.write(row[0] + "\n")
+            else:
+                sys.stdout.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n")
+    finally:
+        db.close()
+    return 0
+
+
+def cmd_keywords(args, settings):
+    db = DatabaseManager(args.db)
+    try:
+        query = build_query(args)
+        facets = db.fetch_keyword_facets(query["filter_queries"], query["date_filter"], query["logical_operator"], limit=args.limit)
+    finally:
+        db.close()
+    for keyword, count in facets:
+        sys.stdout.write(json.dumps({"keyword": keyword, "count": count}, ensure_ascii=False) + "\n")
+    return 0
+
+
+def cmd_export(args, settings):
+    exporter = FileExporter(args.db, args.output, export_format=args.format, query=build_query(args),
+                            progress_callback=progress_emitter(args, "export"))
+    try:
+        stats = exporter.run()
+    except (RuntimeError, OSError) as e:
+        emit("error", sys.stderr, message=str(e))
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    emit("done", command="export", **stats)
+    return 0
+
+
+def cmd_import(args, settings):
+    merge_rules = {}
+    for item in args.merge or []:
+        column, _, rule = item.partition("=")
+        merge_rules[column.strip()] = rule.strip()
+    try:
+        importer = FileImporter(args.db, args.input, import_format=args.format, merge_rules=merge_rules,
+                                progress_callback=progress_emitter(args, "import"))
+        stats = importer.run()
+    except (ValueError, OSError, sqlite3.Error) as e:
+        emit("error", sys.stderr, message=str(e))
+        return 2 if isinstance(e, ValueError) else 1
+    except KeyboardInterrupt:
+        return 130
+    emit("done", command="import", **stats)
+    return 1 if stats["skipped"] else 0
+
+
+def cmd_mark_used(args, settings):
+    db = DatabaseManager(args.db)
+    try:
+        file_paths = [os.path.abspath(path) for path in args.paths]
+        success_count, failures = mark_used(db, file_paths, used=not args.unset, used_date=args.date)
+    finally:
+        db.close()
+    emit("done", command="mark-used", updated=success_count,
+         failures=[{"file_path": file_path, "message": message} for file_path, message in failures])
+    return 1 if failures else 0
+
+
+def cmd_duplicates(args, settings):
+    db = DatabaseManager(args.db)
+    try:
+        if args.near is None:
+            groups = {}
+            for content_hash, file_path, size in db.fetch_exact_duplicates():
+                groups.setdefault(content_hash, []).append(file_path)
+            groups = list(groups.values())
+        else:
+            groups = [[file_path for file_path, _ in group] for group in group_near_duplicates(db.fetch_perceptual_hashes(), args.near)]
+    finally:
+        db.close()
+    for group in groups:
+        sys.stdout.write(json.dumps(group, ensure_ascii=False) + "\n")
+    return 0
+
+
+def add_filter_arguments(parser):
+    parser.add_argument("--path", help="Fájl útvonal részlet")
+    parser.add_argument("--keywords", help="Kulcsszó keresés (mint a GUI szűrőmezője)")
+    parser.add_argument("--tag", action="append", metavar="KULCSSZÓ",
+                        help="Csak az ezzel a kulcsszóval rendelkező képek (többször is megadható, mindegyik kell)")
+    parser.add_argument("--exclude-tag", action="append", metavar="KULCSSZÓ", help="Az ezzel a kulcsszóval rendelkező képek kihagyása")
+    parser.add_argument("--used", choices=["yes", "no"], help="Felhasználva")
+    parser.add_argument("--used-after", help="Felhasználás dátuma ettől (ÉÉÉÉ.HH.NN)")
+    parser.add_argument("--used-before", help="Felhasználás dátuma eddig (ÉÉÉÉ.HH.NN)")
+    parser.add_argument("--any", action="store_true", help="A szűrők VAGY kapcsolata (alapból ÉS)")
+    parser.add_argument("--include-missing", action="store_true", help="Az eltűntként megjelölt fájlok is (alapból kimaradnak)")
+    parser.add_argument("--order-by", choices=["file_path", "ai_keywords", "used_date", "used", "relevance"], default="file_path")
+    parser.add_argument("--desc", action="store_true", help="Csökkenő sorrend")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ddimagedb", description="Képadatbázis kezelése grafikus felület nélkül.")
+    parser.add_argument("--db", default="app_database.db", help="Az SQLite adatbázis fájl (alapértelmezés: app_database.db)")
+    parser.add_argument("--config", default="config.json", help="A beállítások fájlja (alapértelmezés: config.json)")
+    parser.add_argument("--progress", choices=["json", "none"], default="json", help="Állapotjelzés a standard hibakimenetre")
+    parser.add_argument("--diagnostics", nargs="?", const="", metavar="NAPLÓ",
+                        help="Időmérés és lassú lekérdezések; a végén összesítés a hibakimenetre (NAPLÓ: JSONL naplófájl)")
+    parser.add_argument("--slow-query-ms", type=float, default=100, help="Ennél lassabb lekérdezések tervének naplózása (ms)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = subparsers.add_parser("scan", help="Mappák beolvasása")
+    scan_parser.add_argument("--folders", nargs="+", help="Gyökérmappák (alapból a beállítások szerint)")
+    scan_parser.add_argument("--full", action="store_true", help="Teljes újraolvasás (a változatlan mappákat is)")
+    scan_parser.add_argument("--no-hashes", action="store_true", help="A perceptuális és tartalmi hash-ek kihagyása")
+    scan_parser.set_defaults(handler=cmd_scan)
+
+    tag_parser = subparsers.add_parser("tag", help="AI kulcsszavak generálása (a befejezetlen feladatok folytatásával)")
+    tag_parser.add_argument("paths", nargs="*", help="A feladatsorba felveendő fájlok")
+    tag_parser.set_defaults(handler=cmd_tag)
+
+    query_parser = subparsers.add_parser("query", help="Szűrt lekérdezés")
+    add_filter_arguments(query_parser)
+    query_parser.add_argument("--limit", type=int, help="Legfeljebb ennyi sor")
+    query_parser.add_argument("--format", choices=["jsonl", "csv", "paths"], default="jsonl")
+    query_parser.add_argument("--count", action="store_true", help="Csak a találatok száma")
+    query_parser.set_defaults(handler=cmd_query)
+
+    keywords_parser = subparsers.add_parser("keywords", help="A leggyakoribb kulcsszavak a szűrt képek között (soronként egy JSON)")
+    add_filter_arguments(keywords_parser)
+    keywords_parser.add_argument("--limit", type=int, default=100, help="Legfeljebb ennyi kulcsszó (alapból 100)")
+    keywords_parser.set_defaults(handler=cmd_keywords)
+
+    export_parser = subparsers.add_parser("export", help="Exportálás CSV, JSONL vagy Parquet formátumba (szűrők nélkül a teljes adatbázis)")
+    export_parser.add_argument("output", help="A kimeneti fájl útvonala")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, help="Formátum (alapból a kiterjesztés szerint)")
+    add_filter_arguments(export_parser)
+    export_parser.set_defaults(handler=cmd_export)
+
+    import_parser = subparsers.add_parser("import", help="Tömeges importálás CSV vagy JSONL fájlból (az export formátumában)")
+    import_parser.add_argument("input", help="A bemeneti fájl útvonala")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], help="Formátum (alapból a kiterjesztés szerint)")
+    import_parser.add_argument("--merge", action="append", metavar="OSZLOP=SZABÁLY",
+                               help=f"Egyesítési szabály meglévő sorokra ({', '.join(IMPORT_MERGE_RULES)}; alapból update), "
+                                    "pl. --merge ai_keywords=merge --merge used=keep")
+    import_parser.set_defaults(handler=cmd_import)
+
+    mark_parser = subparsers.add_parser("mark-used", help="Fájlok megjelölése felhasználtként")
+    mark_parser.add_argument("paths", nargs="+")
+    mark_parser.add_argument("--unset", action="store_true", help="Felhasználva: Nem (a dátum törlése)")
+    mark_parser.add_argument("--date", help="A felhasználás dátuma (ÉÉÉÉ.HH.NN, alapból a mai nap)")
+    mark_parser.set_defaults(handler=cmd_mark_used)
+
+    duplicates_parser = subparsers.add_parser("duplicates", help="Másolatcsoportok listázása (soronként egy JSON lista)")
+    duplicates_parser.add_argument("--near", type=int, metavar="BIT", help="Közeli másolatok legfeljebb ennyi bit eltéréssel (alapból: pontos másolatok)")
+    duplicates_parser.set_defaults(handler=cmd_duplicates)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    settings = SettingsManager(args.config).load_settings()
+    if args.diagnostics is not None:
+        diagnostics.configure(True, args.slow_query_ms, args.diagnostics or None)
+    else:
+        configure_diagnostics(settings)
+    try:
+        return args.handler(args, settings)
+    finally:
+        if diagnostics.enabled:
+            emit("diagnostics", sys.stderr, operations=diagnostics.snapshot(), slow_queries=diagnostics.slow_queries())
+            diagnostics.configure(False)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3633 @@
+"""
+A ddImageDB grafikus felület nélküli magja: adatbázis, mappabeolvasás és -figyelés, hash-ek,
+AI kulcsszó-generálás és exportálás. A Tkinter alkalmazás (ddImageDB.py) és a parancssori
+felület (ddimagedb_cli.py) is ezt használja.
+"""
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import threading
+import csv
+import time
+import sys
+import select
+import ctypes
+import ctypes.util
+import struct
+import re
+import hashlib
+import queue
+import io
+import base64
+import random
+import urllib.request
+import urllib.error
+import bisect
+import contextlib
+import functools
+import inspect
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+
+def print_error(title, message):
+    """
+    Alapértelmezett hibakezelő grafikus felület nélkül: a standard hibakimenetre ír.
+    """
+    print(f"{title}: {message}", file=sys.stderr)
+
+
+# --- Diagnosztika ---
+class OperationStats:
+    """
+    Egy művelet (vagy SQL utasításfajta) futásidejei: összesített darabszám, idő és sorszám, valamint
+    a legutóbbi futások gördülő ablaka, amelyből a percentilisek és a hisztogram számolódnak.
+    """
+    BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds, rows=None):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if rows:
+            self.rows += rows
+        self.recent.append(seconds)
+
+    def summary(self):
+        recent_ms = sorted(seconds * 1000 for seconds in self.recent)
+
+        def percentile(fraction):
+            return round(recent_ms[min(len(recent_ms) - 1, int(fraction * len(recent_ms)))], 3) if recent_ms else 0.0
+
+        histogram = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+        for value in recent_ms:
+            histogram[bisect.bisect_left(self.BUCKET_BOUNDS_MS, value)] += 1
+        labels = [f"<={bound} ms" for bound in self.BUCKET_BOUNDS_MS] + [f">{self.BUCKET_BOUNDS_MS[-1]} ms"]
+        return {
+            "count": self.count,
+            "total_s": round(self.total_seconds, 6),
+            "mean_ms": round(self.total_seconds * 1000 / self.count, 3) if self.count else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "rows": self.rows,
+            "histogram": dict(zip(labels, histogram))
+        }
+
+
+class Diagnostics:
+    """
+    Bekapcsolható teljesítménymérés (alapból ki van kapcsolva, ilyenkor szinte semmibe sem kerül):
+    - a DatabaseManager minden nyilvános hívásának és minden SQL utasításának ideje és sorszáma,
+    - a hosszú műveletek (beolvasás, AI kérés, bélyegkép dekódolás, export, import) ideje,
+    - a lassú lekérdezések SQL-je, paraméterei és EXPLAIN QUERY PLAN kimenete.
+    Műveletenként gördülő késleltetési hisztogramot tart; a hosszú műveletek és a lassú hívások
+    JSON sorokként egy naplófájlba is kerülhetnek. Több szálról is használható.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.slow_seconds = 0.1
+        self.log_path = None
+        self._log_file = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._slow_queries = deque(maxlen=200)
+
+    def configure(self, enabled=True, slow_query_ms=100, log_path=None):
+        with self._lock:
+            if self._log_file is not None and (not enabled or log_path != self.log_path):
+                self._log_file.close()
+                self._log_file = None
+            self.slow_seconds = slow_query_ms / 1000.0
+            self.log_path = log_path or None
+            if enabled and self.log_path and self._log_file is None:
+                try:
+                    self._log_file = open(self.log_path, "a", encoding="utf-8")
+                except OSError as e:
+                    print_error("Diagnosztika", f"A naplófájl nem nyitható meg: {e}")
+            self.enabled = enabled
+
+    def record(self, name, seconds, rows=None, log=False, **fields):
+        """
+        Egy mérés feljegyzése. A naplóba a log=True mérések és a lassú (slow_seconds feletti) hívások kerülnek.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = OperationStats()
+            stats.add(seconds, rows)
+        if log or seconds >= self.slow_seconds:
+            self.write_log(dict(fields, event="timing", name=name, seconds=round(seconds, 6), rows=rows))
+
+    def record_statement(self, connection, sql, parameters, seconds, rows):
+        """
+        Egy SQL utasítás mérése (végrehajtás és a sorok lekérése együtt). Lassú lekérdezésnél a végrehajtási
+        terv is feljegyződik.
+        """
+        self.record(statement_name(sql), seconds, rows)
+        if seconds < self.slow_seconds:
+            return
+        plan = []
+        if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            try:
+                plan = [row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, parameters or ()).fetchall()]
+            except sqlite3.Error as e:
+                plan = [f"(a terv nem kérhető le: {e})"]
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "thread": threading.current_thread().name,
+            "sql": " ".join(sql.split()),
+            "parameters": repr(parameters)[:500] if parameters is not None else None,
+            "seconds": round(seconds, 6),
+            "rows": rows,
+            "plan": plan
+        }
+        with self._lock:
+            self._slow_queries.append(entry)
+        self.write_log(dict(entry, event="slow_query"))
+
+    @contextlib.contextmanager
+    def measure(self, name, **fields):
+        """
+        Egy hosszú művelet mérése: with diagnostics.measure("export") as record: ... record["rows"] = n
+        A record további kulcsai a naplóbejegyzésbe kerülnek.
+        """
+        record = dict(fields)
+        if not self.enabled:
+            yield record
+            return
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            rows = record.pop("rows", None)
+            self.record(name, time.perf_counter() - start, rows, log=True, **record)
+
+    def timed(self, name, rows=None):
+        """
+        Dekorátor a measure() köré; rows(eredmény) a feldolgozott sorok száma.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.measure(name) as record:
+                    result = function(*args, **kwargs)
+                    if rows is not None:
+                        record["rows"] = rows(result)
+                    return result
+            return wrapper
+        return decorator
+
+    def write_log(self, entry):
+        with self._lock:
+            if self._log_file is None:
+                return
+            try:
+                self._log_file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                self._log_file.flush()
+            except OSError:
+                pass
+
+    def snapshot(self):
+        """ {művelet neve: összesítés} a legtöbb összidőt igénylő művelettel kezdve. """
+        with self._lock:
+            summaries = {name: stats.summary() for name, stats in self._stats.items()}
+        return dict(sorted(summaries.items(), key=lambda item: -item[1]["total_s"]))
+
+    def slow_queries(self):
+        with self._lock:
+            return list(self._slow_queries)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._slow_queries.clear()
+
+
+diagnostics = Diagnostics()
+
+
+def configure_diagnostics(settings):
+    """ A diagnosztika beállítása a settings szerint (diagnostics_enabled, _slow_query_ms, _log_file). """
+    diagnostics.configure(
+        enabled=bool(settings.get("diagnostics_enabled", False)),
+        slow_query_ms=float(settings.get("diagnostics_slow_query_ms", 100)),
+        log_path=settings.get("diagnostics_log_file") or None
+    )
+
+
+STATEMENT_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+(\w+)", re.IGNORECASE)
+
+
+def statement_name(sql):
+    """ Az SQL utasítás csoportosító neve a statisztikában, pl. "sql SELECT files" (DDL-nél csak "sql CREATE"). """
+    words = sql.split(None, 1)
+    verb = words[0].upper() if words else ""
+    table = STATEMENT_TABLE_PATTERN.search(sql) if verb in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE") else None
+    return f"sql {verb} {table.group(1)}" if table else f"sql {verb}"
+
+
+class _InstrumentedCursor:
+    """
+    Az sqlite3 kurzor burka: bekapcsolt diagnosztikánál méri az utasítások idejét a sorok lekérésével együtt
+    (az utasítás a következő végrehajtásig vagy a DatabaseManager hívás végéig tart). Kikapcsolva csak továbbad.
+    """
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._pending = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, parameters=()):
+        if not diagnostics.enabled:
+            self._cursor.execute(sql, parameters)
+            return self
+        self.finish_statement()
+        start = time.perf_counter()
+        self._cursor.execute(sql, parameters)
+        self._pending = [sql, parameters, time.perf_counter() - start, 0]
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if not diagnostics.enabled:
+            self._cursor.executemany(sql, seq_of_parameters)
+            return self
+        self.finish_statement()
+        start = time.perf_counter()
+        self._cursor.executemany(sql, seq_of_parameters)
+        self._pending = [sql, None, time.perf_counter() - start, max(self._cursor.rowcount, 0)]
+        return self
+
+    def fetchone(self):
+        return self._timed_fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(self._cursor.fetchmany, size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(self._cursor.fetchall)
+
+    def _timed_fetch(self, fetch, *args):
+        if self._pending is None:
+            return fetch(*args)
+        start = time.perf_counter()
+        result = fetch(*args)
+        self._pending[2] += time.perf_counter() - start
+        self._pending[3] += len(result) if isinstance(result, list) else int(result is not None)
+        return result
+
+    def finish_statement(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        diagnostics.record_statement(self._cursor.connection, *pending)
+
+
+def instrument_database_methods(cls):
+    """
+    Osztálydekorátor: a nyilvános metódusok hívásait "db.<név>" néven méri (listát visszaadóknál a sorok számával).
+    A generátor és a contextmanager metódusok nincsenek burkolva; az általuk hívott metódusok mérése így is megtörténik.
+    Az osztály UNINSTRUMENTED_METHODS halmazában felsorolt (adatbázist nem érő) segédmetódusok sincsenek burkolva:
+    ezeket soronként is hívják, így a mérés csak a hisztogramot töltené és lassítana.
+    """
+    skipped = getattr(cls, "UNINSTRUMENTED_METHODS", frozenset())
+
+    def instrumented(function, name):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            if not diagnostics.enabled:
+                return function(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = function(self, *args, **kwargs)
+            finally:
+                cursor = getattr(self, "cursor", None)
+                if isinstance(cursor, _InstrumentedCursor):
+                    cursor.finish_statement()
+            diagnostics.record(name, time.perf_counter() - start, len(result) if isinstance(result, list) else None)
+            return result
+        return wrapper
+
+    for name, function in list(vars(cls).items()):
+        if name.startswith("_") or name in skipped or not inspect.isfunction(function) \
+                or inspect.isgeneratorfunction(inspect.unwrap(function)):
+            continue
+        setattr(cls, name, instrumented(function, f"db.{name}"))
+    return cls
+# ---
+
+
+# --- SettingsManager osztály ---
+class SettingsManager:
+    """
+    Kezeli a beállítások mentését és betöltését JSON fájlból.
+    Az error_handler(cím, üzenet) jelzi a hibákat (a GUI-ban messagebox, egyébként a standard hibakimenet).
+    """
+    def __init__(self, filename='config.json', error_handler=None):
+        self.filename = filename
+        self.error_handler = error_handler or print_error
+        self.default_settings = {
+            "folders": "",
+            "google_api_key": "",
+            # Új alapértelmezett beállítás a prompt számára
+            "ai_prompt": "Adjon meg egy 10 szóból álló kulcsszó listát, amely leírja a képen látható eseményt "
+                         "vagy cselekvést. A választ vesszővel elválasztott listaként adja meg, pl.: 'kulcsszó1, kulcsszó2, ...'",
+            # Az eltűnt fájlok kezelése beolvasáskor: "mark" (megjelölés) vagy "purge" (törlés az adatbázisból)
+            "missing_files_policy": "mark",
+            "watch_enabled": False,
+            # Az előnézeti bélyegképek lemezes gyorsítótárának mérethatára (MB)
+            "thumbnail_cache_max_mb": 200,
+            # Közeli másolatnak számít két kép, ha a perceptuális hash-ük legfeljebb ennyi bitben tér el
+            "near_duplicate_distance": 6,
+            # AI kulcsszó-generálás: "gemini" vagy "http" (helyi tesztszerver az ai_stub_url címen)
+            "ai_backend": "gemini",
+            "ai_model": "gemini-2.0-flash",
+            "ai_stub_url": "http://127.0.0.1:8765/generate",
+            "ai_requests_per_minute": 15,
+            "ai_tokens_per_minute": 1000000,
+            "ai_max_concurrency": 4,
+            "ai_max_retries": 5,
+            # Feltöltés előtt a kép hosszabbik oldala legfeljebb ennyi pixel (0 = eredeti méret), formátuma JPEG vagy WEBP
+            "ai_image_max_edge": 1024,
+            "ai_image_quality": 85,
+            "ai_image_format": "JPEG",
+            # Diagnosztika: időmérés, a lassú lekérdezések végrehajtási terve, opcionális JSONL naplófájl
+            "diagnostics_enabled": False,
+            "diagnostics_slow_query_ms": 100,
+            "diagnostics_log_file": "",
+            "column_widths": {},
+            "filter_settings": {
+                "file_path_query": "",
+                "ai_keywords_query": "",
+                "used_date_from_query": "",
+                "used_date_to_query": "",
+                "date_filter_type": "Nincs",
+                "logical_operator": "ÉS",
+                "used_filter": "Mind",
+                "top_limit": "0",
+                "keywords_include": [],
+                "keywords_exclude": [],
+                "include_missing": False
+            }
+        }
+
+    def load_settings(self):
+        """
+        Beolvassa a beállításokat a fájlól.
+        """
+        settings = {}
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    settings = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError) as e:
+                print(f"Hiba a beállítások betöltésekor: {e}. Alapértelmezett értékek használata.")
+        
+        # Gondoskodik róla, hogy az összes kulcs létezzen
+        for key, value in self.default_settings.items():
+            if key not in settings:
+                settings[key] = value
+                
+        # Gondoskodik róla, hogy az alkulcsok létezzenek
+        if "filter_settings" not in settings:
+            settings["filter_settings"] = self.default_settings["filter_settings"]
+        else:
+            for key, value in self.default_settings["filter_settings"].items():
+                if key not in settings["filter_settings"]:
+                    settings["filter_settings"][key] = value
+                        
+        return settings
+
+    def save_settings(self, settings):
+        """
+        Elmenti a beállításokat a fájlba.
+        """
+        try:
+            with open(self.filename, 'w', encoding='utf-8') as f:
+                json.dump(settings, f, indent=4)
+            return True
+        except Exception as e:
+            self.error_handler("Hiba", f"Nem sikerült a beállításokat elmenteni: {e}")
+            return False
+# ---
+
+# --- DatabaseManager osztály ---
+# Minden kapcsolat beállításai. WAL módban az olvasók nem várnak az íróra (és az író sem az olvasókra),
+# a synchronous = NORMAL WAL mellett is konzisztens marad, csak egy áramszünet vesztheti el az utolsó tranzakciókat.
+CONNECTION_PRAGMAS = (
+    ("synchronous", "NORMAL"),
+    ("temp_store", "MEMORY"),
+    ("cache_size", -32768),
+    # Egy nagy import után a WAL fájl az ellenőrzőpontnál visszavágódik erre a méretre
+    ("journal_size_limit", 64 * 1024 * 1024),
+)
+# Ennyi másodpercig vár egy zárolt adatbázisra, mielőtt "database is locked" hibát adna
+BUSY_TIMEOUT_S = 30.0
+
+
+class DataVersion:
+    """
+    Folyamaton belüli, monoton növekvő adatverzió: minden írás (tranzakció, importálás) után nő.
+    A QueryCache ebből tudja, hogy a tárolt lekérdezési eredmények elavultak.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+            return self.value
+
+
+DATA_VERSION = DataVersion()
+
+# A used_day oszlop (ÉÉÉÉHHNN egész szám) értéke: a triggerek csak a pontosan ÉÉÉÉ.HH.NN alakú dátumból
+# számolják, minden más (pl. "2023.1.5") NULL lesz. A used_day_value() ugyanezt adja Pythonban.
+USED_DAY_SQL = ("CASE WHEN {col} GLOB '[0-9][0-9][0-9][0-9].[0-9][0-9].[0-9][0-9]' "
+                "THEN CAST(replace({col}, '.', '') AS INTEGER) END")
+USED_DAY_PATTERN = re.compile(r"[0-9]{4}\.[0-9]{2}\.[0-9]{2}")
+
+
+def used_day_value(used_date):
+    """ Egy used_date értékhez tartozó used_day, pontosan úgy, ahogy a triggerek (USED_DAY_SQL) számolják. """
+    if isinstance(used_date, str) and USED_DAY_PATTERN.fullmatch(used_date):
+        return int(used_date.replace(".", ""))
+    return None
+
+# AI feladatok bérlete: a futó feladatot a gazdája (AI_JOB_HEARTBEAT_S-onként) megújítja; a más folyamat
+# (GUI, időzített parancssori futás) csak a legalább AI_JOB_LEASE_S másodperce meg nem újítottakat veszi át
+AI_JOB_LEASE_S = 90
+AI_JOB_HEARTBEAT_S = 20
+# A kész AI feladatok ennyi nap után törlődnek a sorból (a feladatsor indításakor)
+AI_DONE_JOB_RETENTION_DAYS = 30
+
+# Az SQL-ben a normalize_keyword() függvény (a DatabaseManager minden kapcsolaton regisztrálja); a triggerek
+# és a szűrők is ezt hívják, így a kulcsszótábla és a keresés mindig ugyanazt a normalizálást használja
+KEYWORD_NORMALIZE_SQL = "normalize_keyword({})"
+
+
+def normalize_keyword(keyword):
+    """
+    Egy kulcsszó normalizált alakja: szélső szóközök nélkül, Unicode szerint kisbetűsítve (casefold), így az
+    "Új kép", az "új kép" és az "ÚJ KÉP" ugyanaz (az SQLite lower() csak az ASCII betűket alakítja).
+    """
+    if keyword is None:
+        return None
+    return str(keyword).strip(" \t\n\r").casefold()
+
+
+def keyword_split_sql(value_expr, rowid_expr, source=""):
+    """
+    Rekurzív CTE (split), ami a vesszővel elválasztott kulcsszólistákat (file_rowid, keyword) sorokra bontja;
+    az üres elemek keyword értéke '' vagy NULL. source: a value_expr és rowid_expr forrása (pl. "FROM files").
+    A teljes lista egyszerre kisbetűsödik (soronként egy Python hívás), az elemekről csak a szóközök vágódnak le,
+    ami ugyanazt adja, mint a normalize_keyword elemenként.
+    """
+    keyword_expr = "trim(substr(rest, 1, instr(rest, ',') - 1), char(32, 9, 10, 13))"
+    return (f"WITH RECURSIVE split(file_rowid, keyword, rest) AS ("
+            f"SELECT {rowid_expr}, NULL, {KEYWORD_NORMALIZE_SQL.format(value_expr)} || ',' {source} "
+            f"UNION ALL SELECT file_rowid, {keyword_expr}, substr(rest, instr(rest, ',') + 1) FROM split WHERE rest <> '') ")
+
+
+@instrument_database_methods
+class DatabaseManager:
+    """
+    Kezeli a SQLite adatbázissal való interakciót.
+    Az error_handler(cím, üzenet) jelzi a felhasználónak szóló hibákat; alapból a standard hibakimenetre ír,
+    a GUI messagebox-ot ad át. read_only=True esetén a kapcsolat csak olvas (PRAGMA query_only), és a sémát
+    sem frissíti; ilyet a DatabaseAccess ad a szálaknak, az írások pedig az író szálon futnak.
+    """
+    # A kulcsszótáblát karbantartó triggerek
+    KEYWORD_TABLE_TRIGGERS = ("files_keywords_insert", "files_keywords_delete", "files_keywords_update")
+    # Az adatbázist módosító metódusok: a DatabaseSession ezeket az író szálra küldi
+    WRITE_METHODS = frozenset({
+        "insert_new_file", "insert_new_files", "apply_scan_delta", "relink_moved_files", "purge_missing_files", "save_file_hashes",
+        "enqueue_ai_jobs", "reset_interrupted_ai_jobs", "claim_ai_jobs", "renew_ai_jobs", "release_ai_jobs", "save_ai_results",
+        "rebuild_keyword_index",
+        "delete_records", "update_record", "update_records", "fill_keyword_table",
+    })
+    # SQL-t csak összeállító, illetve kulcsot számoló segédmetódusok: az instrument_database_methods nem méri őket
+    UNINSTRUMENTED_METHODS = frozenset({
+        "date_to_day", "seek_key", "build_seek_clause", "build_keyword_match", "build_keyword_filter", "build_filter_query",
+    })
+
+    def __init__(self, db_name='app_database.db', error_handler=None, read_only=False):
+        self.db_name = db_name
+        self.error_handler = error_handler or print_error
+        self.read_only = read_only
+        self.conn = None
+        self.cursor = None
+        self.fts_enabled = False
+        self.path_index_enabled = False
+        self._savepoint_depth = 0
+        self._pragma_data_version = None
+        self.connect()
+        self.create_table()
+
+    def connect(self):
+        try:
+            self.conn = sqlite3.connect(self.db_name, timeout=BUSY_TIMEOUT_S)
+            # A kulcsszótábla triggerei hívják, ezért minden kapcsolaton kell (egyébként a files írása hibát ad)
+            self.conn.create_function("normalize_keyword", 1, normalize_keyword, deterministic=True)
+            self.cursor = _InstrumentedCursor(self.conn.cursor())
+        except sqlite3.Error as e:
+            self.error_handler("Adatbázis hiba", f"Nem sikerült kapcsolódni az adatbázishoz: {e}")
+            return
+        try:
+            if self.read_only:
+                self.cursor.execute("PRAGMA query_only = ON")
+            else:
+                # A WAL mód az adatbázisfájlban tárolódik, így elég egyszer, az első író kapcsolatnál beállítani
+                self.cursor.execute("PRAGMA journal_mode = WAL")
+            for name, value in CONNECTION_PRAGMAS:
+                self.cursor.execute(f"PRAGMA {name} = {value}")
+        except sqlite3.Error as e:
+            # Pl. egy másik folyamat épp zárolja a fájlt: a kapcsolat az alapbeállításokkal is működik
+            print(f"Nem sikerült az adatbázis-kapcsolat hangolása: {e}")
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Írási tranzakció: with db.transaction(): ... Hiba esetén visszavonódik, a kivétel továbbmegy.
+        Ha már fut tranzakció (pl. az író szál kötegében), mentési pontként ágyazódik bele,
+        így egy hibás művelet csak a saját módosításait vonja vissza.
+        """
+        if self.conn.in_transaction:
+            self._savepoint_depth += 1
+            savepoint = f"transaction_{self._savepoint_depth}"
+            self.cursor.execute(f"SAVEPOINT {savepoint}")
+            try:
+                yield
+            except BaseException:
+                self.cursor.execute(f"ROLLBACK TO {savepoint}")
+                self.cursor.execute(f"RELEASE {savepoint}")
+                raise
+            else:
+                self.cursor.execute(f"RELEASE {savepoint}")
+            finally:
+                self._savepoint_depth -= 1
+            return
+
+        # Az írási zárat rögtön megszerezzük: így a tranzakció olvasásai után az írás nem futhat zárolási hibára
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        DATA_VERSION.bump()
+
+    def data_version(self):
+        """
+        Az adatok aktuális verziója (DATA_VERSION). Más kapcsolatok és folyamatok (pl. a parancssorból futó
+        importálás) írásait a kapcsolat PRAGMA data_version értékének változásából ismeri fel.
+        """
+        try:
+            self.cursor.execute("PRAGMA data_version")
+            pragma_version = self.cursor.fetchone()[0]
+        except sqlite3.Error:
+            # Ismeretlen állapot: inkább elavultnak tekintünk mindent
+            return DATA_VERSION.bump()
+        if self._pragma_data_version is not None and pragma_version != self._pragma_data_version:
+            DATA_VERSION.bump()
+        self._pragma_data_version = pragma_version
+        return DATA_VERSION.value
+
+    def create_table(self):
+        """
+        Létrehozza, illetve verziónként frissíti az adatbázis sémáját. A séma verzióját
+        a PRAGMA user_version tárolja, így a meglévő app_database.db fájlok helyben frissülnek.
+        Az FTS indexek az SQLite képességeitől függenek, ezért azokat külön, minden megnyitáskor ellenőrizzük.
+        """
+        if not self.cursor:
+            return
+
+        if self.read_only:
+            # Az olvasó kapcsolat a sémát nem módosítja, csak az indexek meglétét nézi meg
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('files_fts', 'files_path_fts')")
+            tables = {row[0] for row in self.cursor.fetchall()}
+            self.fts_enabled = "files_fts" in tables
+            self.path_index_enabled = "files_path_fts" in tables
+            return
+
+        migrations = [self.migrate_to_v1, self.migrate_to_v2, self.migrate_to_v3, self.migrate_to_v4,
+                      self.migrate_to_v5, self.migrate_to_v6, self.migrate_to_v7, self.migrate_to_v8, self.migrate_to_v9,
+                      self.migrate_to_v10]
+        self.cursor.execute("PRAGMA user_version")
+        version = self.cursor.fetchone()[0]
+
+        for target_version, migration in enumerate(migrations, start=1):
+            if version >= target_version:
+                continue
+            try:
+                # Egyszerre több kapcsolat is megnyithatja az adatbázist (pl. háttérben futó beolvasás),
+                # ezért a zár megszerzése után újra ellenőrizzük a verziót
+                self.cursor.execute("BEGIN IMMEDIATE")
+                self.cursor.execute("PRAGMA user_version")
+                if self.cursor.fetchone()[0] < target_version:
+                    migration()
+                    self.cursor.execute(f"PRAGMA user_version = {target_version}")
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                self.error_handler("Adatbázis hiba", f"Nem sikerült az adatbázis frissítése a(z) {target_version}. sémaverzióra: {e}")
+                return
+            version = target_version
+
+        self.create_keyword_index()
+        self.create_path_index()
+
+    def migrate_to_v1(self):
+        """
+        Alaptáblák: files, valamint a növekményes újraolvasás fájl- és mappakatalógusa.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                file_path TEXT PRIMARY KEY NOT NULL,
+                ai_keywords TEXT,
+                used_date TEXT,
+                used INTEGER DEFAULT 0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_stats (
+                file_path TEXT PRIMARY KEY NOT NULL,
+                dir_path TEXT NOT NULL,
+                mtime_ns INTEGER,
+                size INTEGER,
+                inode INTEGER,
+                missing INTEGER DEFAULT 0
+            )
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_stats_dir_path ON file_stats (dir_path)")
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dir_stats (
+                dir_path TEXT PRIMARY KEY NOT NULL,
+                parent_path TEXT,
+                mtime_ns INTEGER
+            )
+        ''')
+
+    def migrate_to_v2(self):
+        """
+        Rendezhető egész szám dátum (used_day = ÉÉÉÉHHNN) a szöveges used_date mellé, triggerekkel
+        szinkronban tartva, valamint indexek a szűrési és rendezési kombinációkhoz.
+        A used_date megjelenítési formátuma (ÉÉÉÉ.HH.NN) nem változik.
+        """
+        self.cursor.execute("PRAGMA table_info(files)")
+        if "used_day" not in [row[1] for row in self.cursor.fetchall()]:
+            self.cursor.execute("ALTER TABLE files ADD COLUMN used_day INTEGER")
+
+        used_day_expr = USED_DAY_SQL
+        self.cursor.execute(f"UPDATE files SET used_day = {used_day_expr.format(col='used_date')}")
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_used_day_insert AFTER INSERT ON files
+            WHEN new.used_date IS NOT NULL BEGIN
+                UPDATE files SET used_day = {used_day_expr.format(col='new.used_date')} WHERE rowid = new.rowid;
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_used_day_update AFTER UPDATE OF used_date ON files BEGIN
+                UPDATE files SET used_day = {used_day_expr.format(col='new.used_date')} WHERE rowid = new.rowid;
+            END
+        ''')
+
+        # A file_path minden indexben szerepel, így a rendezés és a lapozás is az indexből szolgálható ki
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_used_path ON files (used, file_path)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_used_day ON files (used_day, file_path)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_used_used_day ON files (used, used_day, file_path)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_ai_keywords ON files (ai_keywords, file_path)")
+        self.cursor.execute("ANALYZE files")
+
+    def migrate_to_v3(self):
+        """
+        AI eredmény-gyorsítótár: a kép tartalmának hash-e, a prompt hash-e és a modell neve alapján
+        tárolja a generált kulcsszavakat, így ugyanaz a kép (vagy a másolata) nem kerül újra elküldésre.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ai_cache (
+                content_hash TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                ai_keywords TEXT,
+                created_at TEXT,
+                PRIMARY KEY (content_hash, prompt_hash, model)
+            ) WITHOUT ROWID
+        ''')
+
+    def migrate_to_v4(self):
+        """
+        Tartós AI feladatsor: képenként állapot (pending/running/done/failed), próbálkozásszám és
+        hibaüzenet, így egy megszakadt (pl. éjszakai) kulcsszó-generálás a következő indításkor folytatódik.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ai_jobs (
+                file_path TEXT PRIMARY KEY NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TEXT,
+                updated_at TEXT
+            )
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_jobs_status ON ai_jobs (status)")
+
+    def migrate_to_v5(self):
+        """
+        Perceptuális hash (dHash) a katalógusban a közeli másolatok kereséséhez. A phash_checked
+        jelzi, hogy a hash már elkészült (vagy a kép nem volt olvasható); a fájl módosulásakor
+        a katalógussor cseréje ezt visszaállítja, így a hash újraszámolódik.
+        """
+        self.cursor.execute("PRAGMA table_info(file_stats)")
+        columns = [row[1] for row in self.cursor.fetchall()]
+        if "phash" not in columns:
+            self.cursor.execute("ALTER TABLE file_stats ADD COLUMN phash INTEGER")
+        if "phash_checked" not in columns:
+            self.cursor.execute("ALTER TABLE file_stats ADD COLUMN phash_checked INTEGER NOT NULL DEFAULT 0")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_stats_phash_pending ON file_stats (file_path) WHERE phash_checked = 0")
+
+    def migrate_to_v6(self):
+        """
+        A fájl tartalmának hash-e (BLAKE2b) a katalógusban, a pontos másolatok csoportosításához.
+        A perceptuális hash-hez hasonlóan a katalógussor cseréje (a fájl módosulása) után számolódik újra,
+        a változatlan méretű és mtime-ú fájlokat nem kell újraolvasni.
+        """
+        self.cursor.execute("PRAGMA table_info(file_stats)")
+        columns = [row[1] for row in self.cursor.fetchall()]
+        if "content_hash" not in columns:
+            self.cursor.execute("ALTER TABLE file_stats ADD COLUMN content_hash TEXT")
+        if "content_checked" not in columns:
+            self.cursor.execute("ALTER TABLE file_stats ADD COLUMN content_checked INTEGER NOT NULL DEFAULT 0")
+        self.cursor.execute("DROP INDEX IF EXISTS idx_file_stats_phash_pending")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_stats_hash_pending ON file_stats (file_path) "
+                            "WHERE phash_checked = 0 OR content_checked = 0")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_stats_content_hash ON file_stats (content_hash) "
+                            "WHERE content_hash IS NOT NULL")
+
+    def migrate_to_v7(self):
+        """
+        Normalizált kulcsszótábla: keywords (kulcsszó, hány képen szerepel) és file_keywords (kulcsszó - kép
+        kapcsolat a files sorazonosítójával). A files triggerei tartják szinkronban az ai_keywords oszloppal,
+        így a gyakorisági listák (facetták) és a kulcsszavas szűrés indexből szolgálható ki.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS keywords (
+                keyword_id INTEGER PRIMARY KEY,
+                keyword TEXT NOT NULL UNIQUE,
+                file_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_keywords (
+                keyword_id INTEGER NOT NULL,
+                file_rowid INTEGER NOT NULL,
+                PRIMARY KEY (keyword_id, file_rowid)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_keywords_file ON file_keywords (file_rowid, keyword_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_keywords_file_count ON keywords (file_count DESC, keyword)")
+        self.create_keyword_table_triggers()
+        self.fill_keyword_table()
+
+    def create_keyword_table_triggers(self):
+        """ A kulcsszótáblát az ai_keywords oszloppal szinkronban tartó triggerek (a KEYWORD_NORMALIZE_SQL szerint). """
+        def add_keywords(row):
+            split = keyword_split_sql(f"{row}.ai_keywords", f"{row}.rowid")
+            return f'''
+                INSERT OR IGNORE INTO keywords (keyword) {split} SELECT keyword FROM split WHERE keyword <> '';
+                INSERT OR IGNORE INTO file_keywords (keyword_id, file_rowid)
+                    {split} SELECT keywords.keyword_id, {row}.rowid FROM split JOIN keywords USING (keyword);
+                UPDATE keywords SET file_count = file_count + 1
+                    WHERE keyword_id IN (SELECT keyword_id FROM file_keywords WHERE file_rowid = {row}.rowid);
+            '''
+
+        def remove_keywords(row):
+            return f'''
+                UPDATE keywords SET file_count = file_count - 1
+                    WHERE keyword_id IN (SELECT keyword_id FROM file_keywords WHERE file_rowid = {row}.rowid);
+                DELETE FROM file_keywords WHERE file_rowid = {row}.rowid;
+            '''
+
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_keywords_insert AFTER INSERT ON files
+            WHEN new.ai_keywords IS NOT NULL BEGIN {add_keywords("new")} END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_keywords_delete AFTER DELETE ON files BEGIN {remove_keywords("old")} END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_keywords_update AFTER UPDATE OF ai_keywords ON files
+            WHEN old.ai_keywords IS NOT new.ai_keywords BEGIN {remove_keywords("old")} {add_keywords("new")} END
+        ''')
+
+    def migrate_to_v8(self):
+        """
+        AI feladatok bérlete: a futó feladat gazdája (gép:pid:azonosító) és utolsó életjele (Unix időbélyeg),
+        így egy másik folyamat csak a gazdájuk leállása után (lejárt bérlet) veszi át a feladatokat.
+        """
+        self.cursor.execute("PRAGMA table_info(ai_jobs)")
+        columns = [row[1] for row in self.cursor.fetchall()]
+        if "owner" not in columns:
+            self.cursor.execute("ALTER TABLE ai_jobs ADD COLUMN owner TEXT")
+        if "heartbeat_at" not in columns:
+            self.cursor.execute("ALTER TABLE ai_jobs ADD COLUMN heartbeat_at REAL")
+
+    def migrate_to_v9(self):
+        """
+        Indexek az eltűnt fájlokhoz: a megjelöltek gyors kiszűréséhez (részleges index), illetve az áthelyezett
+        fájlok inode szerinti megtalálásához.
+        """
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_stats_missing ON file_stats (file_path) WHERE missing = 1")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_stats_inode ON file_stats (inode, size, mtime_ns)")
+
+    def migrate_to_v10(self):
+        """
+        Unicode kisbetűsítés a kulcsszótáblában: a triggerek a normalize_keyword() függvényt használják az ASCII-only
+        lower() helyett, és a tábla újratöltődik (az eddig külön számolt "Új kép" és "új kép" összevonódik).
+        """
+        for name in self.KEYWORD_TABLE_TRIGGERS:
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        self.create_keyword_table_triggers()
+        self.fill_keyword_table()
+
+    def date_to_day(self, date_str):
+        """
+        ÉÉÉÉ.HH.NN formátumú dátumból a used_day oszlop egész szám értéke (ÉÉÉÉHHNN).
+        """
+        return int(datetime.strptime(date_str, "%Y.%m.%d").strftime("%Y%m%d"))
+
+    def create_keyword_index(self):
+        """
+        FTS5 index az ai_keywords oszlophoz (external content tábla a files sorazonosítóival),
+        amit triggerek tartanak szinkronban. Ha az SQLite FTS5 nélkül készült, a kulcsszószűrés LIKE-ra esik vissza.
+        """
+        try:
+            self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files_fts'")
+            index_exists = self.cursor.fetchone() is not None
+            with self.conn:
+                # remove_diacritics: a "hajo" keresés megtalálja a "hajó" kulcsszót is
+                self.cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+                        ai_keywords,
+                        content='files',
+                        content_rowid='rowid',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                ''')
+                self.cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+                        INSERT INTO files_fts (rowid, ai_keywords) VALUES (new.rowid, new.ai_keywords);
+                    END
+                ''')
+                self.cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+                        INSERT INTO files_fts (files_fts, rowid, ai_keywords) VALUES ('delete', old.rowid, old.ai_keywords);
+                    END
+                ''')
+                self.cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF ai_keywords ON files BEGIN
+                        INSERT INTO files_fts (files_fts, rowid, ai_keywords) VALUES ('delete', old.rowid, old.ai_keywords);
+                        INSERT INTO files_fts (rowid, ai_keywords) VALUES (new.rowid, new.ai_keywords);
+                    END
+                ''')
+                if not index_exists:
+                    # Meglévő adatbázis első megnyitása: a már tárolt kulcsszavak indexelése
+                    self.cursor.execute("INSERT INTO files_fts (files_fts) VALUES ('rebuild')")
+            self.fts_enabled = True
+        except sqlite3.Error as e:
+            print(f"Az FTS5 kulcsszóindex nem érhető el, LIKE keresés használata: {e}")
+            self.fts_enabled = False
+
+    def create_path_index(self):
+        """
+        Trigram FTS5 index a file_path oszlophoz, így a fájl útvonal részszöveges keresése
+        nem olvassa végig a teljes táblát. Az FTS5 trigram tokenizáló SQLite 3.34-től érhető el,
+        korábbi verzióknál az útvonalszűrés LIKE-ra esik vissza.
+        """
+        try:
+            self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files_path_fts'")
+            index_exists = self.cursor.fetchone() is not None
+            with self.conn:
+                self.cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS files_path_fts USING fts5(
+                        file_path,
+                        content='files',
+                        content_rowid='rowid',
+                        tokenize='trigram'
+                    )
+                ''')
+                self.cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS files_path_fts_insert AFTER INSERT ON files BEGIN
+                        INSERT INTO files_path_fts (rowid, file_path) VALUES (new.rowid, new.file_path);
+                    END
+                ''')
+                self.cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS files_path_fts_delete AFTER DELETE ON files BEGIN
+                        INSERT INTO files_path_fts (files_path_fts, rowid, file_path) VALUES ('delete', old.rowid, old.file_path);
+                    END
+                ''')
+                self.cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS files_path_fts_update AFTER UPDATE OF file_path ON files BEGIN
+                        INSERT INTO files_path_fts (files_path_fts, rowid, file_path) VALUES ('delete', old.rowid, old.file_path);
+                        INSERT INTO files_path_fts (rowid, file_path) VALUES (new.rowid, new.file_path);
+                    END
+                ''')
+                if not index_exists:
+                    self.cursor.execute("INSERT INTO files_path_fts (files_path_fts) VALUES ('rebuild')")
+            self.path_index_enabled = True
+        except sqlite3.Error as e:
+            print(f"A trigram útvonalindex nem érhető el, LIKE keresés használata: {e}")
+            self.path_index_enabled = False
+
+    def rebuild_keyword_index(self):
+        """
+        Újraépíti a kulcsszó- és útvonalindexet, valamint a kulcsszótáblát (pl. egy külső VACUUM után,
+        ami a sorazonosítókat átszámozhatja).
+        """
+        try:
+            with self.transaction():
+                if self.fts_enabled:
+                    self.cursor.execute("INSERT INTO files_fts (files_fts) VALUES ('rebuild')")
+                if self.path_index_enabled:
+                    self.cursor.execute("INSERT INTO files_path_fts (files_path_fts) VALUES ('rebuild')")
+                self.fill_keyword_table()
+            return True
+        except sqlite3.Error as e:
+            print(f"Hiba a kulcsszóindex újraépítésekor: {e}")
+            return False
+
+    def fill_keyword_table(self):
+        """
+        A keywords és file_keywords táblák teljes újratöltése a files.ai_keywords oszlopból (a triggerek nélkül,
+        egy lépésben). Adatbázis-hiba esetén kivételt dob; a hívó tranzakciójában fut.
+        """
+        self.cursor.execute("DELETE FROM file_keywords")
+        self.cursor.execute("DROP TABLE IF EXISTS temp.keyword_split")
+        self.cursor.execute(f"CREATE TEMP TABLE keyword_split AS "
+                            f"{keyword_split_sql('ai_keywords', 'rowid', 'FROM files WHERE ai_keywords IS NOT NULL')}"
+                            f"SELECT file_rowid, keyword FROM split WHERE keyword <> ''")
+        self.cursor.execute("INSERT OR IGNORE INTO keywords (keyword) SELECT DISTINCT keyword FROM temp.keyword_split")
+        self.cursor.execute("INSERT OR IGNORE INTO file_keywords (keyword_id, file_rowid) "
+                            "SELECT keywords.keyword_id, keyword_split.file_rowid FROM temp.keyword_split JOIN keywords USING (keyword)")
+        self.cursor.execute("DROP TABLE temp.keyword_split")
+        self.cursor.execute("UPDATE keywords SET file_count = "
+                            "(SELECT COUNT(*) FROM file_keywords WHERE file_keywords.keyword_id = keywords.keyword_id)")
+        self.cursor.execute("DELETE FROM keywords WHERE file_count = 0")
+
+    def build_keyword_match(self, search_query):
+        """
+        A kulcsszó szűrőmező szövegét FTS5 MATCH kifejezéssé alakítja.
+        - szóközzel vagy vesszővel elválasztott szavak: mindegyiknek szerepelnie kell (ÉS)
+        - OR / VAGY / | a szavak között: elég az egyiknek (VAGY); az ÉS erősebben köt
+        - "idézőjeles kifejezés": pontos szókapcsolat
+        - a szavak előtagként illeszkednek ("tenger" megtalálja a "tengerpart"-ot is), a * elhagyható
+        Ha a szövegben nincs kereshető szó, None-t ad vissza.
+        """
+        parts = []
+        for token in re.findall(r'"[^"]*"?|[^\s,]+', search_query):
+            if token.upper() in ("OR", "VAGY", "|"):
+                if parts and parts[-1] != "OR":
+                    parts.append("OR")
+                continue
+            if token.upper() in ("AND", "ÉS", "&"):
+                continue
+
+            if token.startswith('"'):
+                phrase = token.strip('"').strip()
+                if phrase:
+                    parts.append('"' + phrase.replace('"', '""') + '"')
+                continue
+
+            term = token.rstrip("*")
+            if term:
+                # Idézőjelezve az FTS5 operátorként értelmezhető karakterek is biztonságosak
+                parts.append('"' + term.replace('"', '""') + '"*')
+
+        while parts and parts[-1] == "OR":
+            parts.pop()
+        while parts and parts[0] == "OR":
+            parts.pop(0)
+        return " ".join(parts) if parts else None
+
+    def insert_new_file(self, file_path):
+        if self.cursor:
+            try:
+                with self.transaction():
+                    self.cursor.execute("INSERT INTO files (file_path, used_date, used) VALUES (?, ?, ?)", (file_path, None, 0))
+                return True
+            except sqlite3.IntegrityError:
+                return False
+            except sqlite3.Error as e:
+                print(f"Hiba a fájl beszúrásakor ({file_path}): {e}")
+                return False
+
+    def insert_new_files(self, file_paths):
+        """
+        Több fájl beszúrása egyetlen tranzakcióban. A már meglévő útvonalakat kihagyja.
+        Visszaadja a ténylegesen beszúrt sorok számát.
+        """
+        if not self.cursor or not file_paths:
+            return 0
+        try:
+            with self.transaction():
+                # A rowcount (a total_changes-szel ellentétben) nem számolja a triggerek (FTS) módosításait
+                self.cursor.executemany(
+                    "INSERT OR IGNORE INTO files (file_path, used_date, used) VALUES (?, NULL, 0)",
+                    ((file_path,) for file_path in file_paths)
+                )
+                inserted_count = self.cursor.rowcount
+            return inserted_count
+        except sqlite3.Error as e:
+            print(f"Hiba a fájlok kötegelt beszúrásakor: {e}")
+            return 0
+
+    def load_dir_catalog(self):
+        """
+        Visszaadja a katalógusban szereplő mappákat: {dir_path: (parent_path, mtime_ns)}.
+        """
+        try:
+            self.cursor.execute("SELECT dir_path, parent_path, mtime_ns FROM dir_stats")
+            return {row[0]: (row[1], row[2]) for row in self.cursor.fetchall()}
+        except sqlite3.Error as e:
+            print(f"Hiba a mappakatalógus betöltésekor: {e}")
+            return {}
+
+    def fetch_file_stats(self, dir_path):
+        """
+        Egy mappa közvetlen fájljainak katalógusadatai: {file_path: (mtime_ns, size, inode, missing)}.
+        """
+        try:
+            self.cursor.execute("SELECT file_path, mtime_ns, size, inode, missing FROM file_stats WHERE dir_path = ?", (dir_path,))
+            return {row[0]: tuple(row[1:]) for row in self.cursor.fetchall()}
+        except sqlite3.Error as e:
+            print(f"Hiba a fájlkatalógus lekérdezésekor ({dir_path}): {e}")
+            return {}
+
+    def apply_scan_delta(self, new_paths, file_stats, missing_paths, dir_stats, removed_dirs, purge_missing=False):
+        """
+        Egy beolvasási köteg összes változását egyetlen tranzakcióban írja ki.
+        file_stats: (file_path, dir_path, mtime_ns, size, inode) sorok,
+        dir_stats: (dir_path, parent_path, mtime_ns) sorok; a None mtime csak
+        regisztrálja a mappát, a meglévő értéket nem írja felül.
+        Visszaadja az (új fájlok, eltűnt fájlok) számát.
+        """
+        if not self.cursor:
+            return 0, 0
+        try:
+            with self.transaction():
+                self.cursor.executemany(
+                    "INSERT OR IGNORE INTO files (file_path, used_date, used) VALUES (?, NULL, 0)",
+                    ((file_path,) for file_path in new_paths)
+                )
+                new_count = self.cursor.rowcount
+
+                self.cursor.executemany(
+                    "INSERT OR REPLACE INTO file_stats (file_path, dir_path, mtime_ns, size, inode, missing) VALUES (?, ?, ?, ?, ?, 0)",
+                    file_stats
+                )
+
+                # Az eltűnt almappák teljes részfájának fájljai is eltűntek
+                missing_paths = list(missing_paths)
+                for dir_path in removed_dirs:
+                    prefix = os.path.join(dir_path, "")
+                    subtree_clause = "(dir_path = ? OR substr(dir_path, 1, ?) = ?)"
+                    subtree_params = (dir_path, len(prefix), prefix)
+                    self.cursor.execute(f"SELECT file_path FROM file_stats WHERE missing = 0 AND {subtree_clause}", subtree_params)
+                    missing_paths.extend(row[0] for row in self.cursor.fetchall())
+                    self.cursor.execute(f"DELETE FROM dir_stats WHERE {subtree_clause}", subtree_params)
+
+                if purge_missing:
+                    self.cursor.executemany("DELETE FROM files WHERE file_path = ?", ((p,) for p in missing_paths))
+                    self.cursor.executemany("DELETE FROM file_stats WHERE file_path = ?", ((p,) for p in missing_paths))
+                else:
+                    self.cursor.executemany("UPDATE file_stats SET missing = 1 WHERE file_path = ?", ((p,) for p in missing_paths))
+
+                self.cursor.executemany(
+                    "INSERT OR IGNORE INTO dir_stats (dir_path, parent_path, mtime_ns) VALUES (?, ?, NULL)",
+                    ((dir_path, parent_path) for dir_path, parent_path, _ in dir_stats)
+                )
+                self.cursor.executemany(
+                    "UPDATE dir_stats SET parent_path = COALESCE(?, parent_path), mtime_ns = COALESCE(?, mtime_ns) WHERE dir_path = ?",
+                    ((parent_path, mtime_ns, dir_path) for dir_path, parent_path, mtime_ns in dir_stats)
+                )
+            return new_count, len(missing_paths)
+        except sqlite3.Error as e:
+            print(f"Hiba a beolvasási változások mentésekor: {e}")
+            return 0, 0
+
+    def relink_moved_files(self):
+        """
+        Az áthelyezett (átnevezett) fájlok felismerése: ha egy eltűntként megjelölt fájl egy jelen lévő fájllal
+        azonos (inode, méret és mtime, vagy a tartalmi hash egyezik), és annak a files sora még üres (új fájlként
+        került be), a régi sor a kulcsszavakkal és a felhasználással együtt az új útvonalra kerül, az üres sor
+        törlődik. A beolvasás végén fut, így a külön kötegekbe került régi és új útvonal is összetalálkozik.
+        Visszaadja az áthelyezett fájlok számát.
+        """
+        empty_row = "files.ai_keywords IS NULL AND files.used_date IS NULL AND COALESCE(files.used, 0) = 0"
+        try:
+            with self.transaction():
+                self.cursor.execute(f'''
+                    SELECT old.file_path, new.file_path FROM file_stats AS old
+                    JOIN file_stats AS new ON new.inode = old.inode AND new.size = old.size AND new.mtime_ns = old.mtime_ns
+                    JOIN files ON files.file_path = new.file_path
+                    WHERE old.missing = 1 AND old.inode <> 0 AND new.missing = 0 AND {empty_row}
+                ''')
+                candidates = self.cursor.fetchall()
+                # A Windows a listázáskor nem ad inode-ot: ott a (már kiszámolt) tartalmi hash azonosít
+                self.cursor.execute(f'''
+                    SELECT old.file_path, new.file_path FROM file_stats AS old
+                    JOIN file_stats AS new ON new.content_hash = old.content_hash AND new.size = old.size
+                    JOIN files ON files.file_path = new.file_path
+                    WHERE old.missing = 1 AND old.content_hash IS NOT NULL AND new.missing = 0 AND {empty_row}
+                ''')
+                candidates += self.cursor.fetchall()
+
+                moved = {}
+                targets = set()
+                for old_path, new_path in candidates:
+                    if old_path not in moved and new_path not in targets:
+                        moved[old_path] = new_path
+                        targets.add(new_path)
+                for old_path, new_path in moved.items():
+                    self.cursor.execute("DELETE FROM files WHERE file_path = ?", (new_path,))
+                    self.cursor.execute("UPDATE files SET file_path = ? WHERE file_path = ?", (new_path, old_path))
+                    self.cursor.execute("DELETE FROM ai_jobs WHERE file_path = ?", (new_path,))
+                    self.cursor.execute("UPDATE ai_jobs SET file_path = ? WHERE file_path = ?", (new_path, old_path))
+                    # A még ki nem számolt hash-ek a régi katalógussorból átvehetők (a tartalom ugyanaz)
+                    self.cursor.execute(
+                        "UPDATE file_stats SET (phash, phash_checked, content_hash, content_checked) = "
+                        "(SELECT phash, phash_checked, content_hash, content_checked FROM file_stats WHERE file_path = ?) "
+                        "WHERE file_path = ? AND phash_checked = 0 AND content_checked = 0",
+                        (old_path, new_path)
+                    )
+                    self.cursor.execute("DELETE FROM file_stats WHERE file_path = ?", (old_path,))
+            return len(moved)
+        except sqlite3.Error as e:
+            print(f"Hiba az áthelyezett fájlok összekapcsolásakor: {e}")
+            return 0
+
+    def has_missing_files(self):
+        """ Van-e eltűntként megjelölt fájl a katalógusban (a részleges indexből). """
+        try:
+            self.cursor.execute("SELECT 1 FROM file_stats WHERE missing = 1 LIMIT 1")
+            return self.cursor.fetchone() is not None
+        except sqlite3.Error:
+            return False
+
+    def purge_missing_files(self):
+        """
+        Törli az adatbázisból a katalógusban eltűntként megjelölt fájlokat.
+        """
+        try:
+            with self.transaction():
+                self.cursor.execute("DELETE FROM files WHERE file_path IN (SELECT file_path FROM file_stats WHERE missing = 1)")
+                deleted_count = self.cursor.rowcount
+                self.cursor.execute("DELETE FROM file_stats WHERE missing = 1")
+            return deleted_count
+        except sqlite3.Error as e:
+            print(f"Hiba az eltűnt fájlok törlésekor: {e}")
+            return 0
+
+    def fetch_unhashed_files(self, limit=1000):
+        """
+        Azok a (nem eltűnt) fájlok, amelyeknek még hiányzik a perceptuális vagy a tartalmi hash-e:
+        [(file_path, kell-e perceptuális hash, kell-e tartalmi hash)].
+        """
+        try:
+            self.cursor.execute(
+                "SELECT file_path, phash_checked = 0, content_checked = 0 FROM file_stats "
+                "WHERE (phash_checked = 0 OR content_checked = 0) AND missing = 0 LIMIT ?",
+                (limit,)
+            )
+            return [(file_path, bool(need_phash), bool(need_content)) for file_path, need_phash, need_content in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Hiba a hash nélküli fájlok lekérdezésekor: {e}")
+            return []
+
+    def save_file_hashes(self, hashes):
+        """
+        hashes: [(file_path, phash, content_hash)]; a ki nem számolt hash helyén False áll,
+        a sikertelen (olvashatatlan fájl) helyén None. A perceptuális hash előjeles 64 bites egészként tárolódik.
+        """
+        try:
+            with self.transaction():
+                self.cursor.executemany(
+                    "UPDATE file_stats SET phash = ?, phash_checked = 1 WHERE file_path = ?",
+                    [(to_signed_64(phash) if phash is not None else None, file_path)
+                     for file_path, phash, _ in hashes if phash is not False]
+                )
+                self.cursor.executemany(
+                    "UPDATE file_stats SET content_hash = ?, content_checked = 1 WHERE file_path = ?",
+                    [(content_hash, file_path) for file_path, _, content_hash in hashes if content_hash is not False]
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"Hiba a hash-ek mentésekor: {e}")
+            return False
+
+    def fetch_content_hashes(self, file_paths):
+        """
+        A katalógusban tárolt tartalmi hash-ek: {file_path: (content_hash, mtime_ns, size)}.
+        A hívó az mtime és a méret alapján döntheti el, hogy a hash még érvényes-e.
+        """
+        result = {}
+        file_paths = list(file_paths)
+        try:
+            for start in range(0, len(file_paths), 500):
+                chunk = file_paths[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                self.cursor.execute(
+                    f"SELECT file_path, content_hash, mtime_ns, size FROM file_stats WHERE content_hash IS NOT NULL AND file_path IN ({placeholders})",
+                    chunk
+                )
+                result.update((row[0], row[1:]) for row in self.cursor.fetchall())
+        except sqlite3.Error as e:
+            print(f"Hiba a tartalmi hash-ek lekérdezésekor: {e}")
+        return result
+
+    def fetch_exact_duplicates(self):
+        """
+        A több útvonalon is meglévő, bájtra azonos fájlok: [(content_hash, file_path, size)],
+        tartalom szerint egymás után, a legnagyobb fájlokkal kezdve.
+        """
+        try:
+            self.cursor.execute('''
+                SELECT content_hash, file_path, size FROM file_stats
+                WHERE missing = 0 AND content_hash IN (
+                    SELECT content_hash FROM file_stats
+                    WHERE content_hash IS NOT NULL AND missing = 0
+                    GROUP BY content_hash HAVING COUNT(*) > 1
+                )
+                ORDER BY size DESC, content_hash, file_path
+            ''')
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            self.error_handler("Adatbázis hiba", f"Nem sikerült a másolatok lekérdezése: {e}")
+            return []
+
+    def fetch_perceptual_hashes(self):
+        """
+        Az összes ismert perceptuális hash: [(file_path, phash)], a hash előjel nélküli egészként.
+        """
+        try:
+            self.cursor.execute("SELECT file_path, phash FROM file_stats WHERE phash IS NOT NULL AND missing = 0")
+            return [(file_path, phash & 0xFFFFFFFFFFFFFFFF) for file_path, phash in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            self.error_handler("Adatbázis hiba", f"Nem sikerült a perceptuális hash-ek lekérdezése: {e}")
+            return []
+
+    def fetch_cached_keywords(self, content_hashes, prompt_hash, model):
+        """
+        A gyorsítótárban már szereplő AI kulcsszavak: {content_hash: ai_keywords}.
+        """
+        cached = {}
+        content_hashes = list(content_hashes)
+        try:
+            for start in range(0, len(content_hashes), 500):
+                chunk = content_hashes[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                self.cursor.execute(
+                    f"SELECT content_hash, ai_keywords FROM ai_cache WHERE prompt_hash = ? AND model = ? AND content_hash IN ({placeholders})",
+                    [prompt_hash, model] + chunk
+                )
+                cached.update(self.cursor.fetchall())
+        except sqlite3.Error as e:
+            print(f"Hiba az AI gyorsítótár olvasásakor: {e}")
+        return cached
+
+    def enqueue_ai_jobs(self, file_paths):
+        """
+        Felveszi a fájlokat az AI feladatsorba. A már szereplő (pl. korábban hibára futott vagy kész) fájlok
+        újra várakozó állapotba kerülnek; a többi feladatot nem érinti (a régi kész feladatokat
+        a reset_interrupted_ai_jobs törli).
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        try:
+            with self.transaction():
+                self.cursor.executemany('''
+                    INSERT INTO ai_jobs (file_path, status, created_at, updated_at) VALUES (?, 'pending', ?, ?)
+                    ON CONFLICT (file_path) DO UPDATE SET status = 'pending', error = NULL, updated_at = excluded.updated_at
+                    WHERE ai_jobs.status != 'running'
+                ''', [(file_path, now, now) for file_path in file_paths])
+            return True
+        except sqlite3.Error as e:
+            self.error_handler("Adatbázis hiba", f"Nem sikerült az AI feladatok felvétele: {e}")
+            return False
+
+    def reset_interrupted_ai_jobs(self, lease_seconds=AI_JOB_LEASE_S, retention_days=AI_DONE_JOB_RETENTION_DAYS):
+        """
+        A megszakadt (futó állapotban maradt, de lease_seconds óta életjelet nem adó) feladatokat újra
+        várakozóvá teszi. A más folyamatban (pl. a nyitva lévő GUI-ban) éppen futó feladatokat nem érinti.
+        A retention_days napnál régebben kész feladatokat törli a sorból.
+        """
+        done_before = (datetime.now() - timedelta(days=retention_days)).isoformat(timespec="seconds")
+        try:
+            with self.transaction():
+                self.cursor.execute('''
+                    UPDATE ai_jobs SET status = 'pending', owner = NULL, heartbeat_at = NULL
+                    WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+                ''', (time.time() - lease_seconds,))
+                self.cursor.execute("DELETE FROM ai_jobs WHERE status = 'done' AND updated_at < ?", (done_before,))
+        except sqlite3.Error as e:
+            print(f"Hiba az AI feladatok visszaállításakor: {e}")
+
+    def renew_ai_jobs(self, owner):
+        """ Életjel: az owner futó feladatainak bérlete megújul. """
+        try:
+            with self.transaction():
+                self.cursor.execute("UPDATE ai_jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?",
+                                    (time.time(), owner))
+        except sqlite3.Error as e:
+            print(f"Hiba az AI feladatok bérletének megújításakor: {e}")
+
+    def release_ai_jobs(self, owner):
+        """ Az owner még futó (pl. megszakítás miatt fel nem dolgozott) feladatai újra várakozók lesznek. """
+        try:
+            with self.transaction():
+                self.cursor.execute('''
+                    UPDATE ai_jobs SET status = 'pending', owner = NULL, heartbeat_at = NULL
+                    WHERE status = 'running' AND owner = ?
+                ''', (owner,))
+        except sqlite3.Error as e:
+            print(f"Hiba az AI feladatok visszaadásakor: {e}")
+
+    def count_ai_jobs(self):
+        """
+        Az AI feladatok száma állapotonként: {status: darab}.
+        """
+        try:
+            self.cursor.execute("SELECT status, COUNT(*) FROM ai_jobs GROUP BY status")
+            return dict(self.cursor.fetchall())
+        except sqlite3.Error as e:
+            print(f"Hiba az AI feladatok lekérdezésekor: {e}")
+            return {}
+
+    def claim_ai_jobs(self, owner):
+        """
+        A várakozó feladatokat az owner nevére futó állapotba teszi (bérlet, lásd renew_ai_jobs), és visszaadja
+        a fájlútvonalaikat.
+        """
+        try:
+            with self.transaction():
+                self.cursor.execute("SELECT file_path FROM ai_jobs WHERE status = 'pending' ORDER BY created_at, file_path")
+                file_paths = [row[0] for row in self.cursor.fetchall()]
+                self.cursor.execute(
+                    "UPDATE ai_jobs SET status = 'running', owner = ?, heartbeat_at = ?, updated_at = ? WHERE status = 'pending'",
+                    (owner, time.time(), datetime.now().isoformat(timespec="seconds"))
+                )
+            return file_paths
+        except sqlite3.Error as e:
+            print(f"Hiba az AI feladatok indításakor: {e}")
+            return []
+
+    def save_ai_results(self, done, failed, cache_entries, prompt_hash, model):
+        """
+        AI eredmények mentése egyetlen tranzakcióban: a kulcsszavak a files táblába, a feladatok
+        állapota az ai_jobs táblába, az új eredmények az ai_cache táblába kerülnek.
+        done: [(file_path, ai_keywords)], failed: [(file_path, hibaüzenet)], cache_entries: [(content_hash, ai_keywords)].
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        try:
+            with self.transaction():
+                self.cursor.executemany("UPDATE files SET ai_keywords = ? WHERE file_path = ?",
+                                        [(ai_keywords, file_path) for file_path, ai_keywords in done])
+                self.cursor.executemany(
+                    "UPDATE ai_jobs SET status = 'done', owner = NULL, attempts = attempts + 1, error = NULL, updated_at = ? "
+                    "WHERE file_path = ?",
+                    [(now, file_path) for file_path, _ in done]
+                )
+                self.cursor.executemany(
+                    "UPDATE ai_jobs SET status = 'failed', owner = NULL, attempts = attempts + 1, error = ?, updated_at = ? "
+                    "WHERE file_path = ?",
+                    [(error, now, file_path) for file_path, error in failed]
+                )
+                self.cursor.executemany(
+                    "INSERT OR REPLACE INTO ai_cache (content_hash, prompt_hash, model, ai_keywords, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(content_hash, prompt_hash, model, ai_keywords, now) for content_hash, ai_keywords in cache_entries]
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"Hiba az AI eredmények mentésekor: {e}")
+            return False
+
+    def fetch_all_files(self):
+        try:
+            self.cursor.execute("SELECT file_path, ai_keywords, used_date, used FROM files")
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            self.error_handler("Adatbázis hiba", f"Nem sikerült az adatok lekérdezése: {e}")
+            return []
+            
+    def delete_records(self, file_paths):
+        if not file_paths:
+            return 0
+            
+        placeholders = ','.join('?' for _ in file_paths)
+        sql = f"DELETE FROM files WHERE file_path IN ({placeholders})"
+        
+        try:
+            with self.transaction():
+                self.cursor.execute(sql, file_paths)
+                deleted_count = self.cursor.rowcount
+                # A katalógusból is töröljük, hogy egy teljes újraolvasás ismét felvehesse őket
+                self.cursor.execute(f"DELETE FROM file_stats WHERE file_path IN ({placeholders})", file_paths)
+            return deleted_count
+        except sqlite3.Error as e:
+            self.error_handler("Adatbázis hiba", f"Nem sikerült a rekordok törlése: {e}")
+            return 0
+
+    def build_filter_query(self, filter_queries=None, date_filter=None, logical_operator="AND", order_by="file_path"):
+        """
+        Összeállítja a szűrők FROM és WHERE részét. Visszaadja a (from_sql, where_clauses, params,
+        order_expr) négyest, ahol order_expr a rendezés tényleges SQL kifejezése
+        ("relevance" esetén a bm25 pontszám, "used_date" esetén az indexelt used_day oszlop).
+        A filter_queries "keywords_include" és "keywords_exclude" listái a kulcsszótáblából szűrnek
+        (lásd build_keyword_filter), és a logikai operátortól függetlenül mindig szűkítenek.
+        Az eltűntként megjelölt fájlok rejtve maradnak, hacsak a filter_queries "include_missing" értéke nem igaz.
+        Érvénytelen dátum esetén ValueError-t dob.
+        """
+        from_sql = "files"
+        params = []
+        where_clauses = []
+        keyword_match = None
+        
+        if filter_queries:
+            for column, search_query in filter_queries.items():
+                if column in ("keywords_include", "keywords_exclude", "include_missing"):
+                    continue
+                if search_query is not None:
+                    if column == "used":
+                        where_clauses.append(f"{column} = ?")
+                        params.append(search_query)
+                    elif column == "file_path" and self.path_index_enabled and len(search_query) >= 3:
+                        # A trigram index legalább 3 karakteres részszövegre használható; idézőjelezve a teljes szöveget keresi
+                        where_clauses.append("files.rowid IN (SELECT rowid FROM files_path_fts WHERE files_path_fts MATCH ?)")
+                        params.append('"' + search_query.replace('"', '""') + '"')
+                    elif column == "ai_keywords" and self.fts_enabled:
+                        keyword_match = self.build_keyword_match(search_query)
+                        if keyword_match is None:
+                            continue
+                        if order_by == "relevance":
+                            where_clauses.append("fts.fts_rowid IS NOT NULL")
+                        else:
+                            where_clauses.append("files.rowid IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+                            params.append(keyword_match)
+                    else:
+                        where_clauses.append(f"{column} LIKE ?")
+                        params.append(f"%{search_query}%")
+
+        order_expr = order_by
+        if order_by == "relevance":
+            if keyword_match is not None:
+                # A relevancia miatt a találatokat bm25 pontszámmal csatoljuk; VAGY mellett a nem találó sorok a végére kerülnek
+                from_sql += (" LEFT JOIN (SELECT rowid AS fts_rowid, bm25(files_fts) AS fts_rank FROM files_fts WHERE files_fts MATCH ?) AS fts"
+                             " ON fts.fts_rowid = files.rowid")
+                params.insert(0, keyword_match)
+                order_expr = "fts.fts_rank IS NULL, fts.fts_rank"
+            else:
+                order_expr = "files.file_path"
+        elif order_by == "used_date":
+            # A dátum szerinti rendezés az indexelt egész szám oszlopot használja
+            order_expr = "files.used_day"
+        elif order_by in ("file_path", "ai_keywords", "used"):
+            order_expr = f"files.{order_by}"
+        
+        if date_filter and date_filter["type"] != "Nincs":
+            date_col = "used_day"
+            filter_type = date_filter["type"]
+            date_from = self.date_to_day(date_filter["from"]) if date_filter["from"] else None
+            date_to = self.date_to_day(date_filter["to"]) if date_filter["to"] else None
+            
+            if date_from or date_to:
+                date_where_clauses = []
+                date_clause_base = f"({date_col} IS NOT NULL"
+                
+                if filter_type == "Korábbi, mint" and date_from:
+                    date_where_clauses.append(f"{date_clause_base} AND {date_col} < ?)")
+                    params.append(date_from)
+                elif filter_type == "Későbbi, mint" and date_from:
+                    date_where_clauses.append(f"{date_clause_base} AND {date_col} > ?)")
+                    params.append(date_from)
+                elif filter_type == "Közte":
+                    if date_from and date_to:
+                        date_where_clauses.append(f"{date_clause_base} AND {date_col} BETWEEN ? AND ?)")
+                        params.append(date_from)
+                        params.append(date_to)
+                    elif date_from:
+                        date_where_clauses.append(f"{date_clause_base} AND {date_col} >= ?)")
+                        params.append(date_from)
+                    elif date_to:
+                        date_where_clauses.append(f"{date_clause_base} AND {date_col} <= ?)")
+                        params.append(date_to)
+            
+                if date_where_clauses:
+                    where_clauses.append(" AND ".join(date_where_clauses))
+
+        if where_clauses:
+            operator = " AND " if logical_operator == "AND" else " OR "
+            where_clauses = ["(" + operator.join(where_clauses) + ")"]
+
+        if filter_queries:
+            keyword_clauses, keyword_params = self.build_keyword_filter(filter_queries.get("keywords_include"),
+                                                                        filter_queries.get("keywords_exclude"))
+            where_clauses.extend(keyword_clauses)
+            params.extend(keyword_params)
+
+        if not (filter_queries or {}).get("include_missing") and self.has_missing_files():
+            # Az eltűnt fájlok (pl. leválasztott meghajtón) sorai megmaradnak, de nem látszanak; ha a fájl
+            # visszakerül, a következő beolvasás újra megjeleníti
+            where_clauses.append("files.file_path NOT IN (SELECT file_path FROM file_stats WHERE missing = 1)")
+
+        return from_sql, where_clauses, params, order_expr
+
+    def build_keyword_filter(self, include=None, exclude=None):
+        """
+        Kulcsszavas szűrés a kulcsszótáblából: a képnek az include összes kulcsszavával rendelkeznie kell,
+        az exclude egyikével sem. Az include halmazok metszetét a legritkább kulcsszó sorai adják, amelyeket
+        a többi kulcsszó (keyword_id, file_rowid) elsődleges kulcsában keresünk meg (indexmetszet, szövegkeresés
+        nélkül). Visszaadja a (where_clauses, params) párost.
+        """
+        where_clauses = []
+        params = []
+        include = self.resolve_keywords(include)
+        if include is None:
+            # Ismeretlen kulcsszóval egy kép sem rendelkezik
+            return ["0"], []
+        if include:
+            # A legritkább kulcsszó sorai közül indulunk, így a legkevesebb indexkeresés kell
+            keyword_ids = [keyword_id for keyword_id, _ in sorted(include, key=lambda item: item[1])]
+            joins = "".join(f" JOIN file_keywords k{index} ON k{index}.keyword_id = ? AND k{index}.file_rowid = k0.file_rowid"
+                            for index in range(1, len(keyword_ids)))
+            where_clauses.append(f"files.rowid IN (SELECT k0.file_rowid FROM file_keywords k0{joins} WHERE k0.keyword_id = ?)")
+            params.extend(keyword_ids[1:] + keyword_ids[:1])
+
+        exclude = self.resolve_keywords(exclude, skip_unknown=True)
+        if exclude:
+            placeholders = ", ".join("?" for _ in exclude)
+            where_clauses.append(f"files.rowid NOT IN (SELECT file_rowid FROM file_keywords WHERE keyword_id IN ({placeholders}))")
+            params.extend(keyword_id for keyword_id, _ in exclude)
+        return where_clauses, params
+
+    def resolve_keywords(self, keywords, skip_unknown=False):
+        """
+        A kulcsszavak (keyword_id, képek száma) párjai a keywords táblából, a triggerekkel azonos normalizálással,
+        egyetlen lekérdezéssel. Ha valamelyik kulcsszó nem szerepel a táblában, None-t ad vissza (skip_unknown=True
+        esetén kihagyja).
+        """
+        normalized = {normalize_keyword(keyword) for keyword in keywords or []} - {""}
+        if not normalized:
+            return []
+        self.cursor.execute(f"SELECT keyword, keyword_id, file_count FROM keywords WHERE keyword IN ({', '.join('?' * len(normalized))})",
+                            tuple(normalized))
+        rows = self.cursor.fetchall()
+        if len(rows) < len(normalized) and not skip_unknown:
+            return None
+        return [(keyword_id, file_count) for _, keyword_id, file_count in rows]
+
+    def fetch_keyword_facets(self, filter_queries=None, date_filter=None, logical_operator="AND", limit=100):
+        """
+        A leggyakoribb kulcsszavak a szűrőknek megfelelő képek között: [(kulcsszó, képek száma)], csökkenő sorrendben.
+        Szűrő nélkül a keywords tábla tárolt darabszámait olvassa (indexből), szűrővel a találatokat számolja meg.
+        """
+        try:
+            from_sql, where_clauses, params, _ = self.build_filter_query(filter_queries, date_filter, logical_operator)
+        except ValueError:
+            return []
+        if where_clauses:
+            query = (f"SELECT keywords.keyword, COUNT(*) AS file_count FROM file_keywords JOIN keywords USING (keyword_id) "
+                     f"WHERE file_keywords.file_rowid IN (SELECT files.rowid FROM {from_sql} WHERE {' AND '.join(where_clauses)}) "
+                     f"GROUP BY file_keywords.keyword_id ORDER BY file_count DESC, keywords.keyword LIMIT ?")
+        else:
+            query = "SELECT keyword, file_count FROM keywords WHERE file_count > 0 ORDER BY file_count DESC, keyword LIMIT ?"
+        try:
+            self.cursor.execute(query, tuple(params) + (limit,))
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Hiba a kulcsszavak megszámolásakor: {e}")
+            return []
+
+    def seek_key(self, row, order_by):
+        """
+        Egy fetch_files által visszaadott sor lapozási kulcsa: (rendezési érték, fájl útvonal).
+        Dátum szerinti rendezésnél az érték a tárolt used_day; a kulcsnak ezzel pontosan egyeznie kell,
+        különben a keyset feltétel a tartomány közepén újrakezdené a lapozást.
+        """
+        if order_by == "used_date":
+            return (used_day_value(row[2]), row[0])
+        sort_index = {"file_path": 0, "ai_keywords": 1, "used": 3}.get(order_by, 0)
+        return (row[sort_index], row[0])
+
+    def fetch_files(self, limit=10, filter_queries=None, date_filter=None, logical_operator="AND", order_by="file_path", order_direction="ASC",
+                    seek_after=None, offset=0):
+        """
+        order_by="relevance" esetén az AI kulcsszó találatok bm25 relevancia szerint rendeződnek
+        (a legjobb találat elöl); kulcsszó szűrő nélkül fájl útvonal szerint.
+        seek_after: egy seek_key() kulcs; megadása esetén a rendezés szerint az utána következő sorokat adja
+        (keyset lapozás, OFFSET nélkül). Relevancia szerinti rendezésnél helyette az offset használható.
+        """
+        try:
+            from_sql, where_clauses, params, order_expr = self.build_filter_query(filter_queries, date_filter, logical_operator, order_by)
+        except ValueError as e:
+            self.error_handler("Hiba", f"Érvénytelen dátum a szűrőben: {e}")
+            return []
+
+        if seek_after is not None and order_by != "relevance":
+            seek_clause, seek_params = self.build_seek_clause(order_expr, order_direction, seek_after)
+            where_clauses.append(seek_clause)
+            params.extend(seek_params)
+
+        query = f"SELECT files.file_path, files.ai_keywords, files.used_date, files.used FROM {from_sql}"
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+        
+        # Az útvonal másodlagos rendezési kulcsként egyértelművé teszi a sorrendet (ez a lapozási kulcs része is)
+        query += f" ORDER BY {order_expr} {order_direction}"
+        if order_expr != "files.file_path":
+            query += f", files.file_path {order_direction}"
+
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        
+        try:
+            self.cursor.execute(query, tuple(params))
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            self.error_handler("Adatbázis hiba", f"Nem sikerült a lekérdezés: {e} \nLekérdezés: {query} \nParaméterek: {params}")
+            return []
+
+    def iter_files(self, filter_queries=None, date_filter=None, logical_operator="AND", order_by="file_path", order_direction="ASC",
+                   limit=None, page_size=1000):
+        """
+        A szűrt sorok oldalanként (keyset lapozással) lekérdezve, így tetszőleges méretű eredmény
+        bejárható a teljes lista memóriába töltése nélkül. limit=None: nincs felső korlát.
+        """
+        seek_after = None
+        offset = 0
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_limit = page_size if remaining is None else min(page_size, remaining)
+            # A bm25 pontszám nem lapozási kulcs: relevancia szerinti rendezésnél OFFSET-tel lapozunk
+            if order_by == "relevance":
+                rows = self.fetch_files(page_limit, filter_queries, date_filter, logical_operator, order_by, order_direction,
+                                        offset=offset)
+            else:
+                rows = self.fetch_files(page_limit, filter_queries, date_filter, logical_operator, order_by, order_direction,
+                                        seek_after=seek_after)
+            yield from rows
+            if len(rows) < page_limit:
+                return
+            if remaining is not None:
+                remaining -= len(rows)
+            seek_after = self.seek_key(rows[-1], order_by)
+            offset += len(rows)
+
+    def build_seek_clause(self, order_expr, order_direction, seek_after):
+        """
+        Keyset feltétel: a (rendezési érték, fájl útvonal) kulcs után következő sorok.
+        Az SQLite a NULL értékeket növekvő sorrendben előre, csökkenőben a végére teszi.
+        """
+        sort_value, file_path = seek_after
+        if order_expr == "files.file_path":
+            return ("files.file_path > ?" if order_direction == "ASC" else "files.file_path < ?"), [file_path]
+
+        if order_direction == "ASC":
+            if sort_value is None:
+                return f"(({order_expr} IS NULL AND files.file_path > ?) OR {order_expr} IS NOT NULL)", [file_path]
+            return f"({order_expr} > ? OR ({order_expr} = ? AND files.file_path > ?))", [sort_value, sort_value, file_path]
+
+        if sort_value is None:
+            return f"({order_expr} IS NULL AND files.file_path < ?)", [file_path]
+        return f"({order_expr} < ? OR ({order_expr} = ? AND files.file_path < ?) OR {order_expr} IS NULL)", [sort_value, sort_value, file_path]
+
+    def count_files(self, filter_queries=None, date_filter=None, logical_operator="AND"):
+        try:
+            from_sql, where_clauses, params, _ = self.build_filter_query(filter_queries, date_filter, logical_operator)
+        except ValueError:
+            return 0
+        query = f"SELECT COUNT(*) FROM {from_sql}"
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+        try:
+            self.cursor.execute(query, tuple(params))
+            return self.cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Hiba a találatok megszámolásakor: {e}")
+            return 0
+
+    def update_record(self, file_path, column, new_value):
+        try:
+            # Megjegyzés: A new_value lehet None, ami NULL értéket fog beállítani
+            with self.transaction():
+                self.cursor.execute(f"UPDATE files SET {column} = ? WHERE file_path = ?", (new_value, file_path))
+            return True
+        except sqlite3.Error as e:
+            self.error_handler("Adatbázis hiba", f"Hiba az adat frissítésekor: {e}")
+            return False
+
+    def update_records(self, changes):
+        """
+        Több rekord módosításainak mentése egyetlen tranzakcióban.
+        changes: {file_path: {oszlop: új érték}}. Az azonos oszlopkészletű sorok egy executemany
+        hívással mentődnek; ha egy csoport hibára fut, soronként újrapróbáljuk, így egy hibás sor
+        nem akasztja meg a többi mentését.
+        Visszaadja a (sikeresen mentett sorok száma, [(file_path, hibaüzenet), ...]) párost.
+        """
+        editable_columns = ("ai_keywords", "used_date", "used")
+        failures = []
+        groups = {}
+        for file_path, row_changes in changes.items():
+            columns = tuple(column for column in editable_columns if column in row_changes)
+            if not columns or len(columns) != len(row_changes):
+                failures.append((file_path, f"Nem menthető oszlop: {', '.join(sorted(row_changes))}"))
+                continue
+            groups.setdefault(columns, []).append(tuple(row_changes[column] for column in columns) + (file_path,))
+
+        if not self.cursor or not groups:
+            return 0, failures
+
+        success_count = 0
+        try:
+            with self.transaction():
+                for columns, rows in groups.items():
+                    set_clause = ", ".join(f"{column} = ?" for column in columns)
+                    sql = f"UPDATE files SET {set_clause} WHERE file_path = ?"
+
+                    self.cursor.execute("SAVEPOINT update_group")
+                    try:
+                        self.cursor.executemany(sql, rows)
+                        updated = self.cursor.rowcount
+                        self.cursor.execute("RELEASE update_group")
+                    except sqlite3.Error:
+                        self.cursor.execute("ROLLBACK TO update_group")
+                        self.cursor.execute("RELEASE update_group")
+                        updated = 0
+                        for row in rows:
+                            try:
+                                self.cursor.execute(sql, row)
+                                updated += self.cursor.rowcount
+                            except sqlite3.Error as e:
+                                failures.append((row[-1], str(e)))
+
+                    success_count += updated
+                    failed_paths = {file_path for file_path, _ in failures}
+                    if updated < len(rows) - sum(1 for row in rows if row[-1] in failed_paths):
+                        # A hiányzó sorokat (pl. közben törölt rekordokat) csak ekkor keressük meg
+                        failures.extend((file_path, "A rekord nem található az adatbázisban.")
+                                        for file_path in self.find_missing_paths([row[-1] for row in rows if row[-1] not in failed_paths]))
+        except sqlite3.Error as e:
+            return 0, [(file_path, str(e)) for file_path in changes]
+
+        return success_count, failures
+
+    def find_missing_paths(self, file_paths, chunk_size=500):
+        missing = []
+        for start in range(0, len(file_paths), chunk_size):
+            chunk = file_paths[start:start + chunk_size]
+            placeholders = ','.join('?' for _ in chunk)
+            self.cursor.execute(f"SELECT file_path FROM files WHERE file_path IN ({placeholders})", chunk)
+            existing = {row[0] for row in self.cursor.fetchall()}
+            missing.extend(file_path for file_path in chunk if file_path not in existing)
+        return missing
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+# ---
+
+# --- Adatbázis-elérési réteg ---
+class DatabaseWriter:
+    """
+    Az adatbázis egyetlen író szála. A submit() hívások sorba kerülnek; a szál a sorban várakozó
+    műveleteket (legfeljebb max_batch darabot) egyetlen tranzakcióban hajtja végre, mindegyiket saját
+    mentési pontban, így egy hibás művelet a köteg többi részét nem vonja vissza.
+    A visszaadott Future a tranzakció véglegesítése után teljesül. Az író szálon futó műveletből beküldött
+    írás nem kerül a sorba (azt a szál sosem érné el, ha a művelet az eredményére vár), hanem azonnal,
+    a futó tranzakcióban hajtódik végre.
+    """
+    def __init__(self, db_name, max_batch=500):
+        self.db_name = db_name
+        self.max_batch = max_batch
+        # Az író szál DatabaseManager példánya (csak az író szálon használható)
+        self.db = None
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ddimagedb-writer", daemon=True)
+        self._thread.start()
+        # A séma létrehozását (frissítését) megvárjuk, hogy az olvasó kapcsolatok már a kész sémát lássák
+        self._ready.wait()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        function a DatabaseManager egy metódusának neve, vagy egy hívható, ami első paraméterként
+        az író szál DatabaseManager példányát kapja. Visszaad egy concurrent.futures.Future-t.
+        """
+        future = Future()
+        if self.on_writer_thread():
+            future.set_running_or_notify_cancel()
+            try:
+                with self.db.transaction():
+                    future.set_result(self._method(self.db, function)(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Az adatbázis író szála már leállt.")
+            self._queue.put((future, function, args, kwargs))
+        return future
+
+    def close(self, timeout=None):
+        """ A már beküldött műveleteket még végrehajtja, majd leállítja a szálat. """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def on_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    @staticmethod
+    def _method(db, function):
+        return getattr(db, function) if isinstance(function, str) else functools.partial(function, db)
+
+    def _run(self):
+        try:
+            db = self.db = DatabaseManager(self.db_name)
+        finally:
+            self._ready.set()
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                batch = [job]
+                while len(batch) < self.max_batch:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        break
+                    batch.append(job)
+                self._run_batch(db, batch)
+                if job is None:
+                    break
+        finally:
+            db.close()
+
+    def _run_batch(self, db, batch):
+        results = []
+        try:
+            with diagnostics.measure("db.write_batch", rows=len(batch)):
+                with db.transaction():
+                    for future, function, args, kwargs in batch:
+                        if not future.set_running_or_notify_cancel():
+                            continue
+                        method = self._method(db, function)
+                        try:
+                            with db.transaction():
+                                results.append((future, method(*args, **kwargs), None))
+                        except Exception as e:
+                            results.append((future, None, e))
+        except Exception as e:
+            # A köteg tranzakciója nem véglegesült, így egyik művelet eredménye sem érvényes
+            for future, *_ in batch:
+                if future.running():
+                    future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class DatabaseAccess:
+    """
+    Adatbázis-elérési réteg: minden szál saját, csak olvasó kapcsolatot kap (WAL módban ezek nem várnak
+    egymásra és az íróra sem), az írások pedig a közös DatabaseWriter szálon futnak.
+    Egy szál olvasó kapcsolatát csak maga a szál zárhatja be (close_reader); a szál kilépésekor magától is bezárul.
+    """
+    def __init__(self, db_name, max_batch=500):
+        self.db_name = db_name
+        self.writer = DatabaseWriter(db_name, max_batch)
+        self._local = threading.local()
+
+    def reader(self):
+        """ A hívó szál olvasó kapcsolata (az első híváskor nyílik meg). """
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = DatabaseManager(self.db_name, read_only=True)
+            self._local.db = db
+        return db
+
+    def close_reader(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            self._local.db = None
+            db.close()
+
+    def write(self, function, *args, **kwargs):
+        """ Írási művelet beküldése az író szálra (lásd DatabaseWriter.submit); Future-t ad vissza. """
+        return self.writer.submit(function, *args, **kwargs)
+
+    def close(self):
+        self.writer.close()
+        self.close_reader()
+
+
+_shared_databases = {}
+_shared_databases_lock = threading.Lock()
+
+
+def shared_database(db_name):
+    """
+    A folyamat közös DatabaseAccess példánya az adott adatbázisfájlhoz, így a GUI és a háttérfeladatok
+    (beolvasás, mappafigyelés, AI) ugyanazon az író szálon írnak.
+    """
+    key = os.path.abspath(db_name)
+    with _shared_databases_lock:
+        database = _shared_databases.get(key)
+        if database is None:
+            database = DatabaseAccess(db_name)
+            _shared_databases[key] = database
+        return database
+
+
+def close_shared_databases():
+    """ Leállítja a közös író szálakat (a beküldött írásokat még végrehajtják). Kilépéskor automatikusan fut. """
+    with _shared_databases_lock:
+        databases = list(_shared_databases.values())
+        _shared_databases.clear()
+    for database in databases:
+        database.close()
+
+
+atexit.register(close_shared_databases)
+
+
+class DatabaseSession:
+    """
+    DatabaseManager-szerű felület háttérszálaknak: az olvasó metódusok a hívó szál saját kapcsolatán futnak,
+    a WRITE_METHODS metódusok a közös író szálon; ezek megvárják az eredményt, a hívó szál közben blokkol.
+    Magán az író szálon (egy beküldött műveletből) minden metódus közvetlenül az író kapcsolatán fut, így
+    nem vár önmagára, és az olvasások is látják a futó tranzakció változásait.
+    """
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.database = shared_database(db_name)
+
+    def __getattr__(self, name):
+        writer = self.database.writer
+        if writer.on_writer_thread():
+            return getattr(writer.db, name)
+        if name in DatabaseManager.WRITE_METHODS:
+            return lambda *args, **kwargs: self.database.write(name, *args, **kwargs).result()
+        return getattr(self.database.reader(), name)
+
+    def close(self):
+        self.database.close_reader()
+# ---
+
+# --- QueryCache osztály ---
+class QueryCache:
+    """
+    A táblázat lekérdezéseinek (találatszám és oldalak) gyorsítótára, így a rendezés váltása vagy egy szűrő
+    ki-be kapcsolása nem futtatja újra ugyanazt a lekérdezést. A kulcs a normalizált szűrő; egy szűrőn belül
+    a rendezés, a lapozási kulcs és a limit szerint tárol. Az adatverzió (DatabaseManager.data_version)
+    változásakor minden bejegyzés törlődik.
+    Legfeljebb memory_sort_rows találat esetén a teljes eredmény a memóriába kerül: a lapok ebből szeletelődnek,
+    és egy másik oszlop szerinti rendezés Pythonban történik, az SQLite megkérdezése nélkül.
+    A metódusok a DatabaseManager azonos nevű metódusainak felelnek meg, első paraméterük a lekérdezéshez
+    használt adatbázis (DatabaseManager vagy DatabaseSession). cached_only=True esetén lekérdezés helyett
+    None-t adnak, ha az eredmény nincs a gyorsítótárban (így a GUI szála csak a kész eredményt veszi át).
+    Több szálból is használható.
+    """
+    # Ezek szerint a seek_key() értéke az SQL rendezéssel azonos sorrendet ad (a bm25 relevancia nem ilyen)
+    MEMORY_SORT_COLUMNS = ("file_path", "ai_keywords", "used_date", "used")
+
+    def __init__(self, max_rows=200000, memory_sort_rows=20000):
+        self.max_rows = max_rows
+        self.memory_sort_rows = memory_sort_rows
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def normalize_filter(self, filter_queries=None, date_filter=None, logical_operator="AND"):
+        """
+        A szűrők gyorsítótár-kulcsa. A feltételek sorrendje nem számít, a kikapcsolt dátumszűrő mezői
+        elhagyhatók, és legfeljebb egy ÉS/VAGY-gyal kapcsolt feltételnél a logikai operátor sem számít.
+        """
+        filters = []
+        conditions = 0
+        for column, value in (filter_queries or {}).items():
+            if value is None:
+                continue
+            if column in ("keywords_include", "keywords_exclude"):
+                # A kulcsszólisták mindig szűkítenek, az operátortól függetlenül
+                if value:
+                    filters.append((column, tuple(sorted(value))))
+                continue
+            if column == "include_missing":
+                if value:
+                    filters.append((column, True))
+                continue
+            filters.append((column, value))
+            conditions += 1
+        date_key = None
+        if date_filter and date_filter.get("type", "Nincs") != "Nincs":
+            date_key = (date_filter["type"], date_filter.get("from") or "", date_filter.get("to") or "")
+            conditions += 1
+        if conditions < 2:
+            logical_operator = "AND"
+        return tuple(sorted(filters)), date_key, logical_operator
+
+    def count_files(self, db, filter_queries=None, date_filter=None, logical_operator="AND", cached_only=False):
+        with self._lock:
+            entry = self._entry(db, filter_queries, date_filter, logical_operator)
+            if entry["count"] is None:
+                if cached_only:
+                    return None
+                self.misses += 1
+                entry["count"] = db.count_files(filter_queries, date_filter, logical_operator)
+            else:
+                self.hits += 1
+            return entry["count"]
+
+    def fetch_files(self, db, limit=10, filter_queries=None, date_filter=None, logical_operator="AND", order_by="file_path",
+                    order_direction="ASC", seek_after=None, offset=0, cached_only=False):
+        with self._lock:
+            entry = self._entry(db, filter_queries, date_filter, logical_operator)
+            order = (order_by, order_direction)
+            view = self._view(db, entry, order, filter_queries, date_filter, logical_operator, cached_only)
+            if view is not None:
+                start = offset
+                if seek_after is not None and order_by != "relevance":
+                    position = self._view_positions(entry, order).get(seek_after[1])
+                    if position is None:
+                        if cached_only:
+                            return None
+                        # A lapozási kulcs sora már nincs a találatok között: az SQLite keresi meg a helyét
+                        self.misses += 1
+                        return db.fetch_files(limit, filter_queries, date_filter, logical_operator, order_by, order_direction,
+                                              seek_after, offset)
+                    start += position + 1
+                self.hits += 1
+                return view[start:] if limit is None else view[start:start + limit]
+
+            page_key = (order, seek_after if order_by != "relevance" else None, offset, limit)
+            rows = entry["pages"].get(page_key)
+            if rows is not None:
+                self.hits += 1
+                return rows
+            if cached_only:
+                return None
+            self.misses += 1
+            rows = db.fetch_files(limit, filter_queries, date_filter, logical_operator, order_by, order_direction,
+                                  seek_after, offset)
+            entry["pages"][page_key] = rows
+            self._add_rows(entry, len(rows))
+            return rows
+
+    def _entry(self, db, filter_queries, date_filter, logical_operator):
+        version = db.data_version()
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+        key = self.normalize_filter(filter_queries, date_filter, logical_operator)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = {"count": None, "rows": None, "views": {}, "positions": {}, "pages": {}, "size": 0}
+            self.entries[key] = entry
+        self.entries.move_to_end(key)
+        return entry
+
+    def _view(self, db, entry, order, filter_queries, date_filter, logical_operator, cached_only=False):
+        """
+        A teljes találati lista az adott rendezésben, ha a memóriában tartható; egyébként None.
+        cached_only=True esetén csak a már a memóriában lévő sorokból állítja elő.
+        """
+        view = entry["views"].get(order)
+        if view is not None:
+            return view
+        order_by, order_direction = order
+        if entry["rows"] is not None and order_by in self.MEMORY_SORT_COLUMNS:
+            opposite = entry["views"].get((order_by, "DESC" if order_direction == "ASC" else "ASC"))
+            if opposite is not None:
+                # A (rendezési érték, útvonal) szerinti teljes sorrend megfordítva az ellenkező irányt adja
+                view = opposite[::-1]
+            else:
+                view = self._sort_rows(db, entry["rows"], order_by, order_direction)
+        if view is None:
+            if cached_only or entry["count"] is None or entry["count"] > self.memory_sort_rows:
+                return None
+            view = db.fetch_files(None, filter_queries, date_filter, logical_operator, order_by, order_direction)
+            if entry["rows"] is None:
+                entry["rows"] = view
+        entry["views"][order] = view
+        self._add_rows(entry, len(view))
+        return view
+
+    def _sort_rows(self, db, rows, order_by, order_direction):
+        def sort_key(row):
+            value = db.seek_key(row, order_by)[0]
+            # Az SQLite növekvő sorrendben a NULL értékeket teszi előre
+            return (value is not None, value, row[0])
+        try:
+            return sorted(rows, key=sort_key, reverse=order_direction == "DESC")
+        except TypeError:
+            # Vegyes típusú oszlopértékek: ezek sorrendjét az SQLite szabályai szerint az adatbázis adja meg
+            return None
+
+    def _view_positions(self, entry, order):
+        positions = entry["positions"].get(order)
+        if positions is None:
+            positions = {row[0]: index for index, row in enumerate(entry["views"][order])}
+            entry["positions"][order] = positions
+        return positions
+
+    def _add_rows(self, entry, count):
+        entry["size"] += count
+        total = sum(cached["size"] for cached in self.entries.values())
+        # A legrégebben használt szűrők eredményei kerülnek ki először; az épp használt bejegyzés marad
+        while total > self.max_rows and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            total -= evicted["size"]
+# ---
+
+# --- FolderScanner osztály ---
+class FolderScanner:
+    """
+    Rekurzívan bejárja a mappákat egy szálkészleten, és a változásokat
+    nagy kötegekben, kötegenként egy tranzakcióban írja az adatbázisba.
+    Növekményes módban a katalógus szerint változatlan mappákat ki sem listázza,
+    csak az almappáikba lép tovább.
+    A háttérszálon saját olvasó kapcsolattal fut, a kötegeket a közös író szál menti.
+    """
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
+
+    def __init__(self, db_name, max_workers=None, batch_size=5000, progress_callback=None, progress_interval=0.5,
+                 incremental=True, missing_policy="mark", compute_hashes=True, hash_workers=None):
+        self.db_name = db_name
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        # A perceptuális hash számítása CPU-igényes, ezért külön folyamatokban fut
+        self.compute_hashes = compute_hashes
+        self.hash_workers = hash_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.incremental = incremental
+        # "mark": az eltűnt fájlokat csak megjelöli a katalógusban (a táblázatban rejtve maradnak),
+        # "purge": törli őket az adatbázisból
+        self.missing_policy = missing_policy
+        self._last_progress = 0.0
+        self._stop_event = threading.Event()
+
+    def cancel(self):
+        self._stop_event.set()
+
+    @diagnostics.timed("scan", rows=lambda stats: stats["files"])
+    def scan(self, folders, only_new_subdirs=False):
+        """
+        Beolvassa a megadott gyökérmappákat az összes almappájukkal együtt.
+        only_new_subdirs=True esetén a listázott mappákból csak a katalógusban még
+        nem szereplő almappákba lép tovább (a mappafigyelő így frissít egy-egy mappát).
+        Visszaad egy statisztikát: bejárt és kihagyott mappák, talált képek,
+        új, módosult, eltűnt és áthelyezett fájlok, hibák.
+        """
+        stats = {"dirs": 0, "skipped_dirs": 0, "files": 0, "new": 0, "modified": 0, "missing": 0, "moved": 0, "hashed": 0,
+                 "errors": []}
+        db = DatabaseSession(self.db_name)
+        dir_catalog = db.load_dir_catalog()
+        known_subdirs = {}
+        for dir_path, (parent_path, _) in dir_catalog.items():
+            known_subdirs.setdefault(parent_path, []).append(dir_path)
+
+        pending = self._empty_delta()
+        pending_count = 0
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = set()
+                # Átfedő gyökérmappák esetén se listázzunk egy mappát kétszer
+                submitted = set()
+                for folder_path in folders:
+                    if folder_path in submitted:
+                        continue
+                    submitted.add(folder_path)
+                    if not os.path.isdir(folder_path):
+                        # Elérhetetlen gyökérmappa (pl. leválasztott hálózati meghajtó) esetén nem jelölünk semmit eltűntnek
+                        stats["errors"].append(f"A mappa nem létezik: {folder_path}")
+                        continue
+                    catalog_entry = dir_catalog.get(folder_path)
+                    parent_path = catalog_entry[0] if catalog_entry else None
+                    futures.add(executor.submit(self._scan_directory, folder_path, parent_path, catalog_entry))
+
+                # Minden mappa külön feladat, így egyetlen nagy gyökérmappa is párhuzamosan járható be
+                while futures:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        dir_path, parent_path, mtime_ns, files, subdirs, error = future.result()
+                        if error:
+                            stats["errors"].append(f"Hiba a mappa beolvasásakor ({dir_path}): {error}")
+                            continue
+                        if self._stop_event.is_set():
+                            continue
+
+                        previous_subdirs = known_subdirs.get(dir_path, [])
+                        if files is None:
+                            stats["skipped_dirs"] += 1
+                            subdirs = [] if only_new_subdirs else previous_subdirs
+                        else:
+                            stats["dirs"] += 1
+                            pending_count += self._diff_directory(db, dir_path, parent_path, mtime_ns, files, subdirs,
+                                                                  previous_subdirs, pending, stats)
+                            if only_new_subdirs:
+                                subdirs = [d for d in subdirs if d not in dir_catalog]
+
+                        for subdir in subdirs:
+                            if subdir in submitted:
+                                continue
+                            submitted.add(subdir)
+                            futures.add(executor.submit(self._scan_directory, subdir, dir_path, dir_catalog.get(subdir)))
+
+                    if pending_count >= self.batch_size:
+                        self._flush(db, pending, stats)
+                        pending = self._empty_delta()
+                        pending_count = 0
+                    self._report_progress(stats)
+
+            self._flush(db, pending, stats)
+            if self.compute_hashes:
+                self._hash_new_files(db, stats)
+            # Az áthelyezett fájlok a hash-ek után ismerhetők fel (inode hiányában a tartalmi hash alapján)
+            stats["moved"] += db.relink_moved_files()
+            if self.missing_policy == "purge" and not self._stop_event.is_set():
+                # A kötegek csak megjelölik az eltűnt fájlokat (az áthelyezés felismeréséig); a törlés ekkor történik
+                db.purge_missing_files()
+        finally:
+            db.close()
+
+        stats["cancelled"] = self._stop_event.is_set()
+        self._report_progress(stats, force=True)
+        return stats
+
+    def _scan_directory(self, dir_path, parent_path, catalog_entry):
+        """
+        Egy mappa közvetlen tartalmának listázása (háttérszálon fut).
+        Ha a mappa mtime-ja megegyezik a katalógusban tárolttal, a fájlok helyett None-t ad vissza.
+        """
+        files = []
+        subdirs = []
+        try:
+            # Az mtime-ot a listázás előtt olvassuk, így a közben történt változás a következő beolvasáskor látszik
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            if self.incremental and catalog_entry is not None and catalog_entry[1] == mtime_ns:
+                return dir_path, parent_path, mtime_ns, None, None, None
+
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        # A szimbolikus linkelt mappákat nem követjük, így nem lehet végtelen ciklus
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(self.IMAGE_EXTENSIONS) and entry.is_file():
+                            st = entry.stat()
+                            files.append((entry.path, st.st_mtime_ns, st.st_size, st.st_ino))
+                    except OSError:
+                        continue
+        except OSError as e:
+            return dir_path, parent_path, None, None, None, e
+        return dir_path, parent_path, mtime_ns, files, subdirs, None
+
+    def _diff_directory(self, db, dir_path, parent_path, mtime_ns, files, subdirs, previous_subdirs, pending, stats):
+        """
+        Összeveti a listázott mappát a katalógussal, és a különbséget a függő kötegbe teszi.
+        Visszaadja a kötegbe került műveletek számát.
+        """
+        known_files = db.fetch_file_stats(dir_path)
+        count_before = sum(len(rows) for rows in pending.values())
+
+        stats["files"] += len(files)
+        for file_path, file_mtime_ns, size, inode in files:
+            known = known_files.pop(file_path, None)
+            if known is None:
+                pending["new_paths"].append(file_path)
+            elif known[:3] == (file_mtime_ns, size, inode) and not known[3]:
+                continue
+            elif known[:3] != (file_mtime_ns, size, inode):
+                stats["modified"] += 1
+            pending["file_stats"].append((file_path, dir_path, file_mtime_ns, size, inode))
+
+        pending["missing_paths"].extend(file_path for file_path, known in known_files.items() if not known[3])
+
+        current_subdirs = set(subdirs)
+        pending["removed_dirs"].extend(d for d in previous_subdirs if d not in current_subdirs)
+        # Az almappákat mtime nélkül regisztráljuk; a saját mtime-juk csak sikeres listázás után kerül be
+        pending["dir_stats"].extend((subdir, dir_path, None) for subdir in subdirs)
+        pending["dir_stats"].append((dir_path, parent_path, mtime_ns))
+
+        return sum(len(rows) for rows in pending.values()) - count_before
+
+    def _hash_new_files(self, db, stats, chunk_size=1000):
+        """
+        Kiszámolja a perceptuális és a tartalmi hash-t az új és módosult fájlokra (és a korábbi,
+        megszakadt beolvasásokból hash nélkül maradtakra), kötegenként egy tranzakcióban mentve.
+        A változatlan (méretű és mtime-ú) fájlokat nem olvassa újra.
+        """
+        tasks = db.fetch_unhashed_files(chunk_size)
+        if not tasks:
+            return
+        with ProcessPoolExecutor(max_workers=self.hash_workers) as executor:
+            while tasks and not self._stop_event.is_set():
+                hashes = list(executor.map(_file_hash_task, tasks, chunksize=32))
+                if not db.save_file_hashes(hashes):
+                    break
+                stats["hashed"] += len(hashes)
+                self._report_progress(stats)
+                tasks = db.fetch_unhashed_files(chunk_size)
+
+    def _empty_delta(self):
+        return {"new_paths": [], "file_stats": [], "missing_paths": [], "dir_stats": [], "removed_dirs": []}
+
+    def _flush(self, db, pending, stats):
+        if not any(pending.values()):
+            return
+        new_count, missing_count = db.apply_scan_delta(**pending)
+        stats["new"] += new_count
+        stats["missing"] += missing_count
+
+    def _report_progress(self, stats, force=False):
+        if not self.progress_callback:
+            return
+        now = time.monotonic()
+        if force or now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.progress_callback(dict(stats, errors=len(stats["errors"])))
+# ---
+
+# --- FolderWatcher osztály ---
+class FolderWatcher:
+    """
+    Folyamatosan figyeli a beállított mappákat, és a változásokat az adatbázisba vezeti.
+    Linuxon inotify-t használ; máshol, vagy ha az inotify nem elérhető, időszakos
+    növekményes beolvasással (a mappák mtime-ja alapján) követi a változásokat.
+    Az események sorozatát (pl. egy fényképezőgép ürítését) összevonja, és egyetlen
+    kötegelt beolvasással dolgozza fel.
+    """
+    def __init__(self, db_name, folders, change_callback=None, debounce=1.0, max_delay=10.0, poll_interval=30.0,
+                 missing_policy="mark"):
+        self.db_name = db_name
+        self.folders = list(folders)
+        self.change_callback = change_callback
+        # Ennyi csend után dolgozzuk fel az összegyűjtött eseményeket...
+        self.debounce = debounce
+        # ...de folyamatos eseményáradat esetén legfeljebb ennyit várunk
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.missing_policy = missing_policy
+        self.mode = None
+        self._stop_event = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # Minden indítás saját leállítási jelzést kap, így egy még leálló régi szál nem fut tovább
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+        self._thread = None
+
+    def _run(self, stop_event):
+        # Indításkor egy növekményes beolvasás pótolja a program leállása óta történt változásokat
+        self._sync(self.folders, incremental=True)
+
+        inotify = _Inotify.create()
+        if inotify is not None:
+            try:
+                for folder_path in self.folders:
+                    inotify.add_tree(folder_path)
+                self.mode = "inotify"
+                self._run_inotify(inotify, stop_event)
+                return
+            except OSError as e:
+                # Pl. elfogyott a max_user_watches keret: polling üzemmódra váltunk
+                print(f"Az inotify nem használható ({e}), időszakos ellenőrzésre váltás.")
+            finally:
+                inotify.close()
+
+        self.mode = "polling"
+        while not stop_event.wait(self.poll_interval):
+            self._sync(self.folders, incremental=True)
+
+    def _run_inotify(self, inotify, stop_event):
+        dirty_dirs = set()
+        rescan_all = False
+        first_event = last_event = None
+
+        while not stop_event.is_set():
+            timeout = 1.0
+            if first_event is not None:
+                now = time.monotonic()
+                timeout = max(0.0, min(last_event + self.debounce, first_event + self.max_delay) - now)
+
+            changed_dirs, overflow = inotify.read_events(timeout, FolderScanner.IMAGE_EXTENSIONS)
+            if changed_dirs or overflow:
+                now = time.monotonic()
+                first_event = first_event or now
+                last_event = now
+                dirty_dirs.update(changed_dirs)
+                rescan_all = rescan_all or overflow
+
+            if first_event is None:
+                continue
+            now = time.monotonic()
+            if now - last_event >= self.debounce or now - first_event >= self.max_delay:
+                if rescan_all:
+                    # Túlcsordult az eseménysor: nem tudjuk, mi változott, ezért minden mappát ellenőrzünk
+                    self._sync(self.folders, incremental=True)
+                else:
+                    # Az eseményt kapott mappákat akkor is listázzuk, ha az mtime-juk nem változott (helyben módosított fájl)
+                    self._sync(sorted(dirty_dirs), incremental=False, only_new_subdirs=True)
+                dirty_dirs = set()
+                rescan_all = False
+                first_event = last_event = None
+
+    def _sync(self, folders, incremental, only_new_subdirs=False):
+        scanner = FolderScanner(self.db_name, incremental=incremental, missing_policy=self.missing_policy)
+        try:
+            stats = scanner.scan(folders, only_new_subdirs=only_new_subdirs)
+        except Exception as e:
+            print(f"Hiba a figyelt mappák frissítésekor: {e}")
+            return
+        if self.change_callback and (stats["new"] or stats["modified"] or stats["missing"] or stats["moved"]):
+            self.change_callback(stats)
+# ---
+
+# --- _Inotify osztály ---
+class _Inotify:
+    """
+    Vékony ctypes-burkoló a Linux inotify API-hoz (külső függőség nélkül).
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+                  IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+        self.watches = {}
+
+    @classmethod
+    def create(cls):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(cls.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def add_watch(self, dir_path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), dir_path)
+        self.watches[wd] = dir_path
+
+    def add_tree(self, root_path):
+        stack = [root_path]
+        while stack:
+            dir_path = stack.pop()
+            try:
+                self.add_watch(dir_path)
+                with os.scandir(dir_path) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except (FileNotFoundError, PermissionError):
+                continue
+
+    def read_events(self, timeout, extensions):
+        """
+        Legfeljebb timeout másodpercig vár eseményekre. Visszaadja a változott
+        mappák halmazát és azt, hogy túlcsordult-e a kernel eseménysora.
+        """
+        changed_dirs = set()
+        overflow = False
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed_dirs, overflow
+
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b"\0"))
+            offset += name_len
+
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            dir_path = self.watches.get(wd)
+            if dir_path is None:
+                continue
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                # A szülőmappa is kap eseményt, a katalógust az ő listázása frissíti
+                continue
+
+            if mask & self.IN_ISDIR:
+                changed_dirs.add(dir_path)
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    try:
+                        self.add_tree(os.path.join(dir_path, name))
+                    except OSError:
+                        overflow = True
+            elif name.lower().endswith(extensions):
+                changed_dirs.add(dir_path)
+        return changed_dirs, overflow
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+# ---
+
+# --- Tartalom hash ---
+def compute_content_hash(file_path, chunk_size=1024 * 1024):
+    """
+    A fájl tartalmának BLAKE2b hash-e, darabonként olvasva, hogy nagy fájloknál se kelljen
+    az egészet a memóriába tölteni.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+# ---
+
+# --- Perceptuális hash ---
+def compute_perceptual_hash(file_path, hash_size=8):
+    """
+    A kép dHash-e: a (hash_size+1) x hash_size méretűre kicsinyített szürke képen a szomszédos
+    pixelek világosságának összehasonlítása, hash_size * hash_size bites egészként.
+    Olvashatatlan képnél None. Modulszintű függvény, hogy ProcessPoolExecutorban is futtatható legyen.
+    """
+    from PIL import Image
+    try:
+        with Image.open(file_path) as image:
+            # JPEG-nél csökkentett felbontású dekódolás: a hashhez úgyis csak néhány pixel kell
+            image.draft("L", (hash_size * 8, hash_size * 8))
+            pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _file_hash_task(task):
+    """
+    Egy fájl hiányzó hash-einek kiszámítása (folyamatkészletben fut): (file_path, phash, content_hash),
+    a nem kért hash helyén False, az olvashatatlan fájlnál None.
+    """
+    file_path, need_phash, need_content = task
+    phash = compute_perceptual_hash(file_path) if need_phash else False
+    content_hash = False
+    if need_content:
+        try:
+            content_hash = compute_content_hash(file_path)
+        except OSError:
+            content_hash = None
+    return file_path, phash, content_hash
+
+
+def to_signed_64(value):
+    """
+    Előjel nélküli 64 bites egész -> előjeles (az SQLite INTEGER tartománya).
+    """
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+# ---
+
+# --- BKTree osztály ---
+class BKTree:
+    """
+    BK-fa Hamming-távolsággal: a megadott sugáron belüli hash-ek keresése a teljes halmaz
+    végigpróbálása nélkül (a háromszög-egyenlőtlenség alapján a legtöbb ág kimarad).
+    """
+    def __init__(self):
+        # Csomópont: [hash, {távolság: gyerek csomópont}]
+        self.root = None
+
+    def add(self, value):
+        if self.root is None:
+            self.root = [value, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                return
+            node = child
+
+    def query(self, value, max_distance):
+        """
+        A value-tól legfeljebb max_distance távolságra lévő hash-ek: [(hash, távolság)].
+        """
+        results = []
+        if self.root is None:
+            return results
+        stack = [self.root]
+        while stack:
+            node_value, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                results.append((node_value, distance))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return results
+
+
+def group_near_duplicates(hash_rows, max_distance):
+    """
+    A (file_path, phash) sorokat közeli másolat-csoportokba rendezi: két kép egy csoportba kerül,
+    ha a hash-eik Hamming-távolsága legfeljebb max_distance (a kapcsolat tranzitív).
+    Csak a legalább kételemű csoportokat adja vissza, a legnagyobbal kezdve.
+    """
+    paths_by_hash = {}
+    for file_path, phash in hash_rows:
+        paths_by_hash.setdefault(phash, []).append(file_path)
+
+    tree = BKTree()
+    for phash in paths_by_hash:
+        tree.add(phash)
+
+    # Union-find az egyedi hash-eken
+    parent = {phash: phash for phash in paths_by_hash}
+
+    def find(phash):
+        while parent[phash] != phash:
+            parent[phash] = parent[parent[phash]]
+            phash = parent[phash]
+        return phash
+
+    if max_distance > 0:
+        for phash in paths_by_hash:
+            for neighbor, _ in tree.query(phash, max_distance):
+                root_a, root_b = find(phash), find(neighbor)
+                if root_a != root_b:
+                    parent[root_b] = root_a
+
+    groups = {}
+    for phash, file_paths in paths_by_hash.items():
+        groups.setdefault(find(phash), []).extend((file_path, phash) for file_path in file_paths)
+    result = [sorted(group) for group in groups.values() if len(group) > 1]
+    result.sort(key=len, reverse=True)
+    return result
+# ---
+
+# --- Kép előkészítése feltöltéshez ---
+def encode_image_for_upload(file_path, max_edge=1024, quality=85, image_format="JPEG"):
+    """
+    Lekicsinyíti a képet (a hosszabbik oldala legfeljebb max_edge pixel, 0 = nincs kicsinyítés)
+    és JPEG vagy WEBP formátumban újrakódolja. A (bájtok, MIME típus) párt adja vissza.
+    Modulszintű függvény, hogy ProcessPoolExecutorban is futtatható legyen.
+    """
+    from PIL import Image
+    image_format = image_format.upper()
+    with Image.open(file_path) as image:
+        if max_edge:
+            if image.format == "JPEG":
+                # JPEG-nél a dekódolás is kisebb felbontásban történhet, ez a nagy képeknél a legtöbb időt spórolja
+                image.draft("RGB", (max_edge, max_edge))
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, quality=quality)
+    return buffer.getvalue(), Image.MIME[image_format]
+# ---
+
+# --- AI kulcsszó-generáló kliensek ---
+class KeywordClientError(Exception):
+    """
+    AI szolgáltatás hibája HTTP státuszkóddal (ha van), a retry döntéshez.
+    """
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class KeywordClient:
+    """
+    A kulcsszó-generáló AI szolgáltatás felülete. A generate_keywords a képből és a promptból
+    a modell szöveges válaszát és a felhasznált tokenek számát adja vissza (ha ismert, különben None).
+    Bármely szálról hívható kell legyen. A model_name az AI gyorsítótár kulcsának része.
+    """
+    model_name = None
+
+    def generate_keywords(self, prompt, image_data, mime_type):
+        raise NotImplementedError
+
+
+class GeminiKeywordClient(KeywordClient):
+    def __init__(self, api_key, model_name='gemini-2.0-flash'):
+        # A google.generativeai (grpc/protobuf) betöltése lassú, ezért csak az első használatkor importáljuk
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate_keywords(self, prompt, image_data, mime_type):
+        response = self.model.generate_content([prompt, {"mime_type": mime_type, "data": image_data}])
+        usage = getattr(response, "usage_metadata", None)
+        return response.text.strip(), getattr(usage, "total_token_count", None)
+
+
+class HttpKeywordClient(KeywordClient):
+    """
+    Egyszerű JSON-os HTTP kliens, amivel egy helyi tesztszerver helyettesítheti a Geminit
+    (pl. az áteresztőképesség méréséhez). Kérés: {"model", "prompt", "mime_type", "image_base64"},
+    válasz: {"text", "total_tokens"}.
+    """
+    def __init__(self, url, model_name='gemini-2.0-flash', timeout=60):
+        self.url = url
+        self.model_name = model_name
+        self.timeout = timeout
+
+    def generate_keywords(self, prompt, image_data, mime_type):
+        body = json.dumps({
+            "model": self.model_name,
+            "prompt": prompt,
+            "mime_type": mime_type,
+            "image_base64": base64.b64encode(image_data).decode("ascii")
+        }).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                result = json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get("Retry-After") if e.headers else None
+            raise KeywordClientError(f"HTTP {e.code}: {e.reason}", status_code=e.code,
+                                     retry_after=float(retry_after) if retry_after else None)
+        return result.get("text", "").strip(), result.get("total_tokens")
+# ---
+
+# --- TokenBucket osztály ---
+class TokenBucket:
+    """
+    Szálbiztos token bucket korlátozó percenkénti kerettel. A keret egyenletesen töltődik,
+    legfeljebb burst_seconds másodpercnyi keret gyűlhet fel. A consume negatív egyenleget
+    (tartozást) is megenged, így a kérés után ismertté vált tényleges tokenszám utólag levonható.
+    """
+    def __init__(self, per_minute, burst_seconds=10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1.0, stop_event=None):
+        """
+        Vár, amíg a keret engedi az amount felhasználását. Ha a stop_event közben beáll, False-t ad vissza.
+        """
+        # A keretnél nagyobb kérés is átmehet, ha a keret tele van (különben sosem indulna el)
+        amount = min(amount, self.capacity)
+        with self.condition:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait_time = (amount - self.tokens) / self.rate if self.rate > 0 else 1.0
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                self.condition.wait(min(wait_time, 0.5))
+
+    def consume(self, amount):
+        with self.condition:
+            self._refill()
+            self.tokens -= amount
+# ---
+
+# --- KeywordTaggingEngine osztály ---
+class KeywordTaggingEngine:
+    """
+    Párhuzamos AI kulcsszó-generálás: legfeljebb max_concurrency kérés fut egyszerre, a percenkénti
+    kérés- és tokenkeretet token bucketek tartják be, a 429/5xx és hálózati hibákat exponenciális
+    visszalépéssel (jitterrel) újrapróbálja.
+    """
+    RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+    def __init__(self, client, prompt, requests_per_minute=15, tokens_per_minute=1000000, max_concurrency=4,
+                 max_retries=5, backoff_base=2.0, backoff_max=60.0, image_max_edge=1024, image_quality=85,
+                 image_format="JPEG", encode_workers=None):
+        self.client = client
+        self.prompt = prompt
+        self.image_max_edge = image_max_edge
+        self.image_quality = image_quality
+        self.image_format = image_format
+        self.encode_workers = encode_workers or min(max_concurrency, os.cpu_count() or 1)
+        self._encode_executor = None
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # A kérés tokenigényét előre nem ismerjük: az eddigi átlaggal becsülünk, majd utólag korrigálunk
+        self.estimated_tokens = 1000.0
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._stop_event.set()
+
+    def run(self, file_paths, result_callback):
+        """
+        Feldolgozza a fájlokat; minden fájlra egyszer hívja a result_callback(file_path, keywords, error)
+        függvényt (a munkaszálakról). Visszaadja a (sikeres, sikertelen) darabszámot.
+        """
+        counts = {"done": 0, "failed": 0}
+
+        def process(file_path):
+            if self._stop_event.is_set():
+                return
+            try:
+                keywords = self.generate_with_retry(file_path)
+            except Exception as e:
+                with self._lock:
+                    counts["failed"] += 1
+                result_callback(file_path, None, e)
+                return
+            if keywords is None:
+                return
+            with self._lock:
+                counts["done"] += 1
+            result_callback(file_path, keywords, None)
+
+        # A képek újrakódolása CPU-igényes, ezért külön folyamatokban fut; így az egyik kép
+        # kódolása átfedésben van a többi kép hálózati kérésével
+        self._encode_executor = ProcessPoolExecutor(max_workers=self.encode_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                for file_path in file_paths:
+                    executor.submit(process, file_path)
+        finally:
+            self._encode_executor.shutdown(cancel_futures=True)
+            self._encode_executor = None
+        return counts["done"], counts["failed"]
+
+    def prepare_image(self, file_path):
+        """
+        A kép feltöltendő bájtjai és MIME típusa: a képet a folyamatkészletben lekicsinyítjük
+        és újrakódoljuk, hogy a feltöltés kicsi legyen.
+        """
+        args = (file_path, self.image_max_edge, self.image_quality, self.image_format)
+        if self._encode_executor is None:
+            return encode_image_for_upload(*args)
+        return self._encode_executor.submit(encode_image_for_upload, *args).result()
+
+    def generate_with_retry(self, file_path):
+        image_data, mime_type = self.prepare_image(file_path)
+        attempt = 0
+        while True:
+            if not self.request_bucket.acquire(1, self._stop_event):
+                return None
+            estimate = self.estimated_tokens
+            if not self.token_bucket.acquire(estimate, self._stop_event):
+                return None
+            try:
+                with diagnostics.measure("ai.request", model=self.client.model_name, attempt=attempt) as record:
+                    keywords, used_tokens = self.client.generate_keywords(self.prompt, image_data, mime_type)
+                    record["tokens"] = used_tokens
+            except Exception as e:
+                status_code = self.error_status_code(e)
+                retryable = status_code in self.RETRYABLE_STATUS_CODES or (status_code is None and isinstance(e, (OSError, TimeoutError)))
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                # Exponenciális visszalépés teljes jitterrel; a szerver Retry-After kérését betartjuk
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after:
+                    delay = max(delay, retry_after)
+                attempt += 1
+                if self._stop_event.wait(delay):
+                    return None
+                continue
+
+            if used_tokens:
+                self.token_bucket.consume(used_tokens - estimate)
+                with self._lock:
+                    self.estimated_tokens = 0.8 * self.estimated_tokens + 0.2 * used_tokens
+            return keywords
+
+    def error_status_code(self, error):
+        """
+        HTTP státuszkód a kivételből: a saját KeywordClientError-ból, vagy a google.api_core
+        kivételek code attribútumából.
+        """
+        for attribute in ("status_code", "code"):
+            value = getattr(error, attribute, None)
+            if isinstance(value, int):
+                return value
+            if hasattr(value, "value") and isinstance(value.value, int):
+                return value.value
+        return None
+# ---
+
+# --- KeywordJobRunner osztály ---
+def create_keyword_engine(settings):
+    """
+    A beállítások alapján összeállított KeywordTaggingEngine.
+    """
+    model_name = settings.get("ai_model", "gemini-2.0-flash")
+    if settings.get("ai_backend", "gemini") == "http":
+        client = HttpKeywordClient(settings.get("ai_stub_url", "http://127.0.0.1:8765/generate"), model_name)
+    else:
+        client = GeminiKeywordClient(settings.get("google_api_key"), model_name)
+    return KeywordTaggingEngine(
+        client,
+        settings.get("ai_prompt"),
+        requests_per_minute=float(settings.get("ai_requests_per_minute", 15)),
+        tokens_per_minute=float(settings.get("ai_tokens_per_minute", 1000000)),
+        max_concurrency=int(settings.get("ai_max_concurrency", 4)),
+        max_retries=int(settings.get("ai_max_retries", 5)),
+        image_max_edge=int(settings.get("ai_image_max_edge", 1024)),
+        image_quality=int(settings.get("ai_image_quality", 85)),
+        image_format=settings.get("ai_image_format", "JPEG")
+    )
+
+
+def check_ai_settings(settings):
+    """
+    Hibaüzenet, ha az AI kulcsszó-generáláshoz hiányzik egy beállítás; különben None.
+    """
+    if not settings.get("google_api_key") and settings.get("ai_backend", "gemini") == "gemini":
+        return "Kérlek, állítsd be a **Google AI kulcsot** a 'Beállítások' lapon."
+    if not (settings.get("ai_prompt") or "").strip():
+        return "Kérlek, állítsd be az **AI Prompt Sablont** a 'Beállítások' lapon."
+    return None
+
+
+class KeywordJobRunner:
+    """
+    Feldolgozza az AI feladatsor (ai_jobs) várakozó feladatait: az azonos tartalmú képeket egyszer
+    küldi el, a gyorsítótárban lévő eredményeket újrahasznosítja, az eredményeket kötegekben menti.
+    A hívó szálon fut, saját olvasó kapcsolattal; az eredményeket a közös író szál menti. A results_callback(saved, errors) minden elmentett
+    köteg után hívódik: saved = {file_path: ai_keywords}, errors = [(file_path, hibaüzenet)].
+    A lefoglalt feladatok bérletét (owner) futás közben megújítja, a végén a fel nem dolgozottakat visszaadja,
+    így több folyamat (GUI, időzített parancssori futás) is dolgozhat ugyanazon a feladatsoron.
+    """
+    def __init__(self, db_name, settings, results_callback=None, batch_size=20, flush_interval=5.0):
+        self.db_name = db_name
+        self.settings = settings
+        self.results_callback = results_callback
+        # Legfeljebb batch_size eredmény vagy flush_interval másodperc munkája veszhet el egy összeomláskor
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.engine = None
+        self._cancelled = False
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}"
+
+    def cancel(self):
+        self._cancelled = True
+        if self.engine is not None:
+            self.engine.cancel()
+
+    @diagnostics.timed("ai.jobs", rows=lambda stats: stats["jobs"])
+    def run(self):
+        """
+        Visszaad egy statisztikát: feladatok, sikeres, sikertelen, gyorsítótárból, valamint
+        "error", ha a feldolgozás el sem indulhatott.
+        """
+        stats = {"jobs": 0, "done": 0, "failed": 0, "cached": 0, "error": None}
+        db = DatabaseSession(self.db_name)
+        file_paths = db.claim_ai_jobs(self.owner)
+        stats["jobs"] = len(file_paths)
+        try:
+            self.engine = create_keyword_engine(self.settings)
+        except Exception as e:
+            # A feladatok a következő indításkor (vagy újabb kérésre) folytatódnak
+            db.release_ai_jobs(self.owner)
+            db.close()
+            stats["error"] = f"Hiba az AI inicializálása során: {e}"
+            return stats
+        if self._cancelled:
+            self.engine.cancel()
+
+        model_name = self.engine.client.model_name
+        prompt_hash = hashlib.sha256(self.settings.get("ai_prompt").encode("utf-8")).hexdigest()
+        done, failed, cache_entries = [], [], []
+        last_heartbeat = time.monotonic()
+
+        def heartbeat():
+            nonlocal last_heartbeat
+            if time.monotonic() - last_heartbeat >= AI_JOB_HEARTBEAT_S:
+                db.renew_ai_jobs(self.owner)
+                last_heartbeat = time.monotonic()
+
+        def flush():
+            if not (done or failed):
+                return
+            if db.save_ai_results(done, failed, cache_entries, prompt_hash, model_name):
+                stats["done"] += len(done)
+                stats["failed"] += len(failed)
+                if self.results_callback:
+                    self.results_callback(dict(done), list(failed))
+            done.clear()
+            failed.clear()
+            cache_entries.clear()
+
+        # Tartalom szerint csoportosítunk: az azonos képekből (másolatokból) csak egyet küldünk el.
+        # A katalógusban tárolt hash-t használjuk, ha a fájl mérete és mtime-ja azóta nem változott.
+        known_hashes = db.fetch_content_hashes(file_paths)
+        paths_by_hash = {}
+        for file_path in file_paths:
+            heartbeat()
+            try:
+                st = os.stat(file_path)
+                known = known_hashes.get(file_path)
+                if known is not None and known[1:] == (st.st_mtime_ns, st.st_size):
+                    content_hash = known[0]
+                else:
+                    content_hash = compute_content_hash(file_path)
+            except OSError as e:
+                failed.append((file_path, f"Fájl nem olvasható: {e}"))
+                continue
+            paths_by_hash.setdefault(content_hash, []).append(file_path)
+
+        cached = db.fetch_cached_keywords(paths_by_hash.keys(), prompt_hash, model_name)
+        for content_hash, ai_keywords in cached.items():
+            done.extend((file_path, ai_keywords) for file_path in paths_by_hash[content_hash])
+            stats["cached"] += len(paths_by_hash[content_hash])
+        flush()
+
+        pending = {paths[0]: content_hash for content_hash, paths in paths_by_hash.items() if content_hash not in cached}
+        results = queue.Queue()
+
+        def on_result(file_path, ai_keywords, error):
+            results.put(("result", (file_path, ai_keywords, error)))
+
+        def run_engine():
+            try:
+                results.put(("finished", self.engine.run(list(pending), on_result)))
+            except Exception as e:
+                results.put(("finished", e))
+
+        threading.Thread(target=run_engine, daemon=True).start()
+        last_flush = time.monotonic()
+        while True:
+            heartbeat()
+            try:
+                kind, item = results.get(timeout=self.flush_interval)
+            except queue.Empty:
+                flush()
+                last_flush = time.monotonic()
+                continue
+            if kind == "finished":
+                break
+            file_path, ai_keywords, error = item
+            content_hash = pending[file_path]
+            paths = paths_by_hash[content_hash]
+            if error is not None:
+                failed.extend((path, str(error)) for path in paths)
+            else:
+                done.extend((path, ai_keywords) for path in paths)
+                cache_entries.append((content_hash, ai_keywords))
+            if len(done) + len(failed) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                flush()
+                last_flush = time.monotonic()
+        flush()
+        # Megszakításkor a még el nem küldött feladatok várakozók lesznek, így bármelyik folyamat folytathatja
+        db.release_ai_jobs(self.owner)
+        db.close()
+
+        if isinstance(item, Exception):
+            stats["error"] = f"Hiba az AI kulcsszavak generálása során: {item}"
+        return stats
+# ---
+
+# --- Exportálás és tömeges műveletek ---
+EXPORT_COLUMNS = ["file_path", "ai_keywords", "used_date", "used"]
+
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+
+
+def export_format_for_path(file_path):
+    """
+    Az exportálási formátum a fájl kiterjesztéséből (ismeretlen kiterjesztésnél CSV).
+    """
+    extension = os.path.splitext(file_path)[1].lower().lstrip(".")
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension in ("parquet", "pq"):
+        return "parquet"
+    return "csv"
+
+
+class FileExporter:
+    """
+    A files tábla (vagy egy szűrés találatainak) exportálása CSV, JSONL vagy Parquet formátumba.
+    A sorokat oldalanként (keyset lapozással) olvassa és azonnal kiírja, így a memóriahasználat
+    a tábla méretétől független, és a rövid lekérdezések között más szálak is írhatnak az adatbázisba.
+    Háttérszálon futtatható (saját adatbázis-kapcsolatot nyit); a fájl ideiglenes néven készül,
+    és csak a sikeres befejezés után kapja meg a végleges nevét.
+    """
+    def __init__(self, db_name, file_path, export_format=None, query=None, chunk_size=5000, progress_callback=None,
+                 progress_interval=0.5):
+        self.db_name = db_name
+        self.file_path = file_path
+        self.export_format = export_format or export_format_for_path(file_path)
+        if self.export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Ismeretlen exportálási formátum: {self.export_format}")
+        # A fetch_files paraméterei (filter_queries, date_filter, ...); None: a teljes tábla
+        self.query = query or {}
+        self.chunk_size = chunk_size
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self._last_progress = 0.0
+        self._stop_event = threading.Event()
+
+    def cancel(self):
+        self._stop_event.set()
+
+    @diagnostics.timed("export", rows=lambda stats: stats["rows"])
+    def run(self):
+        """
+        Visszaad egy statisztikát: kiírt és összes sor, megszakítva-e. Hiba esetén kivételt dob
+        (a félkész fájl ilyenkor törlődik).
+        """
+        stats = {"rows": 0, "total": 0, "cancelled": False, "output": self.file_path}
+        writer_class = {"csv": _CsvExportWriter, "jsonl": _JsonlExportWriter, "parquet": _ParquetExportWriter}[self.export_format]
+        temp_path = self.file_path + ".part"
+        db = DatabaseSession(self.db_name)
+        try:
+            stats["total"] = db.count_files(self.query.get("filter_queries"), self.query.get("date_filter"),
+                                            self.query.get("logical_operator", "AND"))
+            self._report_progress(stats, force=True)
+            writer = writer_class(temp_path)
+            try:
+                chunk = []
+                for row in db.iter_files(page_size=self.chunk_size, **self.query):
+                    chunk.append(row)
+                    if len(chunk) >= self.chunk_size:
+                        writer.write_rows(chunk)
+                        stats["rows"] += len(chunk)
+                        chunk = []
+                        self._report_progress(stats)
+                        if self._stop_event.is_set():
+                            break
+                if chunk and not self._stop_event.is_set():
+                    writer.write_rows(chunk)
+                    stats["rows"] += len(chunk)
+            finally:
+                writer.close()
+        except BaseException:
+            _remove_quietly(temp_path)
+            raise
+        finally:
+            db.close()
+
+        if self._stop_event.is_set():
+            stats["cancelled"] = True
+            _remove_quietly(temp_path)
+        else:
+            os.replace(temp_path, self.file_path)
+        self._report_progress(stats, force=True)
+        return stats
+
+    def _report_progress(self, stats, force=False):
+        if not self.progress_callback:
+            return
+        now = time.monotonic()
+        if force or now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.progress_callback(dict(stats))
+
+
+def _remove_quietly(file_path):
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+class _CsvExportWriter:
+    def __init__(self, file_path):
+        self.file = open(file_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonlExportWriter:
+    def __init__(self, file_path):
+        self.file = open(file_path, 'w', encoding='utf-8')
+
+    def write_rows(self, rows):
+        self.file.writelines(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetExportWriter:
+    """
+    Parquet kiírás a pyarrow csomaggal (opcionális függőség); minden köteg egy külön sorcsoport.
+    """
+    def __init__(self, file_path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("A Parquet exportáláshoz telepíteni kell a pyarrow csomagot (pip install pyarrow).")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ("file_path", pyarrow.string()),
+            ("ai_keywords", pyarrow.string()),
+            ("used_date", pyarrow.string()),
+            ("used", pyarrow.int64())
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(file_path, self.schema)
+
+    def write_rows(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pyarrow.Table.from_arrays(
+            [self.pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+IMPORT_MERGE_RULES = ("update", "overwrite", "fill", "keep", "merge")
+DEFAULT_IMPORT_MERGE_RULES = {"ai_keywords": "update", "used_date": "update", "used": "update"}
+
+
+def merge_keywords(existing, imported):
+    """
+    Két vesszővel elválasztott kulcsszólista uniója, az eredeti sorrendben, ismétlődés nélkül
+    (a kulcsszótáblával azonos normalizálással, lásd normalize_keyword).
+    """
+    keywords = []
+    seen = set()
+    for value in (existing, imported):
+        for keyword in (value or "").split(","):
+            keyword = keyword.strip()
+            if keyword and normalize_keyword(keyword) not in seen:
+                seen.add(normalize_keyword(keyword))
+                keywords.append(keyword)
+    return ", ".join(keywords) if keywords else None
+
+
+class FileImporter:
+    """
+    Tömeges importálás az exportálással azonos CSV vagy JSONL formátumból. A fájlt folyamként olvassa,
+    és nagy kötegekben, INSERT ... ON CONFLICT upserttel írja az adatbázisba.
+    Oszloponkénti egyesítési szabályok (meglévő sor esetén):
+    - "update": a nem üres importált érték felülírja a meglévőt (alapértelmezés),
+    - "overwrite": az importált érték mindig felülír (az üres érték törli a meglévőt),
+    - "fill": csak az üres meglévő értéket tölti ki,
+    - "keep": a meglévő érték marad (csak az új sorok kapják meg az importált értéket),
+    - "merge": a kulcsszólisták uniója (csak az ai_keywords oszlopnál).
+    Kötegenként egy rövid tranzakció fut, így az írási zárat más (pl. a program író szála) a kötegek között
+    megkaphatja; megszakításkor a már mentett kötegek megmaradnak. Az FTS indexeket és a kulcsszótáblát
+    kötegenként halmazműveletek tartják karban (soronkénti triggerek helyett), így nincs a végén teljes újraépítés.
+    Háttérszálon futtatható (saját adatbázis-kapcsolatot nyit).
+    """
+
+    def __init__(self, db_name, file_path, import_format=None, merge_rules=None, batch_size=20000, progress_callback=None,
+                 progress_interval=0.5, max_listed_errors=100):
+        self.db_name = db_name
+        self.file_path = file_path
+        self.import_format = import_format or export_format_for_path(file_path)
+        if self.import_format not in ("csv", "jsonl"):
+            raise ValueError(f"Nem importálható formátum: {self.import_format} (csak CSV és JSONL)")
+        self.merge_rules = dict(DEFAULT_IMPORT_MERGE_RULES, **(merge_rules or {}))
+        for column, rule in self.merge_rules.items():
+            if column not in DEFAULT_IMPORT_MERGE_RULES or rule not in IMPORT_MERGE_RULES or (rule == "merge" and column != "ai_keywords"):
+                raise ValueError(f"Érvénytelen egyesítési szabály: {column}={rule}")
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.max_listed_errors = max_listed_errors
+        self._last_progress = 0.0
+        self._stop_event = threading.Event()
+
+    def cancel(self):
+        self._stop_event.set()
+
+    def build_upsert_sql(self, present_columns=None):
+        """
+        Az upsert SQL a szabályok szerint. A fájlban nem szereplő oszlopok (present_columns) a meglévő
+        soroknál változatlanok maradnak. A WHERE feltétel miatt a ténylegesen nem változó sorok nem íródnak
+        újra, így a triggerek (FTS, used_day) sem futnak le rájuk.
+        Az új sorok hiányzó used értéke a tábla alapértéke (0); a meglévő soroknál a szabályok az importált
+        (nyers, akár üres) értéket kapják, ezért ott a paraméter szerepel az excluded.used helyett.
+        """
+        rule_expressions = {
+            "update": "COALESCE({new}, files.{col})",
+            "overwrite": "{new}",
+            "fill": "COALESCE(files.{col}, {new})",
+            "keep": "files.{col}",
+            "merge": "merge_keywords(files.{col}, {new})"
+        }
+        imported_values = {"ai_keywords": "excluded.ai_keywords", "used_date": "excluded.used_date", "used": "?4"}
+        updates = [(column, rule_expressions[rule].format(col=column, new=imported_values[column]))
+                   for column, rule in self.merge_rules.items()
+                   if rule != "keep" and (present_columns is None or column in present_columns)]
+        sql = ("INSERT INTO files (file_path, ai_keywords, used_date, used) VALUES (?1, ?2, ?3, COALESCE(?4, 0)) "
+               "ON CONFLICT (file_path) DO ")
+        if not updates:
+            return sql + "NOTHING"
+        return (sql + "UPDATE SET " + ", ".join(f"{column} = {expr}" for column, expr in updates)
+                + " WHERE " + " OR ".join(f"files.{column} IS NOT {expr}" for column, expr in updates))
+
+    @diagnostics.timed("import", rows=lambda stats: stats["rows"])
+    def run(self):
+        """
+        Visszaad egy statisztikát: beolvasott, új, frissített, változatlan és hibás sorok, hibaüzenetek,
+        megszakítva-e. Olvasási vagy adatbázis-hibánál kivételt dob (az addig mentett kötegek megmaradnak).
+        """
+        stats = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "errors": [], "cancelled": False}
+        db = DatabaseManager(self.db_name)
+        db.conn.create_function("merge_keywords", 2, merge_keywords, deterministic=True)
+        # Tömeges íráshoz nagyobb lapgyorsítótár; a kapcsolat a végén bezárul, így másra nem hat
+        db.cursor.execute("PRAGMA cache_size = -131072")
+        # A köteg útvonalai és a mentés előtti állapotuk (az indexek karbantartásához)
+        db.cursor.execute("CREATE TEMP TABLE import_batch (file_path TEXT PRIMARY KEY, old_rowid INTEGER, old_keywords TEXT)")
+        try:
+            with open(self.file_path, 'r', newline='', encoding='utf-8-sig') as f:
+                if self.import_format == "csv":
+                    reader = csv.DictReader(f)
+                    if "file_path" not in (reader.fieldnames or []):
+                        raise ValueError("A CSV fejlécéből hiányzik a file_path oszlop.")
+                    upsert_sql = self.build_upsert_sql(reader.fieldnames)
+                    records = enumerate(reader, start=2)
+                else:
+                    upsert_sql = self.build_upsert_sql()
+                    records = self._read_jsonl(f)
+                batch = []
+                for line_number, record in records:
+                    stats["rows"] += 1
+                    try:
+                        batch.append(self._parse_record(record))
+                    except ValueError as e:
+                        stats["skipped"] += 1
+                        self._add_error(stats, f"{line_number}. sor: {e}")
+                        continue
+                    if len(batch) >= self.batch_size:
+                        self._write_batch(db, upsert_sql, batch, stats)
+                        batch = []
+                        self._report_progress(stats)
+                        if self._stop_event.is_set():
+                            break
+                if batch and not self._stop_event.is_set():
+                    self._write_batch(db, upsert_sql, batch, stats)
+        finally:
+            db.close()
+        stats["cancelled"] = self._stop_event.is_set()
+        self._report_progress(stats, force=True)
+        return stats
+
+    def _read_jsonl(self, f):
+        """ (sorszám, dict) párok; az üres sorokat kihagyja. """
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record = e
+            if not isinstance(record, dict):
+                # A hibás sort a _parse_record jelzi, így a sorszámozás egységes marad
+                record = {"__error__": f"érvénytelen JSON objektum ({record})"}
+            yield line_number, record
+
+    def _parse_record(self, record):
+        """
+        Egy beolvasott sor (dict) -> (file_path, ai_keywords, used_date, used) a files tábla formátumában.
+        Hibás értéknél ValueError-t dob. JSONL-ben a hiányzó kulcs üres értéknek számít.
+        """
+        if "__error__" in record:
+            raise ValueError(record["__error__"])
+        file_path = (record.get("file_path") or "").strip()
+        if not file_path:
+            raise ValueError("hiányzó file_path")
+
+        ai_keywords = record.get("ai_keywords")
+        if isinstance(ai_keywords, list):
+            ai_keywords = ", ".join(str(keyword) for keyword in ai_keywords)
+        if ai_keywords is not None:
+            ai_keywords = str(ai_keywords).strip() or None
+
+        used_date = record.get("used_date")
+        if used_date is not None:
+            used_date = str(used_date).strip() or None
+        if used_date is not None:
+            try:
+                datetime.strptime(used_date, "%Y.%m.%d")
+            except ValueError:
+                raise ValueError(f"érvénytelen dátum: {used_date} (ÉÉÉÉ.HH.NN formátum kell)")
+
+        used = record.get("used")
+        if isinstance(used, str):
+            used = used.strip().lower()
+            if used in ("", "none", "null"):
+                used = None
+            elif used in ("1", "igen", "true", "yes"):
+                used = 1
+            elif used in ("0", "nem", "false", "no"):
+                used = 0
+            else:
+                raise ValueError(f"érvénytelen used érték: {used}")
+        elif used is not None:
+            used = 1 if used else 0
+        return file_path, ai_keywords, used_date, used
+
+    def _write_batch(self, db, upsert_sql, batch, stats):
+        """
+        Egy köteg mentése saját, rövid tranzakcióban. A tranzakción belül az FTS és a kulcsszótábla triggerei
+        ki vannak kapcsolva (eldobva), a köteg módosításait helyettük a _reindex_batch vezeti át; a véglegesítés
+        előtt a triggerek visszakerülnek, így más kapcsolatok a hiányukat sosem látják.
+        Adatbázis-hiba esetén kivételt dob (a köteg visszavonódik).
+        """
+        try:
+            db.cursor.execute("BEGIN IMMEDIATE")
+            db.cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'files' "
+                              "AND (name GLOB 'files_fts_*' OR name GLOB 'files_path_fts_*' OR name GLOB 'files_keywords_*')")
+            triggers = db.cursor.fetchall()
+            for name, _ in triggers:
+                db.cursor.execute(f"DROP TRIGGER {name}")
+            db.cursor.execute("DELETE FROM temp.import_batch")
+            db.cursor.executemany("INSERT OR IGNORE INTO temp.import_batch (file_path) VALUES (?)", [row[:1] for row in batch])
+            db.cursor.execute("UPDATE temp.import_batch SET (old_rowid, old_keywords) = "
+                              "(SELECT rowid, ai_keywords FROM files WHERE files.file_path = import_batch.file_path)")
+            db.cursor.executemany(upsert_sql, batch)
+            changed = db.cursor.rowcount
+            db.cursor.execute("SELECT COUNT(*) FROM temp.import_batch WHERE old_rowid IS NULL")
+            inserted = db.cursor.fetchone()[0]
+            self._reindex_batch(db, {name.rsplit("_", 1)[0] for name, _ in triggers})
+            for _, sql in triggers:
+                db.cursor.execute(sql)
+        except sqlite3.Error:
+            db.conn.rollback()
+            raise
+        db.conn.commit()
+        DATA_VERSION.bump()
+        stats["inserted"] += inserted
+        stats["updated"] += changed - inserted
+        stats["unchanged"] += len(batch) - changed
+
+    def _reindex_batch(self, db, indexes):
+        """
+        A köteg új és módosult kulcsszavú sorainak átvezetése a kikapcsolt triggerekkel azonos eredménnyel
+        a megadott indexekbe (files_fts, files_path_fts, files_keywords), halmazműveletekkel.
+        A temp.import_batch a köteg útvonalait és a mentés előtti állapotukat tartalmazza.
+        """
+        db.cursor.execute("DROP TABLE IF EXISTS temp.import_changes")
+        db.cursor.execute("CREATE TEMP TABLE import_changes AS "
+                          "SELECT files.rowid AS file_rowid, files.file_path, files.ai_keywords, import_batch.old_rowid, "
+                          "import_batch.old_keywords FROM temp.import_batch JOIN files ON files.file_path = import_batch.file_path "
+                          "WHERE import_batch.old_rowid IS NULL OR import_batch.old_keywords IS NOT files.ai_keywords")
+        if "files_fts" in indexes:
+            db.cursor.execute("INSERT INTO files_fts (files_fts, rowid, ai_keywords) "
+                              "SELECT 'delete', old_rowid, old_keywords FROM temp.import_changes WHERE old_rowid IS NOT NULL")
+            db.cursor.execute("INSERT INTO files_fts (rowid, ai_keywords) SELECT file_rowid, ai_keywords FROM temp.import_changes")
+        if "files_path_fts" in indexes:
+            # Az upsert az útvonalat nem módosítja, csak az új sorokat kell felvenni
+            db.cursor.execute("INSERT INTO files_path_fts (rowid, file_path) "
+                              "SELECT file_rowid, file_path FROM temp.import_changes WHERE old_rowid IS NULL")
+        if "files_keywords" in indexes:
+            # Kulcsszavanként a képszám változása: a régi kapcsolatok levonva, az újak hozzáadva
+            db.cursor.execute("DROP TABLE IF EXISTS temp.keyword_delta")
+            db.cursor.execute("CREATE TEMP TABLE keyword_delta (keyword_id INTEGER PRIMARY KEY, delta INTEGER NOT NULL)")
+            db.cursor.execute("INSERT INTO temp.keyword_delta SELECT keyword_id, -COUNT(*) FROM file_keywords "
+                              "WHERE file_rowid IN (SELECT old_rowid FROM temp.import_changes) GROUP BY keyword_id")
+            db.cursor.execute("DELETE FROM file_keywords WHERE file_rowid IN (SELECT old_rowid FROM temp.import_changes)")
+            db.cursor.execute("DROP TABLE IF EXISTS temp.keyword_split")
+            db.cursor.execute(f"CREATE TEMP TABLE keyword_split AS "
+                              f"{keyword_split_sql('ai_keywords', 'file_rowid', 'FROM temp.import_changes WHERE ai_keywords IS NOT NULL')}"
+                              f"SELECT DISTINCT file_rowid, keyword FROM split WHERE keyword <> ''")
+            db.cursor.execute("INSERT OR IGNORE INTO keywords (keyword) SELECT DISTINCT keyword FROM temp.keyword_split")
+            db.cursor.execute("INSERT OR IGNORE INTO file_keywords (keyword_id, file_rowid) "
+                              "SELECT keywords.keyword_id, keyword_split.file_rowid FROM temp.keyword_split JOIN keywords USING (keyword)")
+            db.cursor.execute("INSERT INTO temp.keyword_delta SELECT keywords.keyword_id, COUNT(*) FROM temp.keyword_split "
+                              "JOIN keywords USING (keyword) WHERE true GROUP BY keywords.keyword_id "
+                              "ON CONFLICT (keyword_id) DO UPDATE SET delta = delta + excluded.delta")
+            db.cursor.execute("UPDATE keywords SET file_count = file_count + "
+                              "(SELECT delta FROM temp.keyword_delta WHERE keyword_delta.keyword_id = keywords.keyword_id) "
+                              "WHERE keyword_id IN (SELECT keyword_id FROM temp.keyword_delta)")
+            db.cursor.execute("DROP TABLE temp.keyword_split")
+            db.cursor.execute("DROP TABLE temp.keyword_delta")
+        db.cursor.execute("DROP TABLE temp.import_changes")
+
+    def _add_error(self, stats, message):
+        if len(stats["errors"]) < self.max_listed_errors:
+            stats["errors"].append(message)
+
+    def _report_progress(self, stats, force=False):
+        if not self.progress_callback:
+            return
+        now = time.monotonic()
+        if force or now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.progress_callback(dict(stats, errors=len(stats["errors"])))
+
+
+def mark_used(db, file_paths, used=True, used_date=None):
+    """
+    A fájlok "Felhasználva" állapotának beállítása (Igen esetén alapból a mai dátummal).
+    Visszaadja az update_records (sikeres darab, hibák) eredményét.
+    """
+    if used and used_date is None:
+        used_date = datetime.now().strftime("%Y.%m.%d")
+    changes = {file_path: {"used": 1 if used else 0, "used_date": used_date if used else None} for file_path in file_paths}
+    return db.update_records(changes)
+# ---